@@ -5,7 +5,7 @@ import logging
 from flask import Flask, jsonify
 
 from .config import Config
-from .database import close_db
+from .database import close_db, init_pools
 
 # Configure structured logging for the entire app
 logging.basicConfig(
@@ -22,18 +22,6 @@ def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
-    # Trust proxy headers if we're behind a reverse proxy
-    proxy_count = Config.TRUSTED_PROXY_COUNT
-    if proxy_count > 0:
-        from werkzeug.middleware.proxy_fix import ProxyFix
-        app.wsgi_app = ProxyFix(
-            app.wsgi_app,
-            x_for=proxy_count,
-            x_proto=proxy_count,
-            x_host=proxy_count,
-            x_prefix=proxy_count
-        )
-
     app.teardown_appcontext(close_db)
 
     # ── CORS ─────────────────────────────────────────────────────────────
@@ -109,17 +97,49 @@ def create_app():
         log.exception("Unhandled 500 error")
         return jsonify({'error': 'Internal server error'}), 500
 
-    # ── Start Background Sync ────────────────────────────────────────────
-    # Use before_request to start the sync worker AFTER Gunicorn has forked.
+    # ── Start Background Workers ─────────────────────────────────────────
+    # Use before_request to start the workers AFTER Gunicorn has forked.
     # Threads created before fork() are NOT inherited by child workers.
     from .services.sync import start_sync_worker
-    _sync_started = False
-
-    @app.before_request
-    def _ensure_sync_worker():
-        nonlocal _sync_started
-        if not _sync_started:
-            _sync_started = True
+    from .services.executor import start_executor
+    from .services.ingest import start_ingest_worker
+    from .services.geo import start_geo_enricher
+    from .services.webhooks import start_webhook_worker
+    from .services.maintenance import start_maintenance
+    _workers_started = False
+
+    def _ensure_background_workers():
+        nonlocal _workers_started
+        if not _workers_started:
+            _workers_started = True
+            init_pools()
+            start_executor(app)
             start_sync_worker(app)
+            start_ingest_worker(app)
+            start_geo_enricher(app)
+            start_webhook_worker(app)
+            start_maintenance(app)
+
+    app.before_request(_ensure_background_workers)
+
+    # ── Pixel fast path ──────────────────────────────────────────────────
+    # Serves /track, /pixel and /t/<id> before Flask dispatch (no routing,
+    # hooks or dashboard security headers on a 68-byte PNG).
+    if Config.PIXEL_FAST_PATH:
+        from .middleware import PixelFastPath
+        app.wsgi_app = PixelFastPath(app, app.wsgi_app, _ensure_background_workers)
+
+    # Trust proxy headers if we're behind a reverse proxy.
+    # Installed last so it also fixes up the environ seen by the fast path.
+    proxy_count = Config.TRUSTED_PROXY_COUNT
+    if proxy_count > 0:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(
+            app.wsgi_app,
+            x_for=proxy_count,
+            x_proto=proxy_count,
+            x_host=proxy_count,
+            x_prefix=proxy_count
+        )
 
     return app
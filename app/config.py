@@ -34,6 +34,31 @@ class Config:
     DATABASE_URL = os.getenv('DATABASE_URL')  # Railway / Render inject this
     DB_FILE = os.getenv('DB_FILE', 'tracking.db')  # SQLite fallback
 
+    # PostgreSQL: separate pools so dashboard / export queries cannot starve ingest
+    PG_INGEST_POOL_MIN = int(os.getenv('PG_INGEST_POOL_MIN', 1))
+    PG_INGEST_POOL_MAX = int(os.getenv('PG_INGEST_POOL_MAX', 10))
+    PG_ANALYTICS_POOL_MIN = int(os.getenv('PG_ANALYTICS_POOL_MIN', 1))
+    PG_ANALYTICS_POOL_MAX = int(os.getenv('PG_ANALYTICS_POOL_MAX', 4))
+    PG_POOL_TIMEOUT = float(os.getenv('PG_POOL_TIMEOUT', 5))              # seconds to wait for a connection
+    PG_CONN_MAX_AGE = float(os.getenv('PG_CONN_MAX_AGE', 1800))           # seconds before a connection is recycled
+    PG_HEALTHCHECK_IDLE = float(os.getenv('PG_HEALTHCHECK_IDLE', 30))     # ping connections idle longer than this
+    # SQLite: one persistent, pre-tuned connection per thread (false = connect per request)
+    SQLITE_POOL = os.getenv('SQLITE_POOL', 'true').lower() == 'true'
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -16000))          # pages, or KiB if negative
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # bytes
+    SQLITE_TEMP_STORE = os.getenv('SQLITE_TEMP_STORE', 'MEMORY')
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))        # ms
+    SQLITE_CACHED_STATEMENTS = int(os.getenv('SQLITE_CACHED_STATEMENTS', 256))
+    # open_events / clicks are partitioned by month (see app/services/partitions.py)
+    EVENT_RETENTION_MONTHS = int(os.getenv('EVENT_RETENTION_MONTHS', 0))             # 0 = keep forever
+    PARTITION_PREMAKE_MONTHS = int(os.getenv('PARTITION_PREMAKE_MONTHS', 2))         # months created ahead
+    PARTITION_MAINTENANCE_INTERVAL = float(os.getenv('PARTITION_MAINTENANCE_INTERVAL', 3600))   # seconds
+    # Raw events older than this many days are deleted; analytics read the rollup counters (0 = never)
+    EVENT_ROLLUP_DAYS = int(os.getenv('EVENT_ROLLUP_DAYS', 0))
+    EVENT_ROLLUP_CHUNK = int(os.getenv('EVENT_ROLLUP_CHUNK', 500))                   # rows per transaction
+    EVENT_ROLLUP_INTERVAL = float(os.getenv('EVENT_ROLLUP_INTERVAL', 3600))          # seconds
+
     # Security
     SECRET_KEY = os.getenv('SECRET_KEY')
     API_KEY = os.getenv('API_KEY')
@@ -69,14 +94,84 @@ class Config:
     # Webhooks
     WEBHOOK_URL = os.getenv('WEBHOOK_URL', None)
     WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', None)
+    # Events are staged in webhook_outbox and delivered by a background worker.
+    # BATCH_SIZE > 1 switches the body to {"event": "batch", "events": [...]}
+    WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', 1))
+    WEBHOOK_MAX_INFLIGHT = int(os.getenv('WEBHOOK_MAX_INFLIGHT', 4))
+    WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', 5))               # seconds
+    WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 12))
+    WEBHOOK_RETRY_BASE = float(os.getenv('WEBHOOK_RETRY_BASE', 2))         # seconds, doubled per attempt
+    WEBHOOK_RETRY_MAX = float(os.getenv('WEBHOOK_RETRY_MAX', 3600))        # seconds
+    WEBHOOK_POLL_INTERVAL = float(os.getenv('WEBHOOK_POLL_INTERVAL', 1.0)) # seconds
+
+    # Extra CIDR prefixes (CIDR KIND LABEL per line) for the network classifier
+    NETCLASS_FILE = os.getenv('NETCLASS_FILE', '')
+
+    # 'remote' queries GEO_API_URL; 'offline' answers from a local range DB
+    # compiled with `manage.py compile_geo` (no network on the ingest path)
+    GEO_PROVIDER = os.getenv('GEO_PROVIDER', 'remote').lower()
+    GEO_OFFLINE_DB = os.getenv('GEO_OFFLINE_DB', 'geo.bin')
 
     # Geo API URL
     GEO_API_URL = os.getenv('GEO_API_URL', 'http://ip-api.com/json')
     GEO_CACHE_MINUTES = int(os.getenv('GEO_CACHE_MINUTES', 60))
+    # Expired geo_cache rows are purged by the maintenance scheduler
+    GEO_CACHE_PURGE_INTERVAL = float(os.getenv('GEO_CACHE_PURGE_INTERVAL', 300))   # seconds
+    GEO_CACHE_PURGE_CHUNK = int(os.getenv('GEO_CACHE_PURGE_CHUNK', 500))
+    # Per-process LRU in front of geo_cache; failed lookups are cached briefly
+    GEO_MEMORY_CACHE_SIZE = int(os.getenv('GEO_MEMORY_CACHE_SIZE', 10000))
+    GEO_NEGATIVE_CACHE_SECONDS = int(os.getenv('GEO_NEGATIVE_CACHE_SECONDS', 60))
+    # Remote misses arriving within the window share one batch request (0 = off)
+    GEO_BATCH_URL = os.getenv('GEO_BATCH_URL', 'http://ip-api.com/batch')
+    GEO_BATCH_WINDOW_MS = int(os.getenv('GEO_BATCH_WINDOW_MS', 20))
+    GEO_BATCH_SIZE = int(os.getenv('GEO_BATCH_SIZE', 100))       # ip-api.com maximum
+    # 'inline' resolves geo inside the request; 'deferred' stores a 'Pending'
+    # placeholder and back-fills tracks/open_events/clicks from a background worker
+    GEO_ENRICH_MODE = os.getenv('GEO_ENRICH_MODE', 'inline').lower()
+    GEO_ENRICH_QUEUE_SIZE = int(os.getenv('GEO_ENRICH_QUEUE_SIZE', 10000))
+    GEO_ENRICH_SWEEP_INTERVAL = float(os.getenv('GEO_ENRICH_SWEEP_INTERVAL', 30))   # seconds
+    GEO_ENRICH_MAX_ATTEMPTS = int(os.getenv('GEO_ENRICH_MAX_ATTEMPTS', 8))
 
     # Rate limiting
     RATE_LIMIT_PER_MINUTE = int(os.getenv('RATE_LIMIT_PER_MINUTE', 30))
     API_RATE_LIMIT_PER_MINUTE = int(os.getenv('API_RATE_LIMIT_PER_MINUTE', 60))
+    # 'memory' counts per worker process; 'shared' keeps the counters in a
+    # memory-mapped file so all workers on the host enforce one limit
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+    RATE_LIMIT_SHM_PATH = os.getenv('RATE_LIMIT_SHM_PATH', '/tmp/naarad-ratelimit.bin')
+    RATE_LIMIT_SHM_SLOTS = int(os.getenv('RATE_LIMIT_SHM_SLOTS', 65536))
+
+    # ── Event Ingest ─────────────────────────────────────────────────────
+    # 'sync' writes every hit inside the request; 'buffered' enqueues it for a
+    # background flusher that commits in batches (write-behind).
+    INGEST_MODE = os.getenv('INGEST_MODE', 'sync').lower()
+    INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 200))
+    INGEST_FLUSH_INTERVAL = float(os.getenv('INGEST_FLUSH_INTERVAL', 0.5))   # seconds
+    INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 10000))
+    # How long a request waits for buffer space before writing inline itself
+    INGEST_ENQUEUE_TIMEOUT = float(os.getenv('INGEST_ENQUEUE_TIMEOUT', 0.05))
+    # Opened tracks whose forward-detection state is kept in memory (0 = off)
+    TRACK_CACHE_SIZE = int(os.getenv('TRACK_CACHE_SIZE', 10000))
+    # Interned UA / geo / header dimension ids kept in memory, per dimension
+    DIM_CACHE_SIZE = int(os.getenv('DIM_CACHE_SIZE', 50000))
+    # /api/stats snapshot reused for this long before the data version is re-checked (0 = off)
+    STATS_CACHE_SECONDS = float(os.getenv('STATS_CACHE_SECONDS', 10))
+
+    # Answer /track, /pixel and /t/<id> from a WSGI middleware before Flask
+    # dispatch (prebuilt response, no request hooks). See app/middleware.py
+    PIXEL_FAST_PATH = os.getenv('PIXEL_FAST_PATH', 'false').lower() == 'true'
+
+    # Distinct User-Agent strings memoised by the UA parser
+    UA_CACHE_SIZE = int(os.getenv('UA_CACHE_SIZE', 4096))
+
+    # Registered short links (/l/<track_id>/<link_id>) kept in the in-memory index
+    LINK_CACHE_SIZE = int(os.getenv('LINK_CACHE_SIZE', 10000))
+
+    # ── Background Executor ──────────────────────────────────────────────
+    # Shared worker pool for background enrichment; each task type gets
+    # its own bounded queue and tasks are dropped (and counted) when it is full
+    BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', 4))
+    BACKGROUND_QUEUE_SIZE = int(os.getenv('BACKGROUND_QUEUE_SIZE', 1000))
 
     # ── Node Sync (Hybrid Architecture) ──────────────────────────────────
     SYNC_REMOTE_URL = os.getenv('SYNC_REMOTE_URL')
@@ -6,48 +6,26 @@ All /api/* endpoints. Auth is required by default (REQUIRE_AUTH=true).
 import io
 import csv
 import logging
-import threading
-from collections import defaultdict
 from functools import wraps
-from time import time
 from flask import Blueprint, request, jsonify, Response, abort, stream_with_context
 from ..database import get_db, get_cursor, placeholder, USE_POSTGRES
 from ..config import Config
-from ..utils import sanitize_id, now_iso, safe_str_compare
+from ..utils import sanitize_id, now, to_ms, iso_to_ms, safe_str_compare
+from ..services.ratelimit import is_rate_limited
+from ..services.ingest import forget_track
+from ..services.partitions import event_tables
+from ..services.rollups import delete_rollups, timelines
+from ..services.stats import bump_data_version, cached_stats
 
 log = logging.getLogger(__name__)
 
 bp_api = Blueprint('api', __name__, url_prefix='/api')
 
-# ── API Rate Limiter (thread-safe) ────────────────────────────────────
-_api_rate_lock = threading.Lock()
-_api_rate_buckets: dict = defaultdict(list)
-_api_rate_last_evict: float = 0.0
-
+# ── API Rate Limiter ──────────────────────────────────────────────────
 
 def _is_api_rate_limited(ip: str) -> bool:
     """Return True if this IP has exceeded API_RATE_LIMIT_PER_MINUTE."""
-    global _api_rate_last_evict
-    limit = Config.API_RATE_LIMIT_PER_MINUTE
-    if not limit:
-        return False
-    now_ts = time()
-    window = 60.0
-
-    with _api_rate_lock:
-        hits = _api_rate_buckets[ip]
-        hits[:] = [t for t in hits if now_ts - t < window]
-        if len(hits) >= limit:
-            return True
-        hits.append(now_ts)
-        # Periodic eviction
-        if now_ts - _api_rate_last_evict > 300.0:
-            _api_rate_last_evict = now_ts
-            stale = [k for k, v in _api_rate_buckets.items() if not v or (now_ts - v[-1]) > window]
-            for k in stale:
-                del _api_rate_buckets[k]
-
-    return False
+    return is_rate_limited('api', ip, Config.API_RATE_LIMIT_PER_MINUTE)
 
 
 def require_api_key(f):
@@ -73,11 +51,12 @@ def require_api_key(f):
 @bp_api.route('/stats')
 @require_api_key
 def stats():
-    """Get aggregate statistics."""
-    P = placeholder()
-    conn = get_db()
-    cursor = get_cursor(conn)
+    """Get aggregate statistics (cached until tracks change, see services/stats.py)."""
+    cursor = get_cursor(get_db())
+    return jsonify(cached_stats(cursor, lambda: _compute_stats(cursor)))
 
+
+def _compute_stats(cursor):
     cursor.execute(
         'SELECT COUNT(*) as total, SUM(open_count) as opens, SUM(click_count) as clicks FROM tracks'
     )
@@ -112,7 +91,7 @@ def stats():
     opens = basic['opens'] or 0
     clicks = basic['clicks'] or 0
 
-    return jsonify({
+    return {
         'summary': {
             'total_unique':  total,
             'total_opens':   opens,
@@ -122,13 +101,13 @@ def stats():
         'geographic': countries,
         'devices':    devices,
         'browsers':   browsers,
-    })
+    }
 
 
 # Select specific columns for list endpoint instead of SELECT *
 _TRACKS_LIST_COLUMNS = (
     'track_id, label, country, city, device_type, os, isp, org, '
-    'open_count, click_count, first_seen, last_seen, browser'
+    'open_count, click_count, first_seen, last_seen, browser, first_seen_ms, last_seen_ms'
 )
 
 
@@ -149,7 +128,7 @@ def tracks():
         cursor.execute(f'''
             SELECT {_TRACKS_LIST_COLUMNS} FROM tracks
             WHERE track_id LIKE {P} OR label LIKE {P} OR recipient LIKE {P} OR subject LIKE {P}
-            ORDER BY last_seen DESC LIMIT {P} OFFSET {P}
+            ORDER BY last_seen_ms DESC LIMIT {P} OFFSET {P}
         ''', (pattern, pattern, pattern, pattern, limit, offset))
         items = [dict(r) if hasattr(r, 'keys') else dict(r) for r in cursor.fetchall()]
 
@@ -159,7 +138,7 @@ def tracks():
         ''', (pattern, pattern, pattern, pattern))
     else:
         cursor.execute(
-            f'SELECT {_TRACKS_LIST_COLUMNS} FROM tracks ORDER BY last_seen DESC LIMIT {P} OFFSET {P}',
+            f'SELECT {_TRACKS_LIST_COLUMNS} FROM tracks ORDER BY last_seen_ms DESC LIMIT {P} OFFSET {P}',
             (limit, offset)
         )
         items = [dict(r) if hasattr(r, 'keys') else dict(r) for r in cursor.fetchall()]
@@ -170,7 +149,7 @@ def tracks():
 
     # Convert SQLite integer booleans to Python booleans for consistent JSON
     for item in items:
-        for bool_col in ('is_mobile', 'is_bot'):
+        for bool_col in ('is_mobile', 'is_bot', 'is_proxy'):
             if bool_col in item and item[bool_col] is not None:
                 item[bool_col] = bool(item[bool_col])
 
@@ -208,16 +187,20 @@ def create_track():
     if cursor.fetchone():
         return jsonify({'error': 'Track ID already exists'}), 400
 
-    timestamp    = now_iso()
+    created      = now()
+    timestamp    = created.isoformat()
+    created_ms   = to_ms(created)
     cols         = ['timestamp', 'track_id', 'label', 'sender', 'recipient', 'subject', 'sent_at',
-                    'first_seen', 'last_seen', 'open_count', 'click_count']
+                    'first_seen', 'last_seen', 'first_seen_ms', 'last_seen_ms',
+                    'open_count', 'click_count']
     placeholders = ', '.join([P] * len(cols))
     cursor.execute(
         f"INSERT INTO tracks ({', '.join(cols)}) VALUES ({placeholders})",
         (timestamp, track_id, label, sender, recipient, subject, sent_at,
-         timestamp, timestamp, 0, 0)
+         timestamp, timestamp, created_ms, created_ms, 0, 0)
     )
     conn.commit()
+    bump_data_version(conn, cursor)
 
     # Build pixel URL with embedded metadata so track_open() captures it
     base_url = request.host_url.rstrip('/')
@@ -241,6 +224,38 @@ def create_track():
     })
 
 
+@bp_api.route('/links', methods=['POST'])
+@require_api_key
+def register_links():
+    """Register click targets and return short link IDs.
+
+    Body: {"url": "..."} or {"urls": ["...", ...]} (max 500). Use the IDs as
+    /l/<track_id>/<link_id> in emails instead of /click/<track_id>/<url>.
+    """
+    from ..services.links import register_link
+    data = request.json or {}
+    urls = data.get('urls') or ([data['url']] if data.get('url') else [])
+    if not isinstance(urls, list) or not urls:
+        return jsonify({'error': 'Provide "url" or a list of "urls"'}), 400
+    if len(urls) > 500:
+        return jsonify({'error': 'At most 500 URLs per request'}), 400
+
+    P = placeholder()
+    conn   = get_db()
+    cursor = get_cursor(conn)
+    links, invalid = [], []
+    for url in urls:
+        link_id = register_link(cursor, P, str(url)) if url else None
+        if link_id:
+            links.append({'url': url, 'link_id': link_id})
+        else:
+            invalid.append(url)
+    conn.commit()
+
+    status = 201 if links else 400
+    return jsonify({'links': links, 'invalid': invalid}), status
+
+
 @bp_api.route('/track/<track_id>', methods=['PUT'])
 @require_api_key
 def update_track(track_id):
@@ -259,6 +274,7 @@ def update_track(track_id):
 
     cursor.execute(f'UPDATE tracks SET label = {P} WHERE track_id = {P}', (label, track_id))
     conn.commit()
+    forget_track(track_id)
     return jsonify({'success': True})
 
 
@@ -273,8 +289,12 @@ def delete_track(track_id):
 
     cursor.execute(f'DELETE FROM tracks WHERE track_id = {P}', (track_id,))
     tracks_deleted = cursor.rowcount if hasattr(cursor, 'rowcount') else 0
-    cursor.execute(f'DELETE FROM clicks WHERE track_id = {P}', (track_id,))
+    for table in event_tables(cursor, 'clicks'):
+        cursor.execute(f'DELETE FROM {table} WHERE track_id = {P}', (track_id,))
+    delete_rollups(cursor, P, track_id)
     conn.commit()
+    bump_data_version(conn, cursor)
+    forget_track(track_id)
 
     if tracks_deleted == 0:
         return jsonify({'error': 'Not found'}), 404
@@ -298,18 +318,18 @@ def track_detail(track_id):
         return jsonify({'error': 'Not found'}), 404
 
     track_dict = dict(track) if hasattr(track, 'keys') else dict(track)
-    for bool_col in ('is_mobile', 'is_bot'):
+    for bool_col in ('is_mobile', 'is_bot', 'is_proxy'):
         if bool_col in track_dict and track_dict[bool_col] is not None:
             track_dict[bool_col] = bool(track_dict[bool_col])
 
     cursor.execute(
-        f'SELECT * FROM clicks WHERE track_id = {P} ORDER BY timestamp DESC', (track_id,)
+        f'SELECT * FROM clicks_v WHERE track_id = {P} ORDER BY unix_ms DESC', (track_id,)
     )
     clicks = [dict(r) if hasattr(r, 'keys') else dict(r) for r in cursor.fetchall()]
 
     # Fetch open events timeline (each individual open with its own data)
     cursor.execute(
-        f'SELECT * FROM open_events WHERE track_id = {P} ORDER BY timestamp DESC', (track_id,)
+        f'SELECT * FROM open_events_v WHERE track_id = {P} ORDER BY unix_ms DESC', (track_id,)
     )
     opens = [dict(r) if hasattr(r, 'keys') else dict(r) for r in cursor.fetchall()]
 
@@ -325,6 +345,22 @@ def track_detail(track_id):
     })
 
 
+@bp_api.route('/campaign/<campaign_id>')
+@require_api_key
+def campaign_stats(campaign_id):
+    """Opens / clicks per day of one campaign, from the rollup counters."""
+    P = placeholder()
+    cursor = get_cursor(get_db())
+    daily = timelines(cursor, P, 'campaign_id', campaign_id)
+    return jsonify({
+        'campaign_id':     campaign_id,
+        'total_opens':     sum(d['count'] for d in daily['open']),
+        'total_clicks':    sum(d['count'] for d in daily['click']),
+        'opens_timeline':  daily['open'],
+        'clicks_timeline': daily['click'],
+    })
+
+
 @bp_api.route('/export')
 @require_api_key
 def export():
@@ -336,7 +372,7 @@ def export():
 
     if fmt == 'csv':
         # Get column names from cursor.description without an extra query
-        cursor.execute('SELECT * FROM tracks ORDER BY timestamp DESC LIMIT 0')
+        cursor.execute('SELECT * FROM tracks LIMIT 0')
         if cursor.description:
             fieldnames = [desc[0] for desc in cursor.description]
         else:
@@ -353,7 +389,7 @@ def export():
 
             # Query all rows and stream them
             inner_cursor = get_cursor(conn)
-            inner_cursor.execute('SELECT * FROM tracks ORDER BY timestamp DESC')
+            inner_cursor.execute('SELECT * FROM tracks ORDER BY first_seen_ms DESC')
             batch_size = 100
             while True:
                 rows = inner_cursor.fetchmany(batch_size)
@@ -373,7 +409,7 @@ def export():
         )
 
     # JSON format
-    cursor.execute('SELECT * FROM tracks ORDER BY timestamp DESC')
+    cursor.execute('SELECT * FROM tracks ORDER BY first_seen_ms DESC')
     items = [dict(r) if hasattr(r, 'keys') else dict(r) for r in cursor.fetchall()]
     return jsonify({'tracks': items})
 
@@ -395,6 +431,35 @@ def health():
         return jsonify({'status': 'unhealthy', 'database': 'error'}), 503
 
 
+@bp_api.route('/metrics')
+@require_api_key
+def metrics():
+    """Internal counters of the background machinery (queues, workers)."""
+    from ..services.executor import executor_stats
+    from ..services.ingest import ingest_stats, track_cache_stats
+    from ..services.dims import dim_cache_stats
+    from ..services.webhooks import outbox_stats
+    from ..services.links import link_cache_stats
+    from ..services.ua import ua_cache_stats
+    from ..services.geo import geo_cache_stats
+    from ..services.maintenance import maintenance_stats
+    from ..services.stats import stats_cache_stats
+    from ..database import pool_stats
+    return jsonify({
+        'geo_cache':  geo_cache_stats(),
+        'links':      link_cache_stats(),
+        'ua_cache':   ua_cache_stats(),
+        'background': executor_stats(),
+        'ingest':     ingest_stats(),
+        'track_cache': track_cache_stats(),
+        'dims':       dim_cache_stats(),
+        'webhooks':   outbox_stats(),
+        'maintenance': maintenance_stats(),
+        'stats_cache': stats_cache_stats(),
+        'db_pools':   pool_stats(),
+    })
+
+
 # ── Node Sync (Hybrid Architecture) ──────────────────────────────────────────
 
 @bp_api.route('/sync/status', methods=['GET'])
@@ -410,17 +475,25 @@ def sync_status():
 @bp_api.route('/sync', methods=['GET'])
 @require_api_key
 def get_sync_data():
-    """Export tracks and clicks that happened after a given timestamp."""
+    """Export tracks and clicks that happened after a given timestamp.
+
+    ``since`` is ISO 8601 or epoch milliseconds; rows are compared on the
+    integer last_seen_ms / unix_ms columns.
+    """
     P = placeholder()
-    since = request.args.get('since', '1970-01-01T00:00:00Z')
+    since_ms = iso_to_ms(request.args.get('since', '0'))
+    if since_ms is None:
+        return jsonify({'error': 'Invalid timestamp format. Use ISO 8601.'}), 400
 
     conn   = get_db()
     cursor = get_cursor(conn)
 
-    cursor.execute(f'SELECT * FROM tracks WHERE last_seen > {P} ORDER BY last_seen ASC', (since,))
+    cursor.execute(
+        f'SELECT * FROM tracks WHERE last_seen_ms > {P} ORDER BY last_seen_ms ASC', (since_ms,)
+    )
     tracks = [dict(r) if hasattr(r, 'keys') else dict(r) for r in cursor.fetchall()]
 
-    cursor.execute(f'SELECT * FROM clicks WHERE timestamp > {P} ORDER BY timestamp ASC', (since,))
+    cursor.execute(f'SELECT * FROM clicks_v WHERE unix_ms > {P} ORDER BY unix_ms ASC', (since_ms,))
     clicks = [dict(r) if hasattr(r, 'keys') else dict(r) for r in cursor.fetchall()]
 
     return jsonify({'tracks': tracks, 'clicks': clicks})
@@ -435,23 +508,25 @@ def wipe_sync_data():
     if not until:
         return jsonify({'error': 'Missing until parameter'}), 400
 
-    # Validate that 'until' is a valid ISO timestamp
-    from datetime import datetime
-    try:
-        datetime.fromisoformat(until.replace('Z', '+00:00'))
-    except (ValueError, AttributeError):
+    # 'until' is ISO 8601 or epoch milliseconds
+    until_ms = iso_to_ms(until)
+    if until_ms is None:
         return jsonify({'error': 'Invalid timestamp format. Use ISO 8601.'}), 400
 
     conn   = get_db()
     cursor = get_cursor(conn)
 
-    cursor.execute(f'DELETE FROM tracks WHERE last_seen <= {P}', (until,))
+    cursor.execute(f'DELETE FROM tracks WHERE last_seen_ms <= {P}', (until_ms,))
     tracks_deleted = cursor.rowcount if hasattr(cursor, 'rowcount') else 0
 
-    cursor.execute(f'DELETE FROM clicks WHERE timestamp <= {P}', (until,))
-    clicks_deleted = cursor.rowcount if hasattr(cursor, 'rowcount') else 0
+    clicks_deleted = 0
+    for table in event_tables(cursor, 'clicks'):
+        cursor.execute(f'DELETE FROM {table} WHERE unix_ms <= {P}', (until_ms,))
+        clicks_deleted += cursor.rowcount if hasattr(cursor, 'rowcount') else 0
 
     conn.commit()
+    bump_data_version(conn, cursor)
+    forget_track()
 
     return jsonify({
         'success': True,
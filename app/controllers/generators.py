@@ -11,6 +11,8 @@ from flask import Blueprint, request, jsonify, current_app
 from urllib.parse import quote
 from .api import require_api_key
 from ..utils import sanitize_id
+from ..database import get_db, get_cursor, placeholder
+from ..services.links import register_link
 
 log = logging.getLogger(__name__)
 
@@ -48,9 +50,21 @@ def generate_link():
     if meta_params:
         click_url += '?' + '&'.join(meta_params)
 
+    # Registered short link: much shorter in email HTML, validated only once
+    conn    = get_db()
+    link_id = register_link(get_cursor(conn), placeholder(), target_url)
+    conn.commit()
+    short_url = None
+    if link_id:
+        short_url = f"{base_url}/l/{track_id}/{link_id}"
+        if meta_params:
+            short_url += '?' + '&'.join(meta_params)
+
     return jsonify({
         'pixel_url': pixel_url,
         'click_url': click_url,
+        'short_url': short_url,
+        'link_id':   link_id,
         'track_id':  track_id,
     })
 
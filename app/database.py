@@ -4,6 +4,8 @@ Supports PostgreSQL (production) and SQLite (local development).
 """
 import os
 import logging
+import threading
+import time
 from urllib.parse import urlparse
 from .config import Config
 
@@ -16,49 +18,262 @@ if USE_POSTGRES:
     import psycopg2
     from psycopg2.extras import RealDictCursor
     from psycopg2 import pool as pg_pool
+    from psycopg2.extensions import STATUS_READY
 else:
     import sqlite3
 
-from flask import g
+from flask import g, has_request_context, request
 
 
 # ── Connection Pooling (PostgreSQL) ────────────────────────────────────────
-_pg_pool = None
+# Two pools per process so workloads cannot starve each other:
+#   ingest    : /track, /click, background workers (small, latency-critical)
+#   analytics : /api/* dashboard reads, exports and node sync
+# Checkout blocks up to PG_POOL_TIMEOUT for a free connection instead of
+# failing, and records how long it waited.
+
+class PoolExhausted(RuntimeError):
+    """No pooled connection became free within PG_POOL_TIMEOUT."""
+
+
+class _PgPool:
+    """ThreadedConnectionPool with blocking acquire, health checks and recycling."""
+
+    def __init__(self, name: str, minconn: int, maxconn: int):
+        self.name   = name
+        maxconn     = max(1, maxconn)
+        self._pool  = pg_pool.ThreadedConnectionPool(
+            minconn=min(max(0, minconn), maxconn), maxconn=maxconn, dsn=Config.DATABASE_URL,
+            connect_timeout=5  # Avoid indefinite block if Postgres is down
+        )
+        # getconn() raises when every connection is out; the semaphore makes callers wait
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock  = threading.Lock()
+        self._born  = {}                 # id(conn) -> monotonic time opened
+        self._used  = {}                 # id(conn) -> monotonic time last returned
+        self.size   = maxconn
+        self.stats  = {'acquired': 0, 'waited': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0,
+                       'timeouts': 0, 'recycled': 0, 'in_use': 0}
+
+    def acquire(self, timeout: float):
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self.stats['timeouts'] += 1
+            raise PoolExhausted(f'{self.name} pool: no connection free after {timeout:.1f}s')
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+        wait_ms = (time.monotonic() - start) * 1000
+        with self._lock:
+            st = self.stats
+            st['acquired'] += 1
+            st['in_use'] += 1
+            if wait_ms >= 1:
+                st['waited'] += 1
+                st['wait_ms_total'] += wait_ms
+                st['wait_ms_max'] = max(st['wait_ms_max'], wait_ms)
+        return conn
+
+    def _checkout(self):
+        for _ in range(3):
+            conn = self._pool.getconn()
+            now  = time.monotonic()
+            key  = id(conn)
+            with self._lock:
+                born = self._born.setdefault(key, now)
+                last = self._used.get(key, now)
+            if conn.closed or now - born > Config.PG_CONN_MAX_AGE:
+                self._drop(conn)
+                continue
+            if now - last > Config.PG_HEALTHCHECK_IDLE:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute('SELECT 1')
+                    conn.rollback()
+                except Exception:
+                    self._drop(conn)
+                    continue
+            return conn
+        conn = self._pool.getconn()
+        with self._lock:
+            self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _drop(self, conn):
+        with self._lock:
+            self._born.pop(id(conn), None)
+            self._used.pop(id(conn), None)
+            self.stats['recycled'] += 1
+        try:
+            self._pool.putconn(conn, close=True)
+        except Exception:
+            pass
 
-def _get_pg_pool():
-    """Get or create PostgreSQL connection pool (M-02)."""
-    global _pg_pool
-    if _pg_pool is None and USE_POSTGRES:
+    def release(self, conn, discard: bool = False):
         try:
-            _pg_pool = pg_pool.ThreadedConnectionPool(
-                minconn=1, maxconn=10, dsn=Config.DATABASE_URL,
-                connect_timeout=5  # Avoid indefinite block if Postgres is down
-            )
-            log.info("[DB] PostgreSQL connection pool created (min=1, max=10)")
-        except Exception as e:
-            log.error("[DB] Failed to create connection pool: %s", e)
-            _pg_pool = None
-    return _pg_pool
+            if not discard and not conn.closed:
+                try:
+                    if conn.status != STATUS_READY:
+                        conn.rollback()     # never hand out a connection mid-transaction
+                except Exception:
+                    discard = True
+            if discard or conn.closed:
+                self._drop(conn)
+            else:
+                with self._lock:
+                    self._used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            with self._lock:
+                self.stats['in_use'] -= 1
+            self._slots.release()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            st = dict(self.stats, size=self.size)
+        st['wait_ms_avg'] = round(st['wait_ms_total'] / st['waited'], 2) if st['waited'] else 0.0
+        st['wait_ms_total'] = round(st['wait_ms_total'], 1)
+        st['wait_ms_max'] = round(st['wait_ms_max'], 1)
+        return st
+
+
+_pg_pools = {}
+_pg_pools_lock = threading.Lock()
+_ANALYTICS_BLUEPRINTS = frozenset({'api'})
+
+
+def _pool_sizes(workload: str):
+    if workload == 'analytics':
+        return Config.PG_ANALYTICS_POOL_MIN, Config.PG_ANALYTICS_POOL_MAX
+    return Config.PG_INGEST_POOL_MIN, Config.PG_INGEST_POOL_MAX
+
+
+def _get_pg_pool(workload: str = 'ingest'):
+    """Get or create this process's PostgreSQL pool for ``workload`` (M-02)."""
+    pool = _pg_pools.get(workload)
+    if pool is None and USE_POSTGRES:
+        with _pg_pools_lock:
+            pool = _pg_pools.get(workload)
+            if pool is None:
+                minconn, maxconn = _pool_sizes(workload)
+                try:
+                    pool = _pg_pools[workload] = _PgPool(workload, minconn, maxconn)
+                    log.info("[DB] PostgreSQL %s pool created (min=%d, max=%d)",
+                             workload, minconn, maxconn)
+                except Exception as e:
+                    log.error("[DB] Failed to create %s connection pool: %s", workload, e)
+                    pool = None
+    return pool
+
+
+def init_pools():
+    """Create the PostgreSQL pools up front (call after fork, before serving)."""
+    if USE_POSTGRES:
+        for workload in ('ingest', 'analytics'):
+            _get_pg_pool(workload)
+
+
+def pool_stats() -> dict:
+    """Checkout counters and wait times per PostgreSQL pool (empty on SQLite)."""
+    return {name: pool.snapshot() for name, pool in list(_pg_pools.items())}
+
+
+def _workload() -> str:
+    """'analytics' for dashboard / API requests and sync, 'ingest' for everything else."""
+    workload = g.get('db_workload')
+    if workload:
+        return workload
+    if has_request_context() and request.blueprint in _ANALYTICS_BLUEPRINTS:
+        return 'analytics'
+    return 'ingest'
+
+
+# ── Persistent connections (SQLite) ───────────────────────────────────────
+# One connection per thread, opened and tuned once, then reused by every
+# request / task on that thread (SQLITE_POOL=false restores connect-per-request).
+# Reopened if the process forked or DB_FILE changed.
+_sqlite_local = threading.local()
+
+_SQLITE_SYNCHRONOUS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+_SQLITE_TEMP_STORE  = {'DEFAULT', 'FILE', 'MEMORY'}
+
+
+def _sqlite_connect():
+    """Open and configure a SQLite connection (PRAGMAs applied once per connection)."""
+    db_dir = os.path.dirname(Config.DB_FILE)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(
+        Config.DB_FILE,
+        timeout=Config.SQLITE_BUSY_TIMEOUT / 1000.0,
+        cached_statements=Config.SQLITE_CACHED_STATEMENTS,
+    )
+    conn.row_factory = sqlite3.Row
+    synchronous = Config.SQLITE_SYNCHRONOUS.upper()
+    temp_store  = Config.SQLITE_TEMP_STORE.upper()
+    # Enable WAL mode for better concurrent write performance
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    # WAL + NORMAL stays consistent after a crash; only the last commits may be lost
+    conn.execute(f"PRAGMA synchronous={synchronous if synchronous in _SQLITE_SYNCHRONOUS else 'NORMAL'}")
+    conn.execute(f"PRAGMA temp_store={temp_store if temp_store in _SQLITE_TEMP_STORE else 'MEMORY'}")
+    conn.execute(f'PRAGMA cache_size={int(Config.SQLITE_CACHE_SIZE)}')
+    conn.execute(f'PRAGMA mmap_size={int(Config.SQLITE_MMAP_SIZE)}')
+    conn.execute(f'PRAGMA busy_timeout={int(Config.SQLITE_BUSY_TIMEOUT)}')
+    return conn
+
+
+def _get_sqlite_conn():
+    """This thread's persistent connection (a fresh one if pooling is off)."""
+    if not Config.SQLITE_POOL:
+        return _sqlite_connect()
+    key = (os.getpid(), Config.DB_FILE)
+    conn = getattr(_sqlite_local, 'conn', None)
+    if conn is not None and _sqlite_local.key == key:
+        return conn
+    if conn is not None and _sqlite_local.key[0] == key[0]:
+        try:
+            conn.close()                    # DB_FILE changed (tests, reconfiguration)
+        except Exception:
+            pass
+    # A connection inherited across fork() is abandoned, never used or closed
+    _sqlite_local.conn = conn = _sqlite_connect()
+    _sqlite_local.key = key
+    return conn
+
+
+def discard_db():
+    """Drop the current connection for good (after an error left it unusable)."""
+    db = g.pop('db', None)
+    pool = g.pop('db_pool', None)
+    if db is None:
+        return
+    if not USE_POSTGRES and getattr(_sqlite_local, 'conn', None) is db:
+        _sqlite_local.conn = None
+    if pool is not None:
+        pool.release(db, discard=True)
+        return
+    try:
+        db.close()
+    except Exception:
+        pass
 
 
 def get_db():
     """Get database connection with dict-like row access."""
     if 'db' not in g:
         if USE_POSTGRES:
-            pool = _get_pg_pool()
+            pool = _get_pg_pool(_workload())
             if pool:
-                g.db = pool.getconn()
+                g.db = pool.acquire(Config.PG_POOL_TIMEOUT)
+                g.db_pool = pool
             else:
                 g.db = psycopg2.connect(Config.DATABASE_URL, connect_timeout=5)
         else:
-            db_dir = os.path.dirname(Config.DB_FILE)
-            if db_dir:
-                os.makedirs(db_dir, exist_ok=True)
-            g.db = sqlite3.connect(Config.DB_FILE)
-            g.db.row_factory = sqlite3.Row
-            # Enable WAL mode for better concurrent write performance
-            g.db.execute('PRAGMA journal_mode=WAL')
-            g.db.execute('PRAGMA foreign_keys=ON')
+            g.db = _get_sqlite_conn()
     return g.db
 
 
@@ -71,11 +286,17 @@ def get_cursor(conn):
 
 
 def close_db(e=None):
-    """Close the database connection if it exists."""
+    """Release the request's connection (pooled SQLite connections stay open)."""
     db = g.pop('db', None)
+    pool = g.pop('db_pool', None)
     if db is not None:
-        if USE_POSTGRES and _pg_pool:
-            _pg_pool.putconn(db)
+        if pool is not None:
+            pool.release(db)
+        elif not USE_POSTGRES and Config.SQLITE_POOL and getattr(_sqlite_local, 'conn', None) is db:
+            # Hand it back clean: an uncommitted transaction must not leak
+            # into the next request on this thread
+            if db.in_transaction:
+                db.rollback()
         else:
             db.close()
 
@@ -88,7 +309,7 @@ _TRACKS_COLUMNS = [
     ('open_date', 'TEXT'),
     ('open_time', 'TEXT'),
     ('day_of_week', 'TEXT'),
-    ('unix_ms', 'INTEGER'),
+    ('unix_ms', 'BIGINT'),
     ('forward_count', 'INTEGER DEFAULT 0'),
     ('is_repeat', 'INTEGER DEFAULT 0'),
     ('is_forward', 'INTEGER DEFAULT 0'),
@@ -118,6 +339,7 @@ _TRACKS_COLUMNS = [
     ('device_brand',       'TEXT'),
     ('is_mobile',          'INTEGER' if not USE_POSTGRES else 'BOOLEAN'),
     ('is_bot',             'INTEGER' if not USE_POSTGRES else 'BOOLEAN'),
+    ('is_proxy',           'INTEGER' if not USE_POSTGRES else 'BOOLEAN'),
     ('referer',            'TEXT'),
     ('accept_language',    'TEXT'),
     ('accept_encoding',    'TEXT'),
@@ -132,13 +354,15 @@ _TRACKS_COLUMNS = [
     ('click_count',        'INTEGER DEFAULT 0'),
     ('first_seen',         'TEXT'),
     ('last_seen',          'TEXT'),
+    ('first_seen_ms',      'BIGINT'),
+    ('last_seen_ms',       'BIGINT'),
 ]
 
 _CLICKS_COLUMNS = [
     ('click_date', 'TEXT'),
     ('click_time', 'TEXT'),
     ('day_of_week', 'TEXT'),
-    ('unix_ms', 'INTEGER'),
+    ('unix_ms', 'BIGINT'),
     ('fingerprint', 'TEXT'),
     ('sender',      'TEXT'),
     ('recipient',   'TEXT'),
@@ -146,6 +370,376 @@ _CLICKS_COLUMNS = [
     ('sent_at',     'TEXT'),
 ]
 
+# Parsed UA / geo / header columns live in the dimension tables since v7
+_OPEN_EVENTS_COLUMNS = []
+
+# (table, columns) reconciled by migrate_db()
+_MIGRATED_COLUMNS = (
+    ('tracks',      _TRACKS_COLUMNS),
+    ('clicks',      _CLICKS_COLUMNS),
+    ('open_events', _OPEN_EVENTS_COLUMNS),
+)
+
+# Composite indexes for the per-track and time-range reads (schema v5).
+# Each per-track query in api.py / tracking.py is answered by a range on one
+# of these; tests/test_query_plans.py fails on any new query that full-scans.
+_QUERY_INDEXES = (
+    ('idx_tracks_first_seen_ms', 'tracks',      'first_seen_ms'),
+    ('idx_tracks_last_seen_ms',  'tracks',      'last_seen_ms'),
+    ('idx_open_events_tid_ms',   'open_events', 'track_id, unix_ms'),
+    ('idx_open_events_tid_fp',   'open_events', 'track_id, fingerprint'),
+    ('idx_open_events_tid_date', 'open_events', 'track_id, open_date'),
+    ('idx_clicks_tid_ms',        'clicks',      'track_id, unix_ms'),
+    ('idx_clicks_tid_fp',        'clicks',      'track_id, fingerprint'),
+    ('idx_clicks_tid_date',      'clicks',      'track_id, click_date'),
+    ('idx_clicks_unix_ms',       'clicks',      'unix_ms'),
+)
+
+# Single-column indexes covered by the leading column of a composite above
+# (or, for idx_track_id, by the UNIQUE constraint), and indexes on the ISO
+# TEXT timestamps that ordering / sync no longer use (v6) — only cost writes.
+_SUPERSEDED_INDEXES = (
+    'idx_track_id', 'idx_clicks_track', 'idx_open_events_tid',
+    'idx_open_events_date', 'idx_open_events_fp', 'idx_clicks_date', 'idx_clicks_fp',
+    'idx_timestamp', 'idx_last_seen', 'idx_clicks_tid_ts', 'idx_clicks_timestamp',
+    'idx_open_events_geo_pending', 'idx_clicks_geo_pending',
+)
+
+
+# Integer epoch-ms columns (v6) back-filled from their ISO TEXT counterparts:
+# (table, ms column, ISO source — first non-NULL wins)
+_EPOCH_BACKFILL = (
+    ('tracks',      'first_seen_ms', ('first_seen', 'timestamp')),
+    ('tracks',      'last_seen_ms',  ('last_seen', 'first_seen', 'timestamp')),
+    ('open_events', 'unix_ms',       ('timestamp',)),
+    ('clicks',      'unix_ms',       ('timestamp',)),
+)
+
+
+def _backfill_epoch_ms(cursor):
+    """Fill NULL epoch-ms columns from the ISO strings (idempotent).
+
+    Naive ISO strings are taken as UTC; unparseable ones stay NULL.
+    """
+    from .services.partitions import event_tables
+
+    for table, column, sources in _EPOCH_BACKFILL:
+        iso = f"COALESCE({', '.join(sources)})" if len(sources) > 1 else sources[0]
+        for target in event_tables(cursor, table):
+            _backfill_column(cursor, target, column, iso)
+
+
+def _backfill_column(cursor, table, column, iso):
+    if USE_POSTGRES:
+        cursor.execute(
+            f"UPDATE {table} SET {column} = "
+            f"CAST(EXTRACT(EPOCH FROM CAST({iso} AS TIMESTAMPTZ)) * 1000 AS BIGINT) "
+            f"WHERE {column} IS NULL AND {iso} ~ '^\\d{{4}}-\\d{{2}}-\\d{{2}}'"
+        )
+    else:
+        cursor.execute(
+            f"UPDATE {table} SET {column} = "
+            f"CAST(ROUND((julianday({iso}) - 2440587.5) * 86400000) AS INTEGER) "
+            f"WHERE {column} IS NULL AND julianday({iso}) IS NOT NULL"
+        )
+    if cursor.rowcount and cursor.rowcount > 0:
+        log.info("[DB] Back-filled %s.%s on %d rows", table, column, cursor.rowcount)
+
+
+def _ensure_query_indexes(cursor):
+    from .services.partitions import event_tables
+
+    for name in _SUPERSEDED_INDEXES:
+        cursor.execute(f'DROP INDEX IF EXISTS {name}')
+    for name, table, columns in _QUERY_INDEXES:
+        # SQLite month partitions (v8) each carry their own copy
+        for target in event_tables(cursor, table) if table in _EVENT_TABLES else [table]:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name.replace(table, target, 1)} ON {target}({columns})'
+            )
+
+
+# ─── Event tables and their dimensions (v7) ───────────────────────────────────
+# open_events / clicks keep per-event facts and integer ids into ua_dim,
+# geo_dim and header_dim (services/dims.py). The dimension flags are INTEGER
+# on both backends; tracks (one mutable row per email) stays wide.
+
+_DIM_TABLES = {
+    'ua_dim': '''
+        user_agent      TEXT,
+        browser         TEXT,
+        browser_version TEXT,
+        os              TEXT,
+        os_version      TEXT,
+        device_type     TEXT,
+        device_brand    TEXT,
+        is_mobile       INTEGER,
+        is_bot          INTEGER,
+        is_proxy        INTEGER
+    ''',
+    'geo_dim': '''
+        ip_address      TEXT,
+        country         TEXT,
+        region          TEXT,
+        city            TEXT,
+        latitude        REAL,
+        longitude       REAL,
+        timezone        TEXT,
+        isp             TEXT,
+        org             TEXT,
+        asn             TEXT
+    ''',
+    'header_dim': '''
+        referer         TEXT,
+        accept_language TEXT
+    ''',
+}
+
+_EVENT_TABLES = {
+    'open_events': '''
+        timestamp       TEXT NOT NULL,
+        open_date       TEXT,
+        open_time       TEXT,
+        day_of_week     TEXT,
+        unix_ms         {bigint},
+
+        track_id        TEXT,
+        campaign_id     TEXT,
+
+        sender          TEXT,
+        recipient       TEXT,
+        subject         TEXT,
+        sent_at         TEXT,
+
+        geo_id          INTEGER,
+        ua_id           INTEGER,
+        header_id       INTEGER,
+
+        is_repeat       INTEGER DEFAULT 0,
+        is_forward      INTEGER DEFAULT 0,
+
+        fingerprint     TEXT
+    ''',
+    'clicks': '''
+        timestamp       TEXT NOT NULL,
+        click_date      TEXT,
+        click_time      TEXT,
+        day_of_week     TEXT,
+        unix_ms         {bigint},
+
+        track_id        TEXT NOT NULL,
+        campaign_id     TEXT,
+        link_id         TEXT NOT NULL REFERENCES links(link_id),
+        target_url      TEXT NOT NULL,
+
+        geo_id          INTEGER,
+        ua_id           INTEGER,
+        header_id       INTEGER,
+
+        sender          TEXT,
+        recipient       TEXT,
+        subject         TEXT,
+        sent_at         TEXT,
+
+        fingerprint     TEXT
+    ''',
+}
+
+# Original wide column layout, joined back from the dimensions
+_EVENT_VIEWS = {
+    'open_events_v': '''
+        SELECT e.id, e.timestamp, e.open_date, e.open_time, e.day_of_week, e.unix_ms,
+               e.track_id, e.campaign_id, e.sender, e.recipient, e.subject, e.sent_at,
+               g.ip_address, g.country, g.region, g.city, g.latitude, g.longitude,
+               g.timezone, g.isp, g.org, g.asn,
+               u.user_agent, u.browser, u.browser_version, u.os, u.os_version,
+               u.device_type, u.device_brand, {flags},
+               h.referer, h.accept_language,
+               e.is_repeat, e.is_forward, e.fingerprint
+        FROM open_events e
+        LEFT JOIN geo_dim g    ON g.id = e.geo_id
+        LEFT JOIN ua_dim u     ON u.id = e.ua_id
+        LEFT JOIN header_dim h ON h.id = e.header_id
+    ''',
+    'clicks_v': '''
+        SELECT e.id, e.timestamp, e.click_date, e.click_time, e.day_of_week, e.unix_ms,
+               e.track_id, e.campaign_id, e.link_id, e.target_url,
+               g.ip_address, g.country, g.region, g.city, g.latitude, g.longitude,
+               g.isp, g.org, g.asn,
+               u.user_agent, u.browser, u.browser_version, u.os, u.os_version,
+               u.device_type, u.device_brand, {flags},
+               h.referer,
+               e.sender, e.recipient, e.subject, e.sent_at, e.fingerprint
+        FROM clicks e
+        LEFT JOIN geo_dim g    ON g.id = e.geo_id
+        LEFT JOIN ua_dim u     ON u.id = e.ua_id
+        LEFT JOIN header_dim h ON h.id = e.header_id
+    ''',
+}
+
+# Per-event columns copied as-is when a wide table is normalized
+_EVENT_COPY_COLUMNS = {
+    'open_events': ('timestamp', 'open_date', 'open_time', 'day_of_week', 'unix_ms',
+                    'track_id', 'campaign_id', 'sender', 'recipient', 'subject', 'sent_at',
+                    'is_repeat', 'is_forward', 'fingerprint'),
+    'clicks':      ('timestamp', 'click_date', 'click_time', 'day_of_week', 'unix_ms',
+                    'track_id', 'campaign_id', 'link_id', 'target_url',
+                    'sender', 'recipient', 'subject', 'sent_at', 'fingerprint'),
+}
+
+_NORMALIZE_CHUNK = 1000
+
+
+def _create_event_tables(cursor):
+    """Dimension tables plus the narrow open_events / clicks (IF NOT EXISTS)."""
+    pk = 'SERIAL PRIMARY KEY' if USE_POSTGRES else 'INTEGER PRIMARY KEY AUTOINCREMENT'
+    bigint = 'BIGINT' if USE_POSTGRES else 'INTEGER'
+    for table, columns in _DIM_TABLES.items():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id              {pk},
+                dim_key         TEXT NOT NULL UNIQUE,{columns})
+        ''')
+    for table, columns in _EVENT_TABLES.items():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id              {pk},{columns.format(bigint=bigint)})
+        ''')
+
+
+# Event counters maintained by ingest (services/rollups.py)
+_ROLLUP_TABLES = {
+    'rollup_daily': '''
+        track_id        TEXT NOT NULL,
+        kind            TEXT NOT NULL,      -- 'open' / 'click'
+        day             TEXT NOT NULL,      -- YYYY-MM-DD (UTC)
+        events          INTEGER NOT NULL,
+        PRIMARY KEY (track_id, kind, day)''',
+    'rollup_visits': '''
+        track_id        TEXT NOT NULL,
+        kind            TEXT NOT NULL,
+        day             TEXT NOT NULL,
+        ua_id           INTEGER NOT NULL,   -- ua_dim.id (0 = none)
+        geo_id          INTEGER NOT NULL,   -- geo_dim.id (0 = none)
+        events          INTEGER NOT NULL,
+        PRIMARY KEY (track_id, kind, day, ua_id, geo_id)''',
+    # Per track as well, so deleting a track can take its events back out
+    'rollup_campaign_daily': '''
+        campaign_id     TEXT NOT NULL,
+        kind            TEXT NOT NULL,
+        day             TEXT NOT NULL,
+        track_id        TEXT NOT NULL,
+        events          INTEGER NOT NULL,
+        PRIMARY KEY (campaign_id, kind, day, track_id)''',
+    'rollup_fingerprints': '''
+        track_id        TEXT NOT NULL,
+        kind            TEXT NOT NULL,
+        fingerprint     TEXT NOT NULL,
+        PRIMARY KEY (track_id, kind, fingerprint)''',
+}
+
+
+def _create_rollup_tables(cursor):
+    for table, columns in _ROLLUP_TABLES.items():
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_rollup_campaign_daily_track ON rollup_campaign_daily(track_id)'
+    )
+
+
+def _drop_event_views(cursor):
+    for view in _EVENT_VIEWS:
+        cursor.execute(f'DROP VIEW IF EXISTS {view}')
+
+
+def _create_event_views(cursor):
+    # PostgreSQL: flags read back as BOOLEAN, like the wide columns they replace
+    flags = ', '.join(
+        f'(u.{c} <> 0) AS {c}' if USE_POSTGRES else f'u.{c}'
+        for c in ('is_mobile', 'is_bot', 'is_proxy')
+    )
+    _drop_event_views(cursor)
+    for view, select in _EVENT_VIEWS.items():
+        cursor.execute(f'CREATE VIEW {view} AS {select.format(flags=flags)}')
+
+
+def _table_columns(cursor, table):
+    if USE_POSTGRES:
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = %s", (table,)
+        )
+        return {r[0] for r in cursor.fetchall()}
+    cursor.execute(f'PRAGMA table_info({table})')
+    return {r[1] for r in cursor.fetchall()}
+
+
+def _normalize_event_tables(conn, cursor):
+    """Move wide open_events / clicks rows onto dimension ids (v7).
+
+    The wide table is renamed aside, the narrow one created, rows copied in
+    id order (ids preserved) and the old table dropped. Tables that no longer
+    carry ``user_agent`` are already narrow and skipped.
+    """
+    from .services.dims import DIMENSIONS, DimBatch, row_values
+
+    P = placeholder()
+    for table, columns in _EVENT_COPY_COLUMNS.items():
+        if 'user_agent' not in _table_columns(cursor, table):
+            continue
+        legacy = f'{table}_wide'
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+        _create_event_tables(cursor)
+
+        cols = ('id',) + columns + ('geo_id', 'ua_id', 'header_id')
+        insert = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join([P] * len(cols))})"
+        last_id, moved = 0, 0
+        while True:
+            cursor.execute(
+                f'SELECT * FROM {legacy} WHERE id > {P} ORDER BY id LIMIT {P}',
+                (last_id, _NORMALIZE_CHUNK)
+            )
+            names = [d[0] for d in cursor.description]
+            rows = [dict(zip(names, r)) for r in cursor.fetchall()]
+            if not rows:
+                break
+            ids = DimBatch(cursor, P).resolve([
+                {name: row_values(row, fields) for name, (_, fields) in DIMENSIONS.items()}
+                for row in rows
+            ])
+            cursor.executemany(insert, [
+                (row['id'],) + tuple(row.get(c) for c in columns)
+                + (dim_ids['geo'], dim_ids['ua'], dim_ids['header'])
+                for row, dim_ids in zip(rows, ids)
+            ])
+            last_id = rows[-1]['id']
+            moved += len(rows)
+
+        cursor.execute(f'DROP TABLE {legacy}')
+        if USE_POSTGRES:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+            )
+        conn.commit()
+        log.info("[DB] Normalized %d %s rows onto dimension tables", moved, table)
+
+
+def _backfill_links(cursor):
+    """Create a links row for every link_id already referenced by clicks.
+
+    Runs only while the links table is still empty, i.e. once per install.
+    """
+    cursor.execute('SELECT 1 FROM links LIMIT 1')
+    if cursor.fetchone():
+        return
+    cursor.execute('''
+        INSERT INTO links (link_id, target_url, created_at, is_registered)
+        SELECT link_id, MIN(target_url), MIN(timestamp), 0
+        FROM clicks GROUP BY link_id
+    ''')
+    if cursor.rowcount:
+        log.info("[DB] Back-filled %d links from clicks", cursor.rowcount)
+
 
 def init_db():
     """
@@ -163,7 +757,7 @@ def init_db():
                 open_date        TEXT,
                 open_time        TEXT,
                 day_of_week     TEXT,
-                unix_ms         INTEGER,
+                unix_ms         BIGINT,
                 track_id         TEXT NOT NULL UNIQUE,
                 campaign_id      TEXT,
                 label            TEXT,
@@ -192,6 +786,7 @@ def init_db():
                 device_brand     TEXT,
                 is_mobile        BOOLEAN,
                 is_bot           BOOLEAN,
+                is_proxy         BOOLEAN,
 
                 referer          TEXT,
                 accept_language  TEXT,
@@ -212,102 +807,27 @@ def init_db():
                 is_forward      INTEGER DEFAULT 0,
 
                 first_seen      TEXT,
-                last_seen       TEXT
+                last_seen       TEXT,
+                first_seen_ms   BIGINT,
+                last_seen_ms    BIGINT
             )
         ''')
 
+        # Registered click targets; clicks.link_id references link_id
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS open_events (
-                id              SERIAL PRIMARY KEY,
-                timestamp       TEXT NOT NULL,
-                open_date       TEXT,
-                open_time       TEXT,
-                day_of_week     TEXT,
-                unix_ms         INTEGER,
-
-                track_id        TEXT,
-                campaign_id     TEXT,
-
-                sender          TEXT,
-                recipient       TEXT,
-                subject         TEXT,
-                sent_at         TEXT,
-
-                ip_address      TEXT,
-                country         TEXT,
-                region          TEXT,
-                city            TEXT,
-                latitude        REAL,
-                longitude       REAL,
-                timezone        TEXT,
-                isp             TEXT,
-                org             TEXT,
-                asn             TEXT,
-
-                user_agent      TEXT,
-                browser         TEXT,
-                browser_version TEXT,
-                os              TEXT,
-                os_version      TEXT,
-                device_type     TEXT,
-                device_brand    TEXT,
-                is_mobile       BOOLEAN,
-                is_bot          BOOLEAN,
-
-                referer         TEXT,
-                accept_language TEXT,
-
-                is_repeat       INTEGER DEFAULT 0,
-                is_forward      INTEGER DEFAULT 0,
-
-                fingerprint     TEXT
+            CREATE TABLE IF NOT EXISTS links (
+                link_id       TEXT PRIMARY KEY,
+                target_url    TEXT NOT NULL,
+                created_at    TEXT NOT NULL,
+                is_registered INTEGER DEFAULT 0
             )
         ''')
 
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS clicks (
-                id          SERIAL PRIMARY KEY,
-                timestamp   TEXT NOT NULL,
-                click_date      TEXT,
-                click_time      TEXT,
-                day_of_week     TEXT,
-                unix_ms         INTEGER,
+        _create_event_tables(cursor)
+        _create_rollup_tables(cursor)
 
-                track_id    TEXT NOT NULL,
-                campaign_id TEXT,
-                link_id     TEXT NOT NULL,
-                target_url  TEXT NOT NULL,
-
-                ip_address  TEXT,
-                country     TEXT,
-                region          TEXT,
-                city        TEXT,
-                latitude    REAL,
-                longitude   REAL,
-                isp             TEXT,
-                org             TEXT,
-                asn             TEXT,
-
-                user_agent  TEXT,
-                browser     TEXT,
-                browser_version TEXT,
-                os          TEXT,
-                os_version  TEXT,
-                device_type TEXT,
-                device_brand    TEXT,
-                is_mobile       BOOLEAN,
-                is_bot          BOOLEAN,
-
-                referer     TEXT,
-
-                sender      TEXT,
-                recipient   TEXT,
-                subject     TEXT,
-                sent_at     TEXT,
-
-                fingerprint     TEXT
-            )
-        ''')
+        # Advanced after every write to tracks; keys the /api/stats cache
+        cursor.execute('CREATE SEQUENCE IF NOT EXISTS data_version_seq')
 
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS geo_cache (
@@ -316,19 +836,49 @@ def init_db():
                 cached_at  TEXT NOT NULL
             )
         ''')
+        # Expiry sweeps (services/maintenance.py) range-scan on cached_at
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_geo_cache_cached_at ON geo_cache(cached_at)')
+
+        # Durable webhook queue, written in the same transaction as the event.
+        # next_attempt_at / claimed_until are epoch ms; NULL next_attempt_at = parked
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS webhook_outbox (
+                id              BIGSERIAL PRIMARY KEY,
+                event_type      TEXT NOT NULL,
+                payload         TEXT NOT NULL,
+                created_at      TEXT NOT NULL,
+                attempts        INTEGER DEFAULT 0,
+                next_attempt_at BIGINT,
+                claim_token     TEXT,
+                claimed_until   BIGINT,
+                last_error      TEXT
+            )
+        ''')
 
         # Indexes
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_track_id   ON tracks(track_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_timestamp  ON tracks(timestamp)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_last_seen  ON tracks(last_seen)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_clicks_track ON clicks(track_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_country    ON tracks(country)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_device     ON tracks(device_type)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_open_events_tid   ON open_events(track_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_open_events_date  ON open_events(open_date)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_open_events_fp    ON open_events(fingerprint)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_clicks_date       ON clicks(click_date)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_clicks_fp         ON clicks(fingerprint)')
+        # Per-track composite and epoch-ms indexes are created by migrate_db() (v5 / v6)
+        # Partial indexes: only rows still awaiting deferred geo enrichment
+        for table in ('tracks', 'geo_dim'):
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_geo_pending ON {table}(ip_address) "
+                f"WHERE country = 'Pending'"
+            )
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_due ON webhook_outbox(next_attempt_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_claim ON webhook_outbox(claim_token)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_links_target ON links(target_url)')
+        _backfill_links(cursor)
+        # Installs that predate the links table: declare the FK once links are back-filled
+        cursor.execute(
+            "SELECT 1 FROM pg_constraint WHERE conrelid = 'clicks'::regclass "
+            "AND confrelid = 'links'::regclass"
+        )
+        if not cursor.fetchone():
+            cursor.execute(
+                'ALTER TABLE clicks ADD CONSTRAINT fk_clicks_link '
+                'FOREIGN KEY (link_id) REFERENCES links(link_id)'
+            )
 
         # Schema versioning to prevent redundant migrations
         cursor.execute('''
@@ -389,6 +939,7 @@ def init_db():
                 device_brand     TEXT,
                 is_mobile        INTEGER,
                 is_bot           INTEGER,
+                is_proxy         INTEGER,
 
                 referer          TEXT,
                 accept_language  TEXT,
@@ -409,102 +960,33 @@ def init_db():
                 is_forward      INTEGER DEFAULT 0,
 
                 first_seen      TEXT,
-                last_seen       TEXT
+                last_seen       TEXT,
+                first_seen_ms   INTEGER,
+                last_seen_ms    INTEGER
             )
         ''')
 
+        # Registered click targets; clicks.link_id references link_id
         conn.execute('''
-            CREATE TABLE IF NOT EXISTS open_events (
-                id              INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp       TEXT NOT NULL,
-                open_date       TEXT,
-                open_time       TEXT,
-                day_of_week     TEXT,
-                unix_ms         INTEGER,
-
-                track_id        TEXT,
-                campaign_id     TEXT,
-
-                sender          TEXT,
-                recipient       TEXT,
-                subject         TEXT,
-                sent_at         TEXT,
-
-                ip_address      TEXT,
-                country         TEXT,
-                region          TEXT,
-                city            TEXT,
-                latitude        REAL,
-                longitude       REAL,
-                timezone        TEXT,
-                isp             TEXT,
-                org             TEXT,
-                asn             TEXT,
-
-                user_agent      TEXT,
-                browser         TEXT,
-                browser_version TEXT,
-                os              TEXT,
-                os_version      TEXT,
-                device_type     TEXT,
-                device_brand    TEXT,
-                is_mobile       INTEGER,
-                is_bot          INTEGER,
-
-                referer         TEXT,
-                accept_language TEXT,
-
-                is_repeat       INTEGER DEFAULT 0,
-                is_forward      INTEGER DEFAULT 0,
-
-                fingerprint     TEXT
+            CREATE TABLE IF NOT EXISTS links (
+                link_id       TEXT PRIMARY KEY,
+                target_url    TEXT NOT NULL,
+                created_at    TEXT NOT NULL,
+                is_registered INTEGER DEFAULT 0
             )
         ''')
 
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS clicks (
-                id          INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp   TEXT NOT NULL,
-                click_date      TEXT,
-                click_time      TEXT,
-                day_of_week     TEXT,
-                unix_ms         INTEGER,
+        _create_event_tables(conn)
+        _create_rollup_tables(conn)
 
-                track_id    TEXT NOT NULL,
-                campaign_id TEXT,
-                link_id     TEXT NOT NULL,
-                target_url  TEXT NOT NULL,
-
-                ip_address  TEXT,
-                country     TEXT,
-                region          TEXT,
-                city        TEXT,
-                latitude    REAL,
-                longitude   REAL,
-                isp             TEXT,
-                org             TEXT,
-                asn             TEXT,
-
-                user_agent  TEXT,
-                browser     TEXT,
-                browser_version TEXT,
-                os          TEXT,
-                os_version  TEXT,
-                device_type TEXT,
-                device_brand    TEXT,
-                is_mobile       INTEGER,
-                is_bot          INTEGER,
-
-                referer     TEXT,
-
-                sender      TEXT,
-                recipient   TEXT,
-                subject     TEXT,
-                sent_at     TEXT,
-
-                fingerprint     TEXT
+        # One row, bumped after every write to tracks; keys the /api/stats cache
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS data_version (
+                id      INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL
             )
         ''')
+        conn.execute('INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)')
 
         conn.execute('''
             CREATE TABLE IF NOT EXISTS geo_cache (
@@ -513,13 +995,39 @@ def init_db():
                 cached_at  TEXT NOT NULL
             )
         ''')
+        # Expiry sweeps (services/maintenance.py) range-scan on cached_at
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_geo_cache_cached_at ON geo_cache(cached_at)')
+
+        # Durable webhook queue, written in the same transaction as the event.
+        # next_attempt_at / claimed_until are epoch ms; NULL next_attempt_at = parked
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS webhook_outbox (
+                id              INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_type      TEXT NOT NULL,
+                payload         TEXT NOT NULL,
+                created_at      TEXT NOT NULL,
+                attempts        INTEGER DEFAULT 0,
+                next_attempt_at INTEGER,
+                claim_token     TEXT,
+                claimed_until   INTEGER,
+                last_error      TEXT
+            )
+        ''')
 
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_track_id    ON tracks(track_id)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_timestamp   ON tracks(timestamp)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_last_seen   ON tracks(last_seen)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_clicks_track ON clicks(track_id)')
         conn.execute('CREATE INDEX IF NOT EXISTS idx_country     ON tracks(country)')
         conn.execute('CREATE INDEX IF NOT EXISTS idx_device      ON tracks(device_type)')
+        # Per-track composite and epoch-ms indexes are created by migrate_db() (v5 / v6)
+        # Partial indexes: only rows still awaiting deferred geo enrichment
+        for table in ('tracks', 'geo_dim'):
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_geo_pending ON {table}(ip_address) "
+                f"WHERE country = 'Pending'"
+            )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_due ON webhook_outbox(next_attempt_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_claim ON webhook_outbox(claim_token)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_links_target ON links(target_url)')
+        # SQLite cannot add a FK to an existing table; older installs only get the rows
+        _backfill_links(conn.cursor())
 
         # Schema versioning to prevent redundant migrations
         conn.execute('''
@@ -540,6 +1048,9 @@ def migrate_db():
     _TRACKS_COLUMNS now lists ALL columns to ensure schema parity
     between fresh installs and migrated databases.
     """
+    from .services.partitions import partition_event_tables
+    from .services.rollups import backfill_rollups
+
     if USE_POSTGRES:
         conn = psycopg2.connect(Config.DATABASE_URL)
         cursor = conn.cursor()
@@ -549,7 +1060,11 @@ def migrate_db():
         row = cursor.fetchone()
         current_version = row[0] if row else 0
 
-        target_version = 3 # Bumped: v3 ensures open_events table exists
+        # v3 ensures open_events exists; v4 adds is_proxy; v5 composite indexes;
+        # v6 integer epoch-ms columns (unix_ms widened to BIGINT, back-filled);
+        # v7 event tables normalized onto ua_dim / geo_dim / header_dim;
+        # v8 event tables partitioned by month; v9 rollup counters back-filled
+        target_version = 9
 
         if current_version >= target_version:
             cursor.close()
@@ -559,91 +1074,60 @@ def migrate_db():
         log.info("[DB] Migrating PostgreSQL database to version %d", target_version)
 
         # Ensure open_events table exists (may be missing on older installs)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS open_events (
-                id              SERIAL PRIMARY KEY,
-                timestamp       TEXT NOT NULL,
-                open_date       TEXT,
-                open_time       TEXT,
-                day_of_week     TEXT,
-                unix_ms         INTEGER,
-                track_id        TEXT,
-                campaign_id     TEXT,
-                sender          TEXT,
-                recipient       TEXT,
-                subject         TEXT,
-                sent_at         TEXT,
-                ip_address      TEXT,
-                country         TEXT,
-                region          TEXT,
-                city            TEXT,
-                latitude        REAL,
-                longitude       REAL,
-                timezone        TEXT,
-                isp             TEXT,
-                org             TEXT,
-                asn             TEXT,
-                user_agent      TEXT,
-                browser         TEXT,
-                browser_version TEXT,
-                os              TEXT,
-                os_version      TEXT,
-                device_type     TEXT,
-                device_brand    TEXT,
-                is_mobile       BOOLEAN,
-                is_bot          BOOLEAN,
-                referer         TEXT,
-                accept_language TEXT,
-                is_repeat       INTEGER DEFAULT 0,
-                is_forward      INTEGER DEFAULT 0,
-                fingerprint     TEXT
-            )
-        ''')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_open_events_tid   ON open_events(track_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_open_events_date  ON open_events(open_date)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_open_events_fp    ON open_events(fingerprint)')
+        _create_event_tables(cursor)
         conn.commit()
         log.info("[DB] Ensured open_events table exists")
 
-        cursor.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_name = 'tracks'
-        """)
-        existing_cols = {row[0] for row in cursor.fetchall()}
+        for table, columns in _MIGRATED_COLUMNS:
+            cursor.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = %s",
+                (table,)
+            )
+            existing_cols = {row[0] for row in cursor.fetchall()}
+
+            for col_name, col_type in columns:
+                # Strip DEFAULT clauses for ALTER TABLE — Postgres handles defaults differently
+                base_type = col_type.split(' DEFAULT ')[0].strip()
+                if col_name not in existing_cols:
+                    try:
+                        cursor.execute(
+                            f'ALTER TABLE {table} ADD COLUMN {col_name} {base_type}'
+                        )
+                        log.info("[DB] Added %s column: %s", table, col_name)
+                        conn.commit()
+                    except Exception as e:
+                        conn.rollback()
+                        log.error("[DB] Failed to add %s column %s: %s", table, col_name, e)
+
+        # Epoch milliseconds overflow INTEGER; older installs declared unix_ms that way
+        cursor.execute(
+            "SELECT table_name FROM information_schema.columns "
+            "WHERE column_name = 'unix_ms' AND data_type = 'integer' "
+            "AND table_name IN ('tracks', 'open_events', 'clicks')"
+        )
+        for (table,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {table} ALTER COLUMN unix_ms TYPE BIGINT')
+            log.info("[DB] Widened %s.unix_ms to BIGINT", table)
+        conn.commit()
 
-        for col_name, col_type in _TRACKS_COLUMNS:
-            # Strip DEFAULT clauses for ALTER TABLE — Postgres handles defaults differently
-            base_type = col_type.split(' DEFAULT ')[0].strip()
-            if col_name not in existing_cols:
-                try:
-                    cursor.execute(
-                        f'ALTER TABLE tracks ADD COLUMN {col_name} {base_type}'
-                    )
-                    log.info("[DB] Added column: %s", col_name)
-                    conn.commit()
-                except Exception as e:
-                    conn.rollback()
-                    log.error("[DB] Failed to add column %s: %s", col_name, e)
-
-        # Migrate clicks table
-        cursor.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_name = 'clicks'
-        """)
-        existing_click_cols = {row[0] for row in cursor.fetchall()}
-
-        for col_name, col_type in _CLICKS_COLUMNS:
-            base_type = col_type.split(' DEFAULT ')[0].strip()
-            if col_name not in existing_click_cols:
-                try:
-                    cursor.execute(
-                        f'ALTER TABLE clicks ADD COLUMN {col_name} {base_type}'
-                    )
-                    log.info("[DB] Added clicks column: %s", col_name)
-                    conn.commit()
-                except Exception as e:
-                    conn.rollback()
-                    log.error("[DB] Failed to add clicks column %s: %s", col_name, e)
+        _drop_event_views(cursor)          # recreated below, after the tables are rebuilt
+        _normalize_event_tables(conn, cursor)
+
+        try:
+            cursor.execute("SET TIME ZONE 'UTC'")      # naive ISO strings are UTC
+            _backfill_epoch_ms(cursor)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            log.error("[DB] Epoch-ms back-fill failed: %s", e)
+
+        partition_event_tables(conn, cursor)
+        backfill_rollups(conn, cursor)
+
+        _ensure_query_indexes(cursor)
+        _create_event_views(cursor)
+        conn.commit()
+        log.info("[DB] Ensured composite query indexes and event views")
 
         # Update version
         if current_version < target_version:
@@ -665,7 +1149,10 @@ def migrate_db():
         except sqlite3.OperationalError:
             current_version = 0
 
-        target_version = 2
+        # Same numbering as PostgreSQL: v3 adds is_proxy (v4 there); v5 composite
+        # indexes; v6 integer epoch-ms columns; v7 dimension tables; v8 monthly partitions;
+        # v9 rollup counters
+        target_version = 9
         
         if current_version >= target_version:
             conn.close()
@@ -674,77 +1161,38 @@ def migrate_db():
         log.info("[DB] Migrating SQLite database to version %d", target_version)
 
         # Ensure open_events table exists (may be missing on older installs)
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS open_events (
-                id              INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp       TEXT NOT NULL,
-                open_date       TEXT,
-                open_time       TEXT,
-                day_of_week     TEXT,
-                unix_ms         INTEGER,
-                track_id        TEXT,
-                campaign_id     TEXT,
-                sender          TEXT,
-                recipient       TEXT,
-                subject         TEXT,
-                sent_at         TEXT,
-                ip_address      TEXT,
-                country         TEXT,
-                region          TEXT,
-                city            TEXT,
-                latitude        REAL,
-                longitude       REAL,
-                timezone        TEXT,
-                isp             TEXT,
-                org             TEXT,
-                asn             TEXT,
-                user_agent      TEXT,
-                browser         TEXT,
-                browser_version TEXT,
-                os              TEXT,
-                os_version      TEXT,
-                device_type     TEXT,
-                device_brand    TEXT,
-                is_mobile       INTEGER,
-                is_bot          INTEGER,
-                referer         TEXT,
-                accept_language TEXT,
-                is_repeat       INTEGER DEFAULT 0,
-                is_forward      INTEGER DEFAULT 0,
-                fingerprint     TEXT
-            )
-        ''')
+        _create_event_tables(cursor)
         conn.commit()
         log.info("[DB] Ensured open_events table exists")
 
-        cursor.execute("PRAGMA table_info(tracks)")
-        existing_cols = {row[1] for row in cursor.fetchall()}
-
-        for col_name, col_type in _TRACKS_COLUMNS:
-            if col_name not in existing_cols:
-                try:
-                    conn.execute(
-                        f'ALTER TABLE tracks ADD COLUMN {col_name} {col_type}'
-                    )
-                    log.info("[DB] Added column: %s", col_name)
-                    conn.commit()
-                except Exception as e:
-                    log.error("[DB] Failed to add column %s: %s", col_name, e)
+        for table, columns in _MIGRATED_COLUMNS:
+            cursor.execute(f"PRAGMA table_info({table})")
+            existing_cols = {row[1] for row in cursor.fetchall()}
+
+            for col_name, col_type in columns:
+                if col_name not in existing_cols:
+                    try:
+                        conn.execute(
+                            f'ALTER TABLE {table} ADD COLUMN {col_name} {col_type}'
+                        )
+                        log.info("[DB] Added %s column: %s", table, col_name)
+                        conn.commit()
+                    except Exception as e:
+                        log.error("[DB] Failed to add %s column %s: %s", table, col_name, e)
+
+        _drop_event_views(cursor)          # recreated below, after the tables are rebuilt
+        _normalize_event_tables(conn, cursor)
+
+        _backfill_epoch_ms(cursor)
+        conn.commit()
 
-        # Migrate clicks table for SQLite
-        cursor.execute("PRAGMA table_info(clicks)")
-        existing_click_cols = {row[1] for row in cursor.fetchall()}
+        partition_event_tables(conn, cursor)
+        backfill_rollups(conn, cursor)
 
-        for col_name, col_type in _CLICKS_COLUMNS:
-            if col_name not in existing_click_cols:
-                try:
-                    conn.execute(
-                        f'ALTER TABLE clicks ADD COLUMN {col_name} {col_type}'
-                    )
-                    log.info("[DB] Added clicks column: %s", col_name)
-                    conn.commit()
-                except Exception as e:
-                    log.error("[DB] Failed to add clicks column %s: %s", col_name, e)
+        _ensure_query_indexes(cursor)
+        _create_event_views(cursor)
+        conn.commit()
+        log.info("[DB] Ensured composite query indexes and event views")
 
         # Update version
         if current_version < target_version:
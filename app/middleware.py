@@ -0,0 +1,115 @@
+"""
+naarad - WSGI Middleware
+Fast path for the open-tracking pixel.
+
+``/track``, ``/pixel`` and ``/t/<track_id>`` are by far the hottest routes,
+yet a 68-byte PNG does not need URL routing, request hooks, or the
+CSP / HSTS headers the dashboard gets. With PIXEL_FAST_PATH enabled this
+middleware answers those GET/HEAD requests before Flask dispatch: it parses
+the query string itself, reuses the tracking controller's enrichment
+(``record_open``) inside a bare app context, and returns a prebuilt body
+with a precomputed header list. Everything else is passed through untouched.
+"""
+import logging
+from urllib.parse import unquote_plus
+
+log = logging.getLogger(__name__)
+
+_PIXEL_PATHS = frozenset(('/track', '/pixel'))
+_T_PREFIX    = '/t/'
+
+
+def parse_query(qs: str) -> dict:
+    """First value per key, like ``request.args.get``; only decodes when needed."""
+    args = {}
+    if not qs:
+        return args
+    for pair in qs.split('&'):
+        if not pair:
+            continue
+        key, _, value = pair.partition('=')
+        if '%' in key or '+' in key:
+            key = unquote_plus(key)
+        if key in args:
+            continue
+        if '%' in value or '+' in value:
+            value = unquote_plus(value)
+        args[key] = value
+    return args
+
+
+class EnvironHeaders:
+    """Read-only ``.get`` view of the HTTP_* keys of a WSGI environ."""
+
+    __slots__ = ('_environ',)
+
+    def __init__(self, environ):
+        self._environ = environ
+
+    def get(self, name: str, default=None):
+        return self._environ.get('HTTP_' + name.upper().replace('-', '_'), default)
+
+
+class PixelFastPath:
+    """Answers pixel requests without Flask dispatch; delegates the rest."""
+
+    def __init__(self, app, wsgi_app, on_request=None):
+        from .controllers.tracking import PIXEL
+        self._app        = app
+        self._wsgi_app   = wsgi_app
+        self._on_request = on_request    # e.g. start background workers lazily
+        self._body       = [PIXEL]
+        common = [
+            ('Content-Type',           'image/png'),
+            ('Content-Length',         str(len(PIXEL))),
+            ('Cache-Control',          'no-cache, no-store, must-revalidate'),
+            ('Expires',                '0'),
+            ('X-Content-Type-Options', 'nosniff'),
+        ]
+        self._headers      = common + [
+            ('Accept-CH', 'Sec-CH-UA, Sec-CH-UA-Mobile, Sec-CH-UA-Platform'),
+        ]
+        self._headers_slim = common     # rate-limited: same pixel, no client hints
+
+    def _track_id(self, environ):
+        """Path track_id ('' for query-string forms), or None if not a pixel request."""
+        if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+            return None
+        path = environ.get('PATH_INFO', '')
+        if path in _PIXEL_PATHS:
+            return ''
+        if path.startswith(_T_PREFIX):
+            tid = path[len(_T_PREFIX):]
+            if tid and '/' not in tid:
+                return tid
+        return None
+
+    def __call__(self, environ, start_response):
+        path_tid = self._track_id(environ)
+        if path_tid is None:
+            return self._wsgi_app(environ, start_response)
+
+        from .controllers.tracking import client_ip, record_open, _is_rate_limited
+
+        if self._on_request is not None:
+            self._on_request()
+
+        headers = EnvironHeaders(environ)
+        ip      = client_ip(headers, environ.get('REMOTE_ADDR'))
+        response_headers = self._headers
+        if _is_rate_limited(ip):
+            log.warning("[TRACK] Rate limit hit for ip=%s", ip)
+            response_headers = self._headers_slim
+        else:
+            args = parse_query(environ.get('QUERY_STRING', ''))
+            try:
+                with self._app.app_context():
+                    record_open(path_tid or args.get('id', 'unknown'), ip, args, headers)
+            except Exception:
+                # Never break email rendering: the pixel is served regardless
+                log.exception("[TRACK] Fast-path open failed for ip=%s", ip)
+
+        start_response('200 OK', list(response_headers))
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return []
+        return self._body
@@ -0,0 +1,222 @@
+"""
+naarad - Dimension Interning
+Event rows (open_events, clicks) store small integer ids instead of repeating
+the raw User-Agent, the geo columns and the request headers on every row.
+
+Each dimension row is content-addressed: ``dim_key`` is a digest of all of
+its values, so the same (IP, location) or (UA, parsed fields) always maps to
+the same id, across workers and restarts. Ids are resolved through an
+in-process LRU per dimension; only cache misses touch the database (one
+INSERT ... ON CONFLICT DO NOTHING plus one SELECT per dimension and batch).
+
+Ids created inside a transaction are cached only once it commits
+(``DimBatch.publish``) — a rolled-back insert never leaves a dangling id.
+
+A 'Pending' geo row (deferred enrichment) is the one exception to content
+addressing: once its IP is resolved the row is rewritten and re-keyed
+(services/geo.py), so its id is never cached and every new Pending event
+looks its key up again.
+
+The ``open_events_v`` / ``clicks_v`` views join the dimensions back and
+expose the original wide column layout.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from ..config import Config
+
+log = logging.getLogger(__name__)
+
+UA_FIELDS = ('user_agent', 'browser', 'browser_version', 'os', 'os_version',
+             'device_type', 'device_brand', 'is_mobile', 'is_bot', 'is_proxy')
+GEO_FIELDS = ('ip_address', 'country', 'region', 'city', 'latitude', 'longitude',
+              'timezone', 'isp', 'org', 'asn')
+HEADER_FIELDS = ('referer', 'accept_language')
+
+# dimension -> (table, fields)
+DIMENSIONS = {
+    'ua':     ('ua_dim', UA_FIELDS),
+    'geo':    ('geo_dim', GEO_FIELDS),
+    'header': ('header_dim', HEADER_FIELDS),
+}
+
+_SELECT_CHUNK = 500
+_PENDING_COUNTRY = 'Pending'     # geo.py's deferred-enrichment placeholder
+
+
+def _cacheable(name: str, values) -> bool:
+    return not (name == 'geo' and values[1] == _PENDING_COUNTRY)
+
+
+def dim_key(values) -> str:
+    """Digest of a dimension tuple (None and '' are distinct)."""
+    raw = '\x1f'.join('\x00' if v is None else str(v) for v in values)
+    return hashlib.blake2b(raw.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+def _flag(value):
+    return None if value is None else int(bool(value))
+
+
+def _coord(value):
+    return None if value is None else float(value)
+
+
+def ua_values(ua: str, ua_info: dict) -> tuple:
+    return (ua, ua_info.get('browser'), ua_info.get('browser_version'),
+            ua_info.get('os'), ua_info.get('os_version'),
+            ua_info.get('device_type'), ua_info.get('device_brand'),
+            _flag(ua_info.get('is_mobile')), _flag(ua_info.get('is_bot')),
+            _flag(ua_info.get('is_proxy', False)))
+
+
+def geo_values(ip: str, geo: dict) -> tuple:
+    return (ip, geo.get('country'), geo.get('region'), geo.get('city'),
+            _coord(geo.get('lat')), _coord(geo.get('lon')),
+            geo.get('timezone'), geo.get('isp'), geo.get('org', ''), geo.get('asn', ''))
+
+
+def header_values(referer: str, accept_language: str = None) -> tuple:
+    return (referer, accept_language)
+
+
+def row_values(row: dict, fields) -> tuple:
+    """Dimension tuple from a wide row (migration, sync import)."""
+    values = tuple(row.get(f) for f in fields)
+    if fields is UA_FIELDS:
+        return values[:7] + tuple(_flag(v) for v in values[7:])
+    if fields is GEO_FIELDS:
+        return values[:4] + (_coord(values[4]), _coord(values[5])) + values[6:]
+    return values
+
+
+class _IdCache:
+    """LRU of dim_key -> id for one dimension."""
+
+    def __init__(self):
+        self._lock  = threading.Lock()
+        self._items = OrderedDict()
+        self.stats  = {'hits': 0, 'misses': 0, 'db_resolved': 0}
+
+    def get_many(self, keys) -> dict:
+        found = {}
+        with self._lock:
+            for key in keys:
+                dim_id = self._items.get(key)
+                if dim_id is not None:
+                    self._items.move_to_end(key)
+                    found[key] = dim_id
+            self.stats['hits']   += len(found)
+            self.stats['misses'] += len(keys) - len(found)
+        return found
+
+    def put_many(self, ids: dict, resolved: int = 0) -> None:
+        size = Config.DIM_CACHE_SIZE
+        with self._lock:
+            self.stats['db_resolved'] += resolved
+            if size <= 0:
+                return
+            for key, dim_id in ids.items():
+                self._items[key] = dim_id
+                self._items.move_to_end(key)
+            while len(self._items) > size:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, size=len(self._items))
+
+
+_caches = {name: _IdCache() for name in DIMENSIONS}
+_caches_db = None
+_caches_lock = threading.Lock()
+
+
+def _cache(name: str) -> _IdCache:
+    """Per-dimension cache; all are dropped when the process points at another database."""
+    global _caches_db
+    db = Config.DATABASE_URL or Config.DB_FILE
+    if db != _caches_db:
+        with _caches_lock:
+            if db != _caches_db:
+                for cache in _caches.values():
+                    cache.clear()
+                _caches_db = db
+    return _caches[name]
+
+
+class DimBatch:
+    """Resolves dimension ids for the events of one transaction."""
+
+    def __init__(self, cursor, P: str):
+        self._cursor = cursor
+        self._P      = P
+        self._new    = {name: {} for name in DIMENSIONS}
+        self._known  = {name: {} for name in DIMENSIONS}
+
+    def resolve(self, items: list) -> list:
+        """``[{dim: values}]`` -> ``[{dim: id}]`` (one round trip pair per dimension with misses)."""
+        keyed = [{name: dim_key(values) for name, values in item.items()} for item in items]
+        for name in DIMENSIONS:
+            wanted = {}
+            for item, keys in zip(items, keyed):
+                if name in item and keys[name] not in self._known[name]:
+                    wanted[keys[name]] = item[name]
+            if not wanted:
+                continue
+            cacheable = [k for k, v in wanted.items() if _cacheable(name, v)]
+            found = _cache(name).get_many(cacheable) if cacheable else {}
+            self._known[name].update(found)
+            missing = {k: v for k, v in wanted.items() if k not in found}
+            if missing:
+                new = self._fetch_or_insert(name, missing)
+                self._known[name].update(new)
+                self._new[name].update((k, i) for k, i in new.items() if _cacheable(name, missing[k]))
+        return [{name: self._known[name][key] for name, key in keys.items()} for keys in keyed]
+
+    def _fetch_or_insert(self, name: str, missing: dict) -> dict:
+        table, fields = DIMENSIONS[name]
+        P, cursor = self._P, self._cursor
+        cols = ('dim_key',) + fields
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join([P] * len(cols))}) "
+            f"ON CONFLICT (dim_key) DO NOTHING",
+            [(key,) + tuple(values) for key, values in missing.items()]
+        )
+        ids, keys = {}, list(missing)
+        for i in range(0, len(keys), _SELECT_CHUNK):
+            chunk = keys[i:i + _SELECT_CHUNK]
+            cursor.execute(
+                f"SELECT dim_key, id FROM {table} WHERE dim_key IN ({', '.join([P] * len(chunk))})",
+                tuple(chunk)
+            )
+            for r in cursor.fetchall():
+                if hasattr(r, 'keys'):
+                    ids[r['dim_key']] = r['id']
+                else:
+                    ids[r[0]] = r[1]
+        return ids
+
+    def publish(self) -> None:
+        """Cache the ids this batch created (call after commit)."""
+        for name, ids in self._new.items():
+            if ids:
+                _cache(name).put_many(ids, resolved=len(ids))
+        self._new = {name: {} for name in DIMENSIONS}
+
+
+def forget_dims() -> None:
+    """Drop every cached id (the dimension tables were rebuilt or emptied)."""
+    for cache in _caches.values():
+        cache.clear()
+
+
+def dim_cache_stats() -> dict:
+    """Hit / miss counters per dimension (db_resolved: ids fetched or created in the DB)."""
+    return {name: _cache(name).snapshot() for name in DIMENSIONS}
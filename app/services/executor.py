@@ -0,0 +1,164 @@
+"""
+naarad - Background Executor
+Shared pool of worker threads for fire-and-forget work. Tasks are queued
+per kind: 'geo' (per-track enrichment retries, services/geo.py) and
+'maintenance' (the scheduler's periodic jobs, services/maintenance.py).
+Webhook delivery keeps its own pool.
+
+Replaces thread-per-event spawning: the thread count is fixed, every kind
+has its own bounded queue, and workers take from the queues round-robin, so
+a flood of one kind cannot starve the others. Full queues drop tasks
+(counted) instead of growing memory.
+
+Every task runs in its own app context, so the DB connection it used goes
+back to the pool (or, on SQLite, the thread's kept connection is rolled back
+clean) as soon as the task ends instead of staying pinned to the worker.
+"""
+import atexit
+import logging
+import threading
+from collections import deque
+
+from ..config import Config
+
+log = logging.getLogger(__name__)
+
+
+class BackgroundExecutor:
+    """Fixed worker pool fed from bounded per-task-type queues (round-robin)."""
+
+    def __init__(self, app, workers: int, queue_size: int):
+        self._app        = app
+        self._queue_size = max(1, queue_size)
+        self._queues     = {}                  # kind -> deque of (fn, args)
+        self._order      = []                  # round-robin order of kinds
+        self._next       = 0
+        self._cond       = threading.Condition()
+        self._stopping   = False
+        self._stats      = {}
+        self._threads = [
+            threading.Thread(target=self._worker, name=f'naarad-bg-{i}', daemon=True)
+            for i in range(max(1, workers))
+        ]
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+
+    def is_alive(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def _kind_stats(self, kind):
+        stats = self._stats.get(kind)
+        if stats is None:
+            stats = self._stats[kind] = {
+                'submitted': 0, 'completed': 0, 'failed': 0, 'dropped': 0,
+            }
+            self._queues[kind] = deque()
+            self._order.append(kind)
+        return stats
+
+    def submit(self, kind: str, fn, *args) -> bool:
+        """Queue ``fn(*args)`` under ``kind``. Returns False if it was dropped."""
+        with self._cond:
+            stats = self._kind_stats(kind)
+            q = self._queues[kind]
+            if self._stopping or len(q) >= self._queue_size:
+                stats['dropped'] += 1
+                if stats['dropped'] % 100 == 1:
+                    log.warning("[BG] %s queue full (%d) — dropped %d task(s) so far",
+                                kind, self._queue_size, stats['dropped'])
+                return False
+            q.append((fn, args))
+            stats['submitted'] += 1
+            self._cond.notify()
+        return True
+
+    def _take(self):
+        """Next task in round-robin order across kinds; None once drained and stopping."""
+        with self._cond:
+            while True:
+                for _ in range(len(self._order)):
+                    kind = self._order[self._next % len(self._order)]
+                    self._next += 1
+                    if self._queues[kind]:
+                        fn, args = self._queues[kind].popleft()
+                        return kind, fn, args
+                if self._stopping:
+                    return None
+                self._cond.wait()
+
+    def _worker(self):
+        while True:
+            task = self._take()
+            if task is None:
+                return
+            kind, fn, args = task
+            try:
+                # close_db (teardown) releases the task's connection when the context pops
+                with self._app.app_context():
+                    fn(*args)
+                ok = True
+            except Exception as e:
+                ok = False
+                log.warning("[BG] %s task failed: %s", kind, e)
+            with self._cond:
+                self._stats[kind]['completed' if ok else 'failed'] += 1
+
+    def stop(self, timeout: float = 5.0):
+        """Finish queued tasks, then stop the workers."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                kind: dict(s, queued=len(self._queues[kind]))
+                for kind, s in self._stats.items()
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def start_executor(app):
+    """Start the shared worker pool (after Gunicorn has forked)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None and _executor.is_alive():
+            return
+        _executor = BackgroundExecutor(
+            app, Config.BACKGROUND_WORKERS, Config.BACKGROUND_QUEUE_SIZE
+        )
+        _executor.start()
+
+
+def stop_executor(timeout: float = 5.0):
+    """Drain and stop the shared pool (registered with atexit)."""
+    global _executor
+    with _executor_lock:
+        ex, _executor = _executor, None
+    if ex is not None:
+        ex.stop(timeout)
+
+
+atexit.register(stop_executor)
+
+
+def submit(kind: str, fn, *args) -> bool:
+    """Run ``fn(*args)`` on the shared pool. False if not running or the queue is full."""
+    ex = _executor
+    if ex is None:
+        log.debug("[BG] Executor not running — dropped %s task", kind)
+        return False
+    return ex.submit(kind, fn, *args)
+
+
+def executor_stats() -> dict:
+    """Per-task-type counters: submitted, completed, failed, dropped, queued."""
+    ex = _executor
+    return ex.stats() if ex is not None else {}
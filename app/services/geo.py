@@ -1,39 +1,39 @@
 """
 naarad - Geolocation Service
 IP geolocation with caching, rate-limit handling, circuit breaker, and proper private IP detection.
+
+GEO_ENRICH_MODE=deferred keeps the remote lookup off the request path: events
+are stored with a 'Pending' geo placeholder and a background enricher resolves
+each IP once and back-fills tracks and the geo_dim rows open_events / clicks
+reference.
+
+Remote misses are coalesced: concurrent requests for one IP share a single
+in-flight lookup, and misses for different IPs arriving within
+GEO_BATCH_WINDOW_MS are resolved together through the provider's batch
+endpoint (up to GEO_BATCH_SIZE per call).
 """
 
 import json
 import logging
-import ipaddress
+import queue
 import threading
+import time
 import urllib.request
 import urllib.error
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from ..config import Config
 from ..database import get_db, get_cursor, placeholder, USE_POSTGRES
 from ..utils import now, now_iso
+from .executor import submit
+from .geodb import get_offline_db
+from .netclass import PRIVATE, classify, is_private
+from .dims import GEO_FIELDS, dim_key, geo_values
+from .stats import bump_data_version
 
 log = logging.getLogger(__name__)
 
 
-# Private / non-routable IPv4 networks
-_PRIVATE_NETS_V4 = [
-    ipaddress.ip_network('0.0.0.0/8'),
-    ipaddress.ip_network('10.0.0.0/8'),
-    ipaddress.ip_network('100.64.0.0/10'),   # CGNAT
-    ipaddress.ip_network('127.0.0.0/8'),
-    ipaddress.ip_network('169.254.0.0/16'),  # Link-local
-    ipaddress.ip_network('172.16.0.0/12'),   # Correct private range
-    ipaddress.ip_network('192.0.0.0/24'),
-    ipaddress.ip_network('192.168.0.0/16'),
-    ipaddress.ip_network('198.18.0.0/15'),
-    ipaddress.ip_network('198.51.100.0/24'),
-    ipaddress.ip_network('203.0.113.0/24'),
-    ipaddress.ip_network('240.0.0.0/4'),
-    ipaddress.ip_network('255.255.255.255/32'),
-]
-
 _UNKNOWN_GEO = {
     'country': 'Unknown', 'region': 'Unknown', 'city': 'Unknown',
     'lat': 0.0, 'lon': 0.0, 'timezone': 'Unknown', 'isp': 'Unknown',
@@ -46,6 +46,12 @@ _LOCAL_GEO = {
     'org': '', 'asn': ''
 }
 
+_PENDING_GEO = {
+    'country': 'Pending', 'region': 'Pending', 'city': 'Pending',
+    'lat': 0.0, 'lon': 0.0, 'timezone': 'Pending', 'isp': 'Pending',
+    'org': '', 'asn': ''
+}
+
 # ── Circuit Breaker State (R-03) ─────────────────────────────────────────
 _cb_lock = threading.Lock()
 _cb_failures = 0
@@ -82,120 +88,171 @@ def _cb_is_open():
         return False
 
 
-def _is_private_ip(ip_str: str) -> bool:
-    """Return True if the IP is private, loopback, link-local, or non-routable."""
-    if not ip_str:
-        return True
-    try:
-        addr = ipaddress.ip_address(ip_str)
-        if addr.version == 6:
-            # Loopback (::1), link-local (fe80::/10), unique-local (fc00::/7)
-            return addr.is_loopback or addr.is_link_local or addr.is_private or addr.is_unspecified
-        # IPv4 — check against all known private/reserved ranges
-        return any(addr in net for net in _PRIVATE_NETS_V4)
-    except ValueError:
-        return True  # Unparseable → treat as local
-
-
-def _cleanup_expired_cache(conn, cursor, P):
-    """Remove stale geo_cache entries older than GEO_CACHE_MINUTES."""
-    try:
-        cutoff = (now() - timedelta(minutes=Config.GEO_CACHE_MINUTES)).isoformat()
-        cursor.execute(
-            f'DELETE FROM geo_cache WHERE cached_at < {P}', (cutoff,)
-        )
-        conn.commit()
-    except Exception as e:
-        log.debug("[GEO] Cache cleanup failed: %s", e)
-
-
-def get_geo_info(ip):
-    """Get geolocation from IP with caching, circuit breaker, and rate-limit resilience."""
-
-    if _is_private_ip(ip):
-        return _LOCAL_GEO.copy()
+def purge_expired_geo_cache(chunk=None):
+    """
+    Delete geo_cache rows older than GEO_CACHE_MINUTES in LIMITed chunks.
 
+    Each chunk is its own short transaction (and an index range scan on
+    cached_at), so writers are never blocked behind one big DELETE. Runs
+    from the maintenance scheduler, never on the request path. Returns the
+    number of rows removed.
+    """
+    chunk = chunk or Config.GEO_CACHE_PURGE_CHUNK
+    cutoff = (now() - timedelta(minutes=Config.GEO_CACHE_MINUTES)).isoformat()
     conn = get_db()
     cursor = get_cursor(conn)
     P = placeholder()
-
-    # ── Cache Lookup ─────────────────────────────────────────────────────
+    deleted = 0
+    while True:
+        cursor.execute(
+            f'''DELETE FROM geo_cache WHERE ip_address IN (
+                   SELECT ip_address FROM geo_cache WHERE cached_at < {P} LIMIT {P})''',
+            (cutoff, chunk)
+        )
+        conn.commit()
+        deleted += cursor.rowcount
+        if cursor.rowcount < chunk:
+            return deleted
+
+
+# ── In-process geo cache (tier 1) ───────────────────────────────────────
+# Decoded geo dicts per IP in front of the geo_cache table (tier 2). Failed
+# lookups are cached briefly as negative entries so a burst for one IP
+# does not hammer the API (or the breaker) once per request.
+
+class _GeoMemoryCache:
+    """Thread-safe LRU of ip -> (expires_at, geo or None for negative)."""
+
+    def __init__(self):
+        self._lock  = threading.Lock()
+        self._items = OrderedDict()
+        self.stats  = {'memory_hits': 0, 'negative_hits': 0, 'db_hits': 0,
+                       'remote_lookups': 0, 'remote_failures': 0,
+                       'coalesced': 0, 'remote_requests': 0}
+
+    def get(self, ip):
+        """(found, geo) — geo is None for a cached failure."""
+        now_ts = time.time()
+        with self._lock:
+            item = self._items.get(ip)
+            if item is None:
+                return False, None
+            expires_at, geo = item
+            if expires_at <= now_ts:
+                del self._items[ip]
+                return False, None
+            self._items.move_to_end(ip)
+            self.stats['memory_hits' if geo is not None else 'negative_hits'] += 1
+            return True, (geo.copy() if geo is not None else None)
+
+    def put(self, ip, geo, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._items[ip] = (time.time() + ttl, geo.copy() if geo is not None else None)
+            self._items.move_to_end(ip)
+            while len(self._items) > Config.GEO_MEMORY_CACHE_SIZE:
+                self._items.popitem(last=False)
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats, size=len(self._items))
+        lookups = stats['memory_hits'] + stats['negative_hits'] + stats['db_hits'] + stats['remote_lookups']
+        stats['memory_hit_ratio'] = round(
+            (stats['memory_hits'] + stats['negative_hits']) / lookups, 4) if lookups else 0.0
+        db_lookups = lookups - stats['memory_hits'] - stats['negative_hits']
+        stats['db_hit_ratio'] = round(stats['db_hits'] / db_lookups, 4) if db_lookups else 0.0
+        return stats
+
+
+_mem_cache = _GeoMemoryCache()
+
+
+def geo_cache_stats():
+    """Hit counters and ratios of the memory and geo_cache tiers."""
+    return _mem_cache.snapshot()
+
+
+def _db_cache_get(cursor, P, ip):
+    """(geo, remaining_ttl_seconds) from geo_cache, or None if missing/expired."""
     try:
         cursor.execute(
             f'SELECT data, cached_at FROM geo_cache WHERE ip_address = {P}', (ip,)
         )
         row = cursor.fetchone()
-
-        if row:
-            cached_data = row['data'] if hasattr(row, 'keys') else row[0]
-            cached_at = row['cached_at'] if hasattr(row, 'keys') else row[1]
-            try:
-                cached_time = datetime.fromisoformat(cached_at.replace('Z', '+00:00'))
-                if now() - cached_time < timedelta(minutes=Config.GEO_CACHE_MINUTES):
-                    return json.loads(cached_data)
-            except ValueError:
-                pass
+        if not row:
+            return None
+        cached_data = row['data'] if hasattr(row, 'keys') else row[0]
+        cached_at = row['cached_at'] if hasattr(row, 'keys') else row[1]
+        try:
+            cached_time = datetime.fromisoformat(cached_at.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        remaining = timedelta(minutes=Config.GEO_CACHE_MINUTES) - (now() - cached_time)
+        if remaining.total_seconds() <= 0:
+            return None
+        return json.loads(cached_data), remaining.total_seconds()
     except Exception as e:
         log.debug("[GEO] Cache read error: %s", e)
+        return None
 
-    # ── Circuit Breaker Check (R-03) ─────────────────────────────────────
-    if _cb_is_open():
-        log.debug("[GEO] Circuit breaker open — skipping external lookup for ip=%s", ip)
-        return _UNKNOWN_GEO.copy()
 
-    # ── External Lookup ──────────────────────────────────────────────────
+def _db_cache_put(conn, cursor, P, ip, result):
+    """Upsert a successful lookup into geo_cache."""
+    timestamp = now_iso()
+    json_data = json.dumps(result)
+    try:
+        if USE_POSTGRES:
+            cursor.execute(f'''
+                INSERT INTO geo_cache (ip_address, data, cached_at)
+                VALUES ({P}, {P}, {P})
+                ON CONFLICT (ip_address)
+                DO UPDATE SET data = EXCLUDED.data, cached_at = EXCLUDED.cached_at
+            ''', (ip, json_data, timestamp))
+        else:
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO geo_cache (ip_address, data, cached_at)
+                VALUES ({P}, {P}, {P})
+            ''', (ip, json_data, timestamp))
+        conn.commit()
+    except Exception as e:
+        log.debug("[GEO] Cache write error: %s", e)
+
+
+_API_FIELDS = 'status,message,query,country,regionName,city,lat,lon,timezone,isp,org,as'
+
+
+def _geo_from_api(data):
+    """Map one ip-api.com result object onto our geo dict."""
+    return {
+        'country':  data.get('country', 'Unknown'),
+        'region':   data.get('regionName', 'Unknown'),
+        'city':     data.get('city', 'Unknown'),
+        'lat':      data.get('lat', 0.0),
+        'lon':      data.get('lon', 0.0),
+        'timezone': data.get('timezone', 'Unknown'),
+        'isp':      data.get('isp', 'Unknown'),
+        'org':      data.get('org', ''),
+        'asn':      data.get('as', ''),
+    }
+
+
+def _fetch_remote(ip):
+    """One lookup against GEO_API_URL. Returns the geo dict, or None on failure."""
     try:
         base_url = Config.GEO_API_URL
-        url = (
-            f'{base_url}/{ip}'
-            '?fields=status,message,country,regionName,city,lat,lon,timezone,isp,org,as'
-        )
+        url = f'{base_url}/{ip}?fields={_API_FIELDS}'
         req = urllib.request.Request(url, headers={'User-Agent': 'naarad/1.0'})
         with urllib.request.urlopen(req, timeout=3) as response:
             data = json.loads(response.read().decode())
 
         if data.get('status') == 'success':
             _cb_record_success()
-            result = {
-                'country':  data.get('country', 'Unknown'),
-                'region':   data.get('regionName', 'Unknown'),
-                'city':     data.get('city', 'Unknown'),
-                'lat':      data.get('lat', 0.0),
-                'lon':      data.get('lon', 0.0),
-                'timezone': data.get('timezone', 'Unknown'),
-                'isp':      data.get('isp', 'Unknown'),
-                'org':      data.get('org', ''),
-                'asn':      data.get('as', ''),
-            }
-
-            # ── Cache Write (upsert) ──────────────────────────────────────
-            is_postgres = USE_POSTGRES
-            timestamp = now_iso()
-            json_data = json.dumps(result)
-
-            try:
-                if is_postgres:
-                    cursor.execute(f'''
-                        INSERT INTO geo_cache (ip_address, data, cached_at)
-                        VALUES ({P}, {P}, {P})
-                        ON CONFLICT (ip_address)
-                        DO UPDATE SET data = EXCLUDED.data, cached_at = EXCLUDED.cached_at
-                    ''', (ip, json_data, timestamp))
-                else:
-                    cursor.execute(f'''
-                        INSERT OR REPLACE INTO geo_cache (ip_address, data, cached_at)
-                        VALUES ({P}, {P}, {P})
-                    ''', (ip, json_data, timestamp))
-                conn.commit()
-
-                # Probabilistic cleanup (1-in-50 instead of every write)
-                import random
-                if random.randint(1, 50) == 1:
-                    _cleanup_expired_cache(conn, cursor, P)
-            except Exception as e:
-                log.debug("[GEO] Cache write error: %s", e)
-
-            return result
+            return _geo_from_api(data)
 
         # Rate-limited or API failure
         _cb_record_failure()
@@ -208,40 +265,527 @@ def get_geo_info(ip):
     except Exception as e:
         _cb_record_failure()
         log.warning("[GEO] Lookup error for ip=%s: %s", ip, e)
+    return None
+
+
+def _fetch_remote_batch(ips):
+    """
+    Resolve several IPs with one POST to GEO_BATCH_URL. Returns {ip: geo or None}.
+
+    Only a transport / HTTP failure counts against the circuit breaker; a
+    per-entry 'fail' (reserved range, bad query) is just a miss for that IP.
+    """
+    results = dict.fromkeys(ips)
+    try:
+        body = json.dumps(list(ips)).encode()
+        req = urllib.request.Request(
+            f'{Config.GEO_BATCH_URL}?fields={_API_FIELDS}', data=body, method='POST',
+            headers={'User-Agent': 'naarad/1.0', 'Content-Type': 'application/json'}
+        )
+        with urllib.request.urlopen(req, timeout=5) as response:
+            data = json.loads(response.read().decode())
+        _cb_record_success()
+        for ip, entry in zip(ips, data):
+            if entry.get('status') == 'success':
+                results[ip] = _geo_from_api(entry)
+    except urllib.error.HTTPError as e:
+        _cb_record_failure()
+        log.warning("[GEO] Batch HTTP error %s for %d ip(s)", e.code, len(ips))
+    except Exception as e:
+        _cb_record_failure()
+        log.warning("[GEO] Batch lookup error for %d ip(s): %s", len(ips), e)
+    return results
+
+
+def _fetch_many(ips):
+    """{ip: geo or None}; a lone IP uses the single endpoint (separate, larger quota)."""
+    _mem_cache.count('remote_requests')
+    if len(ips) == 1:
+        return {ips[0]: _fetch_remote(ips[0])}
+    return _fetch_remote_batch(ips)
+
+
+# ── Request coalescing ──────────────────────────────────────────────────
+# Waiters never block longer than the slowest possible remote call.
+_FLIGHT_TIMEOUT = 10.0
+
+
+class _Flight:
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event  = threading.Event()
+        self.result = None
+
 
-    return _UNKNOWN_GEO.copy()
+class _SingleFlight:
+    """At most one call per key in progress; concurrent callers share its result."""
 
+    def __init__(self):
+        self._lock  = threading.Lock()
+        self._calls = {}
 
-def enrich_track_async(app, track_id, ip):
-    """Enrich a track record with geo data in a background thread.
+    def do(self, key, fn):
+        """(result, shared) — ``shared`` is True if another caller did the work."""
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Flight()
+        if not leader:
+            flight.event.wait(_FLIGHT_TIMEOUT)
+            return flight.result, True
+        try:
+            flight.result = fn()
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            flight.event.set()
+        return flight.result, False
+
+
+class _BatchResolver:
+    """
+    Collects remote misses for GEO_BATCH_WINDOW_MS and resolves them together.
+
+    Request threads only queue their IP and wait (at most _FLIGHT_TIMEOUT) for
+    its answer. A dedicated resolver thread, started on first use, sleeps for
+    the window after the first miss arrives, then drains the pending IPs in
+    GEO_BATCH_SIZE chunks, picking up anything that arrived meanwhile.
+    """
+
+    def __init__(self):
+        self._cond    = threading.Condition()
+        self._pending = OrderedDict()      # ip -> _Flight
+        self._thread  = None
+
+    def fetch(self, ip):
+        window = Config.GEO_BATCH_WINDOW_MS / 1000.0
+        if window <= 0:
+            return _fetch_many([ip])[ip]
+        with self._cond:
+            flight = self._pending.get(ip)
+            if flight is None:
+                flight = self._pending[ip] = _Flight()
+            # Started lazily: a thread from before fork() is not alive in the child
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='naarad-geo-batch', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        flight.event.wait(_FLIGHT_TIMEOUT)
+        return flight.result
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(Config.GEO_BATCH_WINDOW_MS / 1000.0)
+            self._drain()
+
+    def _drain(self):
+        size = max(1, Config.GEO_BATCH_SIZE)
+        while True:
+            with self._cond:
+                if not self._pending:
+                    return
+                ips = []
+                while self._pending and len(ips) < size:
+                    ips.append(self._pending.popitem(last=False))
+            results = {}
+            try:
+                results = _fetch_many([ip for ip, _ in ips])
+            except Exception as e:
+                log.warning("[GEO] Batch lookup of %d ip(s) failed: %s", len(ips), e)
+            finally:
+                for ip, flight in ips:
+                    flight.result = results.get(ip)
+                    flight.event.set()
+
+
+_flights = _SingleFlight()
+_batcher = _BatchResolver()
+
+
+def _lookup_cached(cursor, P, ip, use_negative=True):
+    """(geo, resolved) from the memory tier or geo_cache, or None on a miss."""
+    found, geo = _mem_cache.get(ip)
+    if found and geo is not None:
+        return geo, True
+    if found and use_negative:
+        return _UNKNOWN_GEO.copy(), False
+    cached = _db_cache_get(cursor, P, ip)
+    if cached:
+        geo, remaining = cached
+        _mem_cache.count('db_hits')
+        _mem_cache.put(ip, geo, min(remaining, Config.GEO_CACHE_MINUTES * 60))
+        return geo, True
+    return None
+
+
+def _store_remote(conn, cursor, P, ip, result):
+    """Cache a remote answer in both tiers (failures only briefly, in memory)."""
+    if result is None:
+        _mem_cache.count('remote_failures')
+        _mem_cache.put(ip, None, Config.GEO_NEGATIVE_CACHE_SECONDS)
+        return
+    _db_cache_put(conn, cursor, P, ip, result)
+    _mem_cache.put(ip, result, Config.GEO_CACHE_MINUTES * 60)
+
+
+def _lookup_offline(ip):
+    """Resolve from the compiled range DB (microseconds, no cache needed)."""
+    db = get_offline_db(Config.GEO_OFFLINE_DB)
+    if db is None:
+        return _UNKNOWN_GEO.copy(), False     # DB missing: keep deferred rows Pending
+    geo = db.lookup(ip)
+    if geo is None:
+        return _UNKNOWN_GEO.copy(), True      # definitive: range not covered
+    return geo, True
+
+
+def lookup_geo(ip, use_negative=True):
+    """
+    Resolve a public IP through memory cache -> geo_cache -> remote API.
+
+    Returns (geo, resolved): ``resolved`` is False when the answer is the
+    Unknown placeholder from a failed (or negatively cached) lookup.
+    ``use_negative=False`` ignores a cached failure and asks the API again
+    (the background retry of a track whose inline lookup just failed).
+
+    With GEO_PROVIDER=offline the local range database answers instead and
+    no network call is ever made.
+    """
+    if Config.GEO_PROVIDER == 'offline':
+        return _lookup_offline(ip)
+
+    conn = get_db()
+    cursor = get_cursor(conn)
+    P = placeholder()
+
+    cached = _lookup_cached(cursor, P, ip, use_negative)
+    if cached:
+        return cached
+
+    # ── Circuit Breaker Check (R-03) ─────────────────────────────────────
+    if _cb_is_open():
+        log.debug("[GEO] Circuit breaker open — skipping external lookup for ip=%s", ip)
+        _mem_cache.put(ip, None, Config.GEO_NEGATIVE_CACHE_SECONDS)
+        return _UNKNOWN_GEO.copy(), False
+
+    def resolve():
+        _mem_cache.count('remote_lookups')
+        result = _batcher.fetch(ip)
+        _store_remote(conn, cursor, P, ip, result)
+        return result
+
+    result, shared = _flights.do(ip, resolve)
+    if shared:
+        _mem_cache.count('coalesced')
+    if result is None:
+        return _UNKNOWN_GEO.copy(), False
+    return (result.copy() if shared else result), True
+
+
+def lookup_many(ips, use_negative=True):
+    """
+    Resolve several public IPs; every remote miss goes out in batch calls.
+
+    Returns {ip: (geo, resolved)} with the same meaning as lookup_geo().
+    """
+    if Config.GEO_PROVIDER == 'offline':
+        return {ip: _lookup_offline(ip) for ip in ips}
+
+    conn = get_db()
+    cursor = get_cursor(conn)
+    P = placeholder()
+    out, misses = {}, []
+    for ip in dict.fromkeys(ips):
+        cached = _lookup_cached(cursor, P, ip, use_negative)
+        if cached:
+            out[ip] = cached
+        else:
+            misses.append(ip)
+
+    size = max(1, Config.GEO_BATCH_SIZE)
+    for i in range(0, len(misses), size):
+        chunk = misses[i:i + size]
+        if _cb_is_open():
+            results = {}
+        else:
+            _mem_cache.count('remote_lookups', len(chunk))
+            results = _fetch_many(chunk)
+        for ip in chunk:
+            result = results.get(ip)
+            _store_remote(conn, cursor, P, ip, result)
+            out[ip] = (result, True) if result is not None else (_UNKNOWN_GEO.copy(), False)
+    return out
+
+
+def get_geo_info(ip):
+    """Get geolocation from IP with caching, circuit breaker, and rate-limit resilience."""
+    if is_private(ip):
+        return _LOCAL_GEO.copy()
+    return lookup_geo(ip)[0]
+
+
+def network_geo(label):
+    """Geo for a known proxy / scanner network: no location, the operator as ISP."""
+    return dict(_UNKNOWN_GEO, isp=label, org=label)
+
+
+def request_geo(ip, net=None):
+    """Geo for the request path.
+
+    ``net`` is the caller's classify(ip) result, if it already has one.
+    Private IPs resolve locally and proxy / scanner networks are never sent
+    to the geo API (their location is the operator's, not the reader's).
+    Otherwise the lookup runs inline, or — with GEO_ENRICH_MODE=deferred — a
+    'Pending' placeholder is returned and the event is back-filled later by
+    the enricher.
+    """
+    if net is None:
+        net = classify(ip)
+    if net is not None:
+        return _LOCAL_GEO.copy() if net[0] == PRIVATE else network_geo(net[1])
+    if Config.GEO_ENRICH_MODE == 'deferred':
+        return _PENDING_GEO.copy()
+    return get_geo_info(ip)
+
+
+def is_pending(geo):
+    """True if this geo dict is the deferred-enrichment placeholder."""
+    return geo.get('country') == _PENDING_GEO['country']
+
+
+def _enrich_track(track_id, ip):
+    """Fill geo columns of a track whose inline lookup came back Unknown."""
+    # The failed inline lookup left a negative entry for this IP: bypass it
+    geo = _LOCAL_GEO.copy() if is_private(ip) else lookup_geo(ip, use_negative=False)[0]
+    if geo['country'] == 'Unknown' and geo['city'] == 'Unknown':
+        return  # No useful data to enrich with
+
+    conn = get_db()
+    cursor = get_cursor(conn)
+    P = placeholder()
+    cursor.execute(
+        f'''UPDATE tracks SET 
+            country = {P}, region = {P}, city = {P}, 
+            latitude = {P}, longitude = {P}, timezone = {P},
+            isp = {P}, org = {P}, asn = {P}
+        WHERE track_id = {P} AND (country IS NULL OR country = 'Unknown')''',
+        (geo['country'], geo['region'], geo['city'],
+         geo['lat'], geo['lon'], geo['timezone'],
+         geo['isp'], geo.get('org', ''), geo.get('asn', ''),
+         track_id)
+    )
+    changed = cursor.rowcount > 0
+    conn.commit()
+    if changed:
+        bump_data_version(conn, cursor)
+
+
+def enrich_track_async(track_id, ip):
+    """Enrich a track record with geo data on the shared background pool.
     
     Called after the pixel/click response is already sent.
     Used only when the track was created without geo data.
     """
-    def _do_enrich():
-        try:
-            with app.app_context():
-                geo = get_geo_info(ip)
-                if geo['country'] == 'Unknown' and geo['city'] == 'Unknown':
-                    return  # No useful data to enrich with
+    submit('geo', _enrich_track, track_id, ip)
+
+
+# ── Deferred Enrichment Pipeline ─────────────────────────────────────────
+
+# Events reach their geo through geo_dim (services/dims.py). The Pending
+# geo_dim row is rewritten in place, so every event pointing at it picks up the
+# resolved location, and re-keyed on the new values: a later event from the
+# same IP hashes to the Pending key again and gets a fresh row to enrich.
+_TRACK_GEO_COLUMNS = ('country', 'region', 'city', 'latitude', 'longitude',
+                      'timezone', 'isp', 'org', 'asn')
+_GEO_KEYS = {'latitude': 'lat', 'longitude': 'lon'}
+
+
+def _rekey_pending_dims(cursor, P, ip, geo):
+    cursor.execute(
+        f"SELECT id FROM geo_dim WHERE ip_address = {P} AND country = {P}",
+        (ip, _PENDING_GEO['country'])
+    )
+    pending = [r['id'] if hasattr(r, 'keys') else r[0] for r in cursor.fetchall()]
+    if not pending:
+        return
+    values = geo_values(ip, geo)
+    key = dim_key(values)
+    cursor.execute(f"SELECT 1 FROM geo_dim WHERE dim_key = {P}", (key,))
+    taken = cursor.fetchone() is not None
+    set_clause = ', '.join(f'{c} = {P}' for c in ('dim_key',) + GEO_FIELDS)
+    for dim_id in pending:
+        # An identical row exists already: retire this one's key instead (never looked up)
+        new_key = f'resolved-{dim_id}' if taken else key
+        taken = True
+        cursor.execute(f"UPDATE geo_dim SET {set_clause} WHERE id = {P}", (new_key, *values, dim_id))
+
+
+def backfill_pending_geo(conn, cursor, ip, geo):
+    """Replace the 'Pending' placeholder on every row captured from this IP."""
+    P = placeholder()
+    set_clause = ', '.join(f'{c} = {P}' for c in _TRACK_GEO_COLUMNS)
+    cursor.execute(
+        f"UPDATE tracks SET {set_clause} WHERE ip_address = {P} AND country = {P}",
+        (*(geo.get(_GEO_KEYS.get(c, c), '') for c in _TRACK_GEO_COLUMNS), ip, _PENDING_GEO['country'])
+    )
+    changed = cursor.rowcount > 0
+    _rekey_pending_dims(cursor, P, ip, geo)
+    conn.commit()
+    if changed:
+        bump_data_version(conn, cursor)
+
+
+_SWEEP_LIMIT = 500
+_RETRY_BACKOFF_MAX = 3600.0     # seconds
+
+
+class _GeoEnricher:
+    """Single background thread that resolves queued IPs and back-fills rows.
+
+    IPs are de-duplicated while queued and taken off the queue up to
+    GEO_BATCH_SIZE at a time, so a burst costs one batch API call. Anything dropped (queue full, circuit
+    breaker open, process restart) is picked up again by the sweep over rows
+    still marked 'Pending', which runs every GEO_ENRICH_SWEEP_INTERVAL even
+    while traffic keeps the queue busy. It pages through those IPs in order,
+    so a full page cannot hide the rest.
+
+    An IP the provider cannot resolve is retried with doubling backoff; after
+    GEO_ENRICH_MAX_ATTEMPTS its rows are marked Unknown and no longer swept.
+    """
 
+    def __init__(self, app):
+        self._app    = app
+        self._queue  = queue.Queue(maxsize=max(1, Config.GEO_ENRICH_QUEUE_SIZE))
+        self._queued = set()
+        self._lock   = threading.Lock()
+        self._failures   = {}           # ip -> (failed attempts, monotonic time of next retry)
+        self._last_sweep = time.monotonic()
+        self._sweep_from = ''           # resume point of the next sweep page
+        self._thread = threading.Thread(target=self._run, name='naarad-geo', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def offer(self, ip):
+        with self._lock:
+            if ip in self._queued:
+                return
+            failed = self._failures.get(ip)
+            if failed and failed[1] > time.monotonic():
+                return   # backing off; a later sweep offers it again
+            try:
+                self._queue.put_nowait(ip)
+            except queue.Full:
+                return   # the sweep will find it
+            self._queued.add(ip)
+
+    def _run(self):
+        log.info("[GEO] Deferred enrichment worker started")
+        while True:
+            due = self._last_sweep + Config.GEO_ENRICH_SWEEP_INTERVAL - time.monotonic()
+            if due <= 0:
+                self._last_sweep = time.monotonic()
+                self._sweep()
+                continue
+            try:
+                ip = self._queue.get(timeout=due)
+            except queue.Empty:
+                continue
+            ips = [ip]
+            while len(ips) < Config.GEO_BATCH_SIZE:
+                try:
+                    ips.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self._lock:
+                self._queued.difference_update(ips)
+            self._resolve(ips)
+
+    def _resolve(self, ips):
+        if _cb_is_open():
+            return   # leave them Pending; retried by the sweep after cooldown
+        try:
+            with self._app.app_context():
+                results = lookup_many(ips, use_negative=False)   # retries follow our own backoff
                 conn = get_db()
                 cursor = get_cursor(conn)
-                P = placeholder()
+                for ip, (geo, resolved) in results.items():
+                    if not resolved:
+                        if _cb_is_open() or not self._failed(ip):
+                            continue   # keep it Pending until its next retry
+                        geo = _UNKNOWN_GEO.copy()
+                    else:
+                        with self._lock:
+                            self._failures.pop(ip, None)
+                    try:
+                        backfill_pending_geo(conn, cursor, ip, geo)
+                    except Exception as e:
+                        conn.rollback()
+                        log.warning("[GEO] Back-fill failed for ip=%s: %s", ip, e)
+        except Exception as e:
+            log.warning("[GEO] Geo resolution failed for %d ip(s): %s", len(ips), e)
+
+    def _failed(self, ip) -> bool:
+        """Record a failed lookup; True once the IP should be given up on."""
+        with self._lock:
+            attempts = self._failures.get(ip, (0, 0.0))[0] + 1
+            if attempts >= Config.GEO_ENRICH_MAX_ATTEMPTS:
+                self._failures.pop(ip, None)
+                log.info("[GEO] Giving up on ip=%s after %d failed lookups", ip, attempts)
+                return True
+            delay = min(Config.GEO_ENRICH_SWEEP_INTERVAL * 2 ** (attempts - 1), _RETRY_BACKOFF_MAX)
+            self._failures[ip] = (attempts, time.monotonic() + delay)
+            return False
+
+    def _sweep(self):
+        """Re-queue the next page of IPs whose rows are still Pending (partial index keeps this cheap)."""
+        P = placeholder()
+        pending = _PENDING_GEO['country']
+        try:
+            with self._app.app_context():
+                cursor = get_cursor(get_db())
                 cursor.execute(
-                    f'''UPDATE tracks SET 
-                        country = {P}, region = {P}, city = {P}, 
-                        latitude = {P}, longitude = {P}, timezone = {P},
-                        isp = {P}, org = {P}, asn = {P}
-                    WHERE track_id = {P} AND (country IS NULL OR country = 'Unknown')''',
-                    (geo['country'], geo['region'], geo['city'],
-                     geo['lat'], geo['lon'], geo['timezone'],
-                     geo['isp'], geo.get('org', ''), geo.get('asn', ''),
-                     track_id)
+                    f'''SELECT ip_address FROM tracks WHERE country = {P} AND ip_address > {P}
+                        UNION SELECT ip_address FROM geo_dim WHERE country = {P} AND ip_address > {P}
+                        ORDER BY ip_address LIMIT {_SWEEP_LIMIT}''',
+                    (pending, self._sweep_from, pending, self._sweep_from)
                 )
-                conn.commit()
+                ips = [r['ip_address'] if hasattr(r, 'keys') else r[0] for r in cursor.fetchall()]
         except Exception as e:
-            log.debug("[GEO] Background enrichment failed for track_id=%s: %s", track_id, e)
-
-    t = threading.Thread(target=_do_enrich, daemon=True)
-    t.start()
+            log.debug("[GEO] Pending sweep failed: %s", e)
+            return
+        # Wrap around once the last page has been reached
+        self._sweep_from = ips[-1] if len(ips) == _SWEEP_LIMIT else ''
+        for ip in ips:
+            if ip:
+                self.offer(ip)
+
+
+_enricher = None
+_enricher_lock = threading.Lock()
+
+
+def start_geo_enricher(app):
+    """Start the deferred enrichment worker when GEO_ENRICH_MODE=deferred."""
+    global _enricher
+    if Config.GEO_ENRICH_MODE != 'deferred':
+        return
+    with _enricher_lock:
+        if _enricher is not None and _enricher.is_alive():
+            return
+        _enricher = _GeoEnricher(app)
+        _enricher.start()
+
+
+def enqueue_enrichment(ip):
+    """Schedule a back-fill for rows captured from this IP (after they are committed)."""
+    if _enricher is not None and ip:
+        _enricher.offer(ip)
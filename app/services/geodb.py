@@ -0,0 +1,252 @@
+"""
+naarad - Offline Geo Database
+Local IP-range geolocation (GEO_PROVIDER=offline) — no network on the ingest path.
+
+``manage.py compile_geo ranges.csv geo.bin`` turns a CSV of IP ranges into a
+compact binary file that is memory-mapped at runtime. Lookups are a bisect
+over sorted integer range starts; all worker processes share the pages.
+
+CSV columns (header optional; extra columns ignored):
+    start, end, country, region, city, lat, lon, asn [, timezone, isp, org]
+``start`` / ``end`` are IPv4 or IPv6 addresses (or integers), inclusive.
+
+File layout (native byte order, all offsets absolute):
+    header   : magic, version, byte order, counts and section offsets
+    ipv4     : starts u32[n4], ends u32[n4], record u32[n4]
+    ipv6     : starts 16B[n6], ends 16B[n6], record u32[n6]  (big-endian keys)
+    records  : (country, region, city, timezone, isp, org, asn) string ids u32[7],
+               lat f64, lon f64
+    strings  : offsets u32[ns + 1], UTF-8 blob
+"""
+import bisect
+import csv
+import ipaddress
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+
+log = logging.getLogger(__name__)
+
+_MAGIC   = b'NGEO'
+_VERSION = 1
+# magic, version, little-endian flag, n4, n6, n_records, n_strings, then 7 section offsets
+_HEADER  = struct.Struct('=4sHHIIII7Q')
+_RECORD  = struct.Struct('=7I2d')
+_FIELDS  = ('country', 'region', 'city', 'timezone', 'isp', 'org', 'asn')
+_DEFAULTS = {
+    'country': 'Unknown', 'region': 'Unknown', 'city': 'Unknown',
+    'timezone': 'Unknown', 'isp': 'Unknown', 'org': '', 'asn': '',
+}
+_CSV_COLUMNS = ('start', 'end', 'country', 'region', 'city', 'lat', 'lon', 'asn',
+                'timezone', 'isp', 'org')
+
+
+def _to_int(value: str):
+    value = value.strip()
+    if value.isdigit():
+        n = int(value)
+        return n, (4 if n < 2 ** 32 else 6)
+    addr = ipaddress.ip_address(value)
+    return int(addr), addr.version
+
+
+def _rows(csv_path: str):
+    with open(csv_path, newline='', encoding='utf-8') as fh:
+        reader = csv.reader(fh)
+        first = next(reader, None)
+        if first is None:
+            return
+        try:
+            _to_int(first[0])
+            columns = _CSV_COLUMNS
+            yield dict(zip(columns, first))
+        except ValueError:
+            columns = [c.strip().lower() for c in first]    # header row
+        for row in reader:
+            if row:
+                yield dict(zip(columns, row))
+
+
+def compile_csv(csv_path: str, out_path: str) -> dict:
+    """Compile an IP-range CSV into the binary format. Returns counts."""
+    strings, string_ids = [], {}
+    records, record_ids = [], {}
+    ranges = {4: [], 6: []}
+    skipped = 0
+
+    def sid(value):
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    for row in _rows(csv_path):
+        try:
+            start, v_start = _to_int(row['start'])
+            end, v_end     = _to_int(row['end'])
+            if v_start != v_end or end < start:
+                raise ValueError('bad range')
+            lat = float(row.get('lat') or 0.0)
+            lon = float(row.get('lon') or 0.0)
+        except (KeyError, ValueError):
+            skipped += 1
+            continue
+        values = tuple(sid((row.get(f) or '').strip() or _DEFAULTS[f]) for f in _FIELDS)
+        key = values + (lat, lon)
+        if key not in record_ids:
+            record_ids[key] = len(records)
+            records.append(key)
+        ranges[v_start].append((start, end, record_ids[key]))
+
+    for version in (4, 6):
+        ranges[version].sort()
+        kept, prev_end = [], -1
+        for start, end, rec in ranges[version]:
+            if start <= prev_end:          # overlapping ranges: first one wins
+                skipped += 1
+                continue
+            kept.append((start, end, rec))
+            prev_end = end
+        ranges[version] = kept
+
+    v4, v6 = ranges[4], ranges[6]
+    sections = [
+        array('I', [r[0] for r in v4]).tobytes(),
+        array('I', [r[1] for r in v4]).tobytes(),
+        array('I', [r[2] for r in v4]).tobytes(),
+        b''.join(r[0].to_bytes(16, 'big') for r in v6),
+        b''.join(r[1].to_bytes(16, 'big') for r in v6),
+        array('I', [r[2] for r in v6]).tobytes(),
+        b''.join(_RECORD.pack(*rec) for rec in records),
+    ]
+    blob, offsets = bytearray(), array('I')
+    for value in strings:
+        offsets.append(len(blob))
+        blob += value.encode('utf-8')
+    offsets.append(len(blob))
+    sections.append(offsets.tobytes() + bytes(blob))
+
+    pos, section_offsets = _HEADER.size, []
+    for section in sections[:7]:
+        section_offsets.append(pos)
+        pos += len(section)
+    # The string section follows the records; its offset is implied
+    header = _HEADER.pack(_MAGIC, _VERSION, int(sys.byteorder == 'little'),
+                          len(v4), len(v6), len(records), len(strings), *section_offsets)
+
+    tmp = out_path + '.tmp'
+    with open(tmp, 'wb') as fh:
+        fh.write(header)
+        for section in sections:
+            fh.write(section)
+    os.replace(tmp, out_path)     # atomic swap for running readers
+    return {'ipv4_ranges': len(v4), 'ipv6_ranges': len(v6),
+            'records': len(records), 'strings': len(strings), 'skipped': skipped}
+
+
+class _Keys16:
+    """Sequence view over packed 16-byte big-endian keys (bytes compare numerically)."""
+
+    __slots__ = ('_buf', '_n')
+
+    def __init__(self, buf, n):
+        self._buf, self._n = buf, n
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        return bytes(self._buf[i * 16:(i + 1) * 16])
+
+
+class OfflineGeoDB:
+    """Read-only, memory-mapped view of a compiled geo file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, little, n4, n6, n_records, n_strings,
+         o4s, o4e, o4r, o6s, o6e, o6r, orec) = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f'{path}: not a naarad geo file (v{_VERSION})')
+        if bool(little) != (sys.byteorder == 'little'):
+            raise ValueError(f'{path}: compiled on a machine with different byte order')
+
+        buf = memoryview(self._mm)
+        self._v4_starts = buf[o4s:o4s + 4 * n4].cast('I')
+        self._v4_ends   = buf[o4e:o4e + 4 * n4].cast('I')
+        self._v4_recs   = buf[o4r:o4r + 4 * n4].cast('I')
+        self._v6_starts = _Keys16(buf[o6s:o6s + 16 * n6], n6)
+        self._v6_ends   = _Keys16(buf[o6e:o6e + 16 * n6], n6)
+        self._v6_recs   = buf[o6r:o6r + 4 * n6].cast('I')
+        self._records   = orec
+        ostr            = orec + _RECORD.size * n_records
+        self._str_offs  = buf[ostr:ostr + 4 * (n_strings + 1)].cast('I')
+        self._str_base  = ostr + 4 * (n_strings + 1)
+        self._strings   = {}           # decoded string cache (few distinct values)
+        self.counts = {'ipv4_ranges': n4, 'ipv6_ranges': n6, 'records': n_records}
+
+    def _string(self, i: int) -> str:
+        value = self._strings.get(i)
+        if value is None:
+            start = self._str_base + self._str_offs[i]
+            end   = self._str_base + self._str_offs[i + 1]
+            value = self._strings[i] = self._mm[start:end].decode('utf-8')
+        return value
+
+    def _record(self, i: int) -> dict:
+        *ids, lat, lon = _RECORD.unpack_from(self._mm, self._records + i * _RECORD.size)
+        geo = {field: self._string(sid) for field, sid in zip(_FIELDS, ids)}
+        geo['lat'], geo['lon'] = lat, lon
+        return geo
+
+    def lookup(self, ip: str):
+        """Geo dict (same shape as get_geo_info) for ``ip``, or None if not covered."""
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if addr.version == 6 and addr.ipv4_mapped is not None:
+            addr = addr.ipv4_mapped
+        if addr.version == 4:
+            key = int(addr)
+            i = bisect.bisect_right(self._v4_starts, key) - 1
+            if i >= 0 and self._v4_ends[i] >= key:
+                return self._record(self._v4_recs[i])
+            return None
+        key = addr.packed
+        i = bisect.bisect_right(self._v6_starts, key) - 1
+        if i >= 0 and self._v6_ends[i] >= key:
+            return self._record(self._v6_recs[i])
+        return None
+
+
+_db = None
+_db_lock = threading.Lock()
+_db_failed_path = None
+
+
+def get_offline_db(path: str):
+    """Shared OfflineGeoDB for ``path`` (reopened if the path changes); None if unusable."""
+    global _db, _db_failed_path
+    db = _db
+    if db is not None and db.path == path:
+        return db
+    with _db_lock:
+        if _db is not None and _db.path == path:
+            return _db
+        if _db_failed_path == path:
+            return None
+        try:
+            _db = OfflineGeoDB(path)
+            log.info("[GEO] Offline geo DB loaded from %s: %s", path, _db.counts)
+            return _db
+        except (OSError, ValueError, struct.error) as e:
+            _db_failed_path = path     # log once, not per request
+            log.error("[GEO] Offline geo DB unavailable (%s): %s", path, e)
+            return None
@@ -0,0 +1,783 @@
+"""
+naarad - Event Ingest
+Persists open / click events captured by the tracking controller.
+
+Two modes (INGEST_MODE):
+  - sync     : the request writes its own event and commits (default)
+  - buffered : the request only enqueues the event; a background flusher
+               writes batches with executemany and folds the per-track
+               counter updates into one statement per track_id, so the
+               database sees one commit per batch instead of one per hit.
+
+Both modes go through the same fold functions — a synchronous write is
+simply a batch of one.
+
+The state forward / repeat detection needs — the track's last opener (ip,
+country, device) and open count — is kept in a per-process LRU
+(TRACK_CACHE_SIZE) once a track has been opened, so opens on active tracks
+decide their flags in memory and only the counter upsert hits the DB.
+
+Event rows reference the parsed UA, geo and header values by id
+(services/dims.py); ids are interned per process, so repeat visitors add no
+extra round trips.
+"""
+import atexit
+import hashlib
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from ..config import Config
+from ..database import get_db, get_cursor, placeholder, USE_POSTGRES
+from .geo import is_pending, enqueue_enrichment, enrich_track_async
+from .dims import DimBatch, ua_values, geo_values, header_values
+from .partitions import insert_target
+from .rollups import record_events
+from .stats import bump_data_version
+from . import webhooks
+from .links import ensure_links
+
+log = logging.getLogger(__name__)
+
+
+# ─── Column layouts ───────────────────────────────────────────────────────────
+
+_OPEN_EVENT_COLS = [
+    'timestamp', 'open_date', 'open_time', 'day_of_week', 'unix_ms',
+    'track_id', 'campaign_id',
+    'sender', 'recipient', 'subject', 'sent_at',
+    'geo_id', 'ua_id', 'header_id',
+    'is_repeat', 'is_forward',
+    'fingerprint',
+]
+
+_TRACK_OPEN_COLS = [
+    # Timestamp fields
+    'timestamp', 'open_date', 'open_time', 'day_of_week', 'unix_ms',
+    # Identity
+    'track_id', 'campaign_id',
+    # Email metadata
+    'sender', 'recipient', 'subject', 'sent_at',
+    # Network / geo
+    'ip_address',
+    'country', 'region', 'city', 'latitude', 'longitude',
+    'timezone', 'isp', 'org', 'asn',
+    # Device / UA
+    'user_agent', 'browser', 'browser_version',
+    'os', 'os_version', 'device_type', 'device_brand',
+    'is_mobile', 'is_bot', 'is_proxy',
+    # Request headers
+    'referer', 'accept_language', 'accept_encoding', 'accept_header',
+    'connection_type', 'do_not_track', 'cache_control',
+    'sec_ch_ua', 'sec_ch_ua_mobile', 'sec_ch_ua_platform',
+    # Counters / flags
+    'open_count', 'click_count', 'forward_count',
+    'is_repeat', 'is_forward',
+    'first_seen', 'last_seen', 'first_seen_ms', 'last_seen_ms',
+]
+
+_CLICK_COLS = [
+    'timestamp', 'click_date', 'click_time', 'day_of_week', 'unix_ms',
+    'track_id', 'campaign_id', 'link_id', 'target_url',
+    'geo_id', 'ua_id', 'header_id',
+    'sender', 'recipient', 'subject', 'sent_at',
+    'fingerprint',
+]
+
+_TRACK_CLICK_COLS = [
+    'timestamp', 'open_date', 'open_time', 'day_of_week', 'unix_ms',
+    'track_id', 'campaign_id',
+    'sender', 'recipient', 'subject', 'sent_at',
+    'ip_address', 'country', 'region', 'city', 'latitude', 'longitude',
+    'timezone', 'isp', 'org', 'asn',
+    'user_agent', 'browser', 'browser_version',
+    'os', 'os_version', 'device_type', 'device_brand',
+    'is_mobile', 'is_bot', 'is_proxy',
+    'referer',
+    'open_count', 'click_count', 'forward_count',
+    'is_repeat', 'is_forward',
+    'first_seen', 'last_seen', 'first_seen_ms', 'last_seen_ms',
+]
+
+_EMAIL_META = ('sender', 'recipient', 'subject', 'sent_at')
+
+# INSERT ... ON CONFLICT DO UPDATE ... RETURNING needs SQLite >= 3.35
+_HAS_RETURNING = USE_POSTGRES or sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Null-safe inequality: SQLite spells it IS NOT, Postgres IS DISTINCT FROM
+_NE = 'IS DISTINCT FROM' if USE_POSTGRES else 'IS NOT'
+
+# Same heuristic as _is_forward(), evaluated against the stored row inside the
+# upsert: the row had an opener, the IP changed, and country or device changed.
+_FORWARD_SQL = (
+    f"CASE WHEN tracks.ip_address IS NOT NULL "
+    f"AND tracks.ip_address {_NE} excluded.ip_address "
+    f"AND (tracks.country {_NE} excluded.country "
+    f"OR tracks.device_type {_NE} excluded.device_type) THEN 1 ELSE 0 END"
+)
+
+
+def fingerprint(ip: str, ua: str, device_type: str, browser: str) -> str:
+    """
+    Lightweight fingerprint used for forward-detection.
+    Hashed so raw values are never stored twice.
+    """
+    raw = f"{ip}|{ua}|{device_type}|{browser}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def _row_get(row, idx, key):
+    return row[key] if hasattr(row, 'keys') else row[idx]
+
+
+def _is_forward(prev: tuple, ip: str, geo: dict, ua_info: dict) -> bool:
+    """
+    Heuristic: if the track already had an opener AND the current IP differs
+    from it AND the country or device class differs too, flag this open as a
+    probable forward.
+    """
+    orig_ip, orig_country, orig_device = prev[:3]
+    if orig_ip is None:
+        return False   # pre-registered row, nobody has opened it yet
+    return ip != orig_ip and (
+        geo.get('country') != orig_country or
+        ua_info.get('device_type') != orig_device
+    )
+
+
+def _first_meta(events: list, key: str):
+    """First non-empty email-metadata value in arrival order."""
+    for ev in events:
+        if ev.get(key):
+            return ev[key]
+    return None
+
+
+class _TrackStateCache:
+    """
+    LRU of track_id -> (ip, country, device_type, open_count) as last written.
+
+    Only tracks that have been opened are cached, and entries are filled
+    after commit. Other workers may move a track on meanwhile; a cached
+    opener can only make a later open a repeat (which it is) and at worst
+    compares forward detection against a slightly older opener. Clicks and
+    API edits drop the entry so the next open re-reads the row.
+    """
+
+    def __init__(self):
+        self._lock  = threading.Lock()
+        self._items = OrderedDict()
+        self.stats  = {'hits': 0, 'misses': 0}
+
+    def get_many(self, track_ids) -> dict:
+        found = {}
+        with self._lock:
+            for tid in track_ids:
+                state = self._items.get(tid)
+                if state is not None:
+                    self._items.move_to_end(tid)
+                    found[tid] = state
+            self.stats['hits']   += len(found)
+            self.stats['misses'] += len(track_ids) - len(found)
+        return found
+
+    def put_many(self, states: dict) -> None:
+        size = Config.TRACK_CACHE_SIZE
+        if size <= 0:
+            return
+        with self._lock:
+            for tid, state in states.items():
+                if not state[3]:
+                    continue          # never opened: nothing worth keeping
+                self._items[tid] = state
+                self._items.move_to_end(tid)
+            while len(self._items) > size:
+                self._items.popitem(last=False)
+
+    def forget(self, track_ids) -> None:
+        with self._lock:
+            for tid in track_ids:
+                self._items.pop(tid, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, size=len(self._items))
+
+
+_track_cache = _TrackStateCache()
+
+
+def forget_track(track_id: str = None) -> None:
+    """Drop one track's cached state (all tracks if ``track_id`` is None)."""
+    if track_id is None:
+        _track_cache.clear()
+    else:
+        _track_cache.forget([track_id])
+
+
+def track_cache_stats() -> dict:
+    return _track_cache.snapshot()
+
+
+def _load_track_state(cursor, P: str, track_ids: list) -> dict:
+    """Fetch (ip, country, device_type, open_count) of every existing track in one query."""
+    if not track_ids:
+        return {}
+    cursor.execute(
+        f'''SELECT track_id, ip_address, country, device_type, open_count
+            FROM tracks WHERE track_id IN ({', '.join([P] * len(track_ids))})''',
+        tuple(track_ids)
+    )
+    return {
+        _row_get(r, 0, 'track_id'): (
+            _row_get(r, 1, 'ip_address'),
+            _row_get(r, 2, 'country'),
+            _row_get(r, 3, 'device_type'),
+            _row_get(r, 4, 'open_count') or 0,
+        )
+        for r in cursor.fetchall()
+    }
+
+
+# ─── Opens ────────────────────────────────────────────────────────────────────
+
+def _open_event_dims(ev: dict) -> dict:
+    return {
+        'geo':    geo_values(ev['ip'], ev['geo']),
+        'ua':     ua_values(ev['ua'], ev['ua_info']),
+        'header': header_values(ev['headers']['referer'], ev['headers']['accept_language']),
+    }
+
+
+def _open_event_values(ev: dict, ids: dict) -> tuple:
+    ts      = ev['ts']
+    ua_info = ev['ua_info']
+    return (
+        ts['iso'], ts['date'], ts['time'], ts['day_of_week'], ts['unix_ms'],
+        ev['track_id'], ev['campaign_id'],
+        ev['sender'], ev['recipient'], ev['subject'], ev['sent_at'],
+        ids['geo'], ids['ua'], ids['header'],
+        ev['is_repeat'], ev['is_forward'],
+        fingerprint(ev['ip'], ev['ua'], ua_info['device_type'], ua_info['browser']),
+    )
+
+
+def _insert_events(cursor, P: str, table: str, cols: tuple, events: list, rows: list) -> None:
+    """INSERT event rows, one statement per month partition they fall into."""
+    targets = {}
+    for ev, row in zip(events, rows):
+        targets.setdefault(insert_target(cursor, table, ev['ts']['unix_ms']), []).append(row)
+    for target, values in targets.items():
+        sql = f"INSERT INTO {target} ({', '.join(cols)}) VALUES ({', '.join([P] * len(cols))})"
+        if len(values) == 1:
+            cursor.execute(sql, values[0])
+        else:
+            cursor.executemany(sql, values)
+
+
+def _rollup_items(events: list, ids: list, rows: list) -> list:
+    """Counter input for services/rollups.py (the fingerprint is each row's last column)."""
+    return [(ev['track_id'], ev['campaign_id'], ev['ts']['date'], row[-1], i['ua'], i['geo'])
+            for ev, i, row in zip(events, ids, rows)]
+
+
+def _insert_open_events(cursor, P: str, events: list, dims: DimBatch) -> None:
+    ids  = dims.resolve([_open_event_dims(ev) for ev in events])
+    rows = [_open_event_values(ev, i) for ev, i in zip(events, ids)]
+    _insert_events(cursor, P, 'open_events', _OPEN_EVENT_COLS, events, rows)
+    record_events(cursor, P, 'open', _rollup_items(events, ids, rows))
+
+
+# Columns overwritten with the latest opener's data on every open
+_OPEN_OVERWRITE = [
+    'last_seen', 'last_seen_ms', 'open_date', 'open_time', 'day_of_week', 'unix_ms',
+    'ip_address', 'country', 'region', 'city', 'latitude', 'longitude',
+    'timezone', 'isp', 'org', 'asn',
+    'user_agent', 'browser', 'browser_version',
+    'os', 'os_version', 'device_type', 'device_brand',
+    'is_mobile', 'is_bot', 'is_proxy',
+    'referer', 'accept_language', 'accept_encoding', 'accept_header',
+    'connection_type', 'do_not_track', 'cache_control',
+    'sec_ch_ua', 'sec_ch_ua_mobile', 'sec_ch_ua_platform',
+]
+
+
+def _upsert_track_opens(cursor, P: str, evs: list, opens: int, forwards: int,
+                        sql_forward: bool = False):
+    """
+    Fold N opens of one track into a single INSERT ... ON CONFLICT DO UPDATE.
+
+    The row always carries the LATEST opener's data; historical per-open data
+    lives in open_events. Only email metadata uses COALESCE so pre-registered
+    info is preserved.
+
+    With ``sql_forward`` (single event) forward detection runs inside the
+    statement against the stored row and the new (open_count, is_forward)
+    come back via RETURNING — one round trip instead of SELECT + UPDATE.
+    Otherwise the caller's precomputed ``forwards`` / last is_forward are used.
+    """
+    first   = evs[0]
+    last    = evs[-1]
+    ts      = last['ts']
+    geo     = last['geo']
+    ua_info = last['ua_info']
+    headers = last['headers']
+    values = (
+        first['ts']['iso'], ts['date'], ts['time'], ts['day_of_week'], ts['unix_ms'],
+        last['track_id'], _first_meta(evs, 'campaign_id'),
+        *(_first_meta(evs, k) for k in _EMAIL_META),
+        last['ip'],
+        geo['country'], geo['region'], geo['city'],
+        geo['lat'], geo['lon'],
+        geo['timezone'], geo['isp'],
+        geo.get('org', ''), geo.get('asn', ''),
+        last['ua'],
+        ua_info['browser'], ua_info['browser_version'],
+        ua_info['os'], ua_info['os_version'],
+        ua_info['device_type'], ua_info['device_brand'],
+        int(ua_info['is_mobile']), int(ua_info['is_bot']),
+        int(ua_info.get('is_proxy', False)),
+        headers['referer'], headers['accept_language'],
+        headers['accept_encoding'], headers['accept_header'],
+        headers['connection_type'], headers['do_not_track'],
+        headers['cache_control'], headers['sec_ch_ua'],
+        headers['sec_ch_ua_mobile'], headers['sec_ch_ua_platform'],
+        opens, 0, forwards,                              # open_count, click_count, forward_count
+        int(opens > 1), last.get('is_forward', 0),       # is_repeat, is_forward
+        first['ts']['iso'], ts['iso'],
+        first['ts']['unix_ms'], ts['unix_ms'],
+    )
+    if sql_forward:
+        fwd_incr, fwd = _FORWARD_SQL, _FORWARD_SQL
+    else:
+        fwd_incr, fwd = 'excluded.forward_count', 'excluded.is_forward'
+
+    sets = [
+        'is_repeat = CASE WHEN COALESCE(tracks.open_count, 0) + excluded.open_count > 1 '
+        'THEN 1 ELSE 0 END',
+        'open_count = COALESCE(tracks.open_count, 0) + excluded.open_count',
+        f'forward_count = COALESCE(tracks.forward_count, 0) + {fwd_incr}',
+        f'is_forward = {fwd}',
+    ]
+    sets += [f'{c} = excluded.{c}' for c in _OPEN_OVERWRITE]
+    sets += [f"{c} = COALESCE(NULLIF(tracks.{c}, ''), excluded.{c})" for c in _EMAIL_META]
+    sets.append('campaign_id = COALESCE(tracks.campaign_id, excluded.campaign_id)')
+
+    placeholders = ', '.join([P] * len(_TRACK_OPEN_COLS))
+    sql = (
+        f"INSERT INTO tracks ({', '.join(_TRACK_OPEN_COLS)}) VALUES ({placeholders}) "
+        f"ON CONFLICT (track_id) DO UPDATE SET {', '.join(sets)}"
+    )
+    if not sql_forward:
+        cursor.execute(sql, values)
+        return None
+    cursor.execute(sql + ' RETURNING open_count, is_forward', values)
+    row = cursor.fetchone()
+    return _row_get(row, 0, 'open_count'), _row_get(row, 1, 'is_forward')
+
+
+def apply_opens(cursor, P: str, events: list, dims: DimBatch = None) -> dict:
+    """
+    Persist a list of open events (arrival order).
+
+    Every event becomes one ``open_events`` row (single executemany) and is
+    counted into the rollups; the ``tracks`` row is upserted once per
+    track_id with the counters folded.
+    Repeat / forward flags are evaluated sequentially so a batch produces the
+    same flags as the same opens written one by one.
+
+    Track state comes from the LRU where possible, else one SELECT for the
+    rest. A single uncached event takes the fast path instead: one upsert
+    that detects forwards and returns the new counters.
+
+    Returns the new state per track for the cache (applied after commit).
+    Pass the transaction's ``DimBatch`` and publish it after commit so newly
+    interned dimension ids are cached.
+    """
+    dims      = dims or DimBatch(cursor, P)
+    track_ids = list(dict.fromkeys(ev['track_id'] for ev in events))
+    state     = _track_cache.get_many(track_ids)
+    missing   = [tid for tid in track_ids if tid not in state]
+
+    if len(events) == 1 and missing and _HAS_RETURNING:
+        ev = events[0]
+        open_count, is_forward = _upsert_track_opens(cursor, P, events, 1, 0, sql_forward=True)
+        _insert_open_events(cursor, P, [
+            dict(ev, is_repeat=int(open_count > 1), is_forward=int(is_forward or 0))
+        ], dims)
+        return {ev['track_id']: (ev['ip'], ev['geo'].get('country'),
+                                 ev['ua_info'].get('device_type'), open_count)}
+
+    if missing:
+        state.update(_load_track_state(cursor, P, missing))
+
+    per_track = {}
+    flagged   = []
+    for ev in events:
+        tid  = ev['track_id']
+        prev = state.get(tid)
+        prev_opens = prev[3] if prev else 0
+        ev = dict(ev,
+                  is_repeat=int(prev_opens > 0),
+                  is_forward=int(prev is not None and
+                                 _is_forward(prev, ev['ip'], ev['geo'], ev['ua_info'])))
+        state[tid] = (ev['ip'], ev['geo'].get('country'),
+                      ev['ua_info'].get('device_type'), prev_opens + 1)
+        flagged.append(ev)
+        per_track.setdefault(tid, []).append(ev)
+
+    _insert_open_events(cursor, P, flagged, dims)
+    for evs in per_track.values():
+        _upsert_track_opens(cursor, P, evs, len(evs), sum(ev['is_forward'] for ev in evs))
+    return {tid: state[tid] for tid in per_track}
+
+
+# ─── Clicks ───────────────────────────────────────────────────────────────────
+
+def _click_dims(ev: dict) -> dict:
+    return {
+        'geo':    geo_values(ev['ip'], ev['geo']),
+        'ua':     ua_values(ev['ua'], ev['ua_info']),
+        'header': header_values(ev['referer']),
+    }
+
+
+def _click_values(ev: dict, ids: dict) -> tuple:
+    ts      = ev['ts']
+    ua_info = ev['ua_info']
+    return (
+        ts['iso'], ts['date'], ts['time'], ts['day_of_week'], ts['unix_ms'],
+        ev['track_id'], ev['campaign_id'], ev['link_id'], ev['target_url'],
+        ids['geo'], ids['ua'], ids['header'],
+        ev['sender'], ev['recipient'], ev['subject'], ev['sent_at'],
+        fingerprint(ev['ip'], ev['ua'], ua_info['device_type'], ua_info['browser']),
+    )
+
+
+def _upsert_track_clicks(cursor, P: str, evs: list) -> None:
+    """
+    Fold N clicks of one track into a single INSERT ... ON CONFLICT DO UPDATE.
+
+    If the pixel was blocked the click creates a minimal track row; otherwise
+    geo / device columns are only filled where the row has no useful value yet.
+    """
+    first   = evs[0]
+    ts      = first['ts']
+    geo     = first['geo']
+    ua_info = first['ua_info']
+    values = (
+        ts['iso'], ts['date'], ts['time'], ts['day_of_week'], ts['unix_ms'],
+        first['track_id'], _first_meta(evs, 'campaign_id'),
+        *(_first_meta(evs, k) for k in _EMAIL_META),
+        first['ip'], geo['country'], geo['region'], geo['city'],
+        geo['lat'], geo['lon'], geo['timezone'],
+        geo['isp'], geo.get('org', ''), geo.get('asn', ''),
+        first['ua'],
+        ua_info['browser'], ua_info['browser_version'],
+        ua_info['os'], ua_info['os_version'],
+        ua_info['device_type'], ua_info['device_brand'],
+        int(ua_info['is_mobile']), int(ua_info['is_bot']),
+        int(ua_info.get('is_proxy', False)),
+        first['referer'],
+        0, len(evs), 0,  # open_count, click_count, forward_count
+        0, 0,            # is_repeat, is_forward
+        ts['iso'], evs[-1]['ts']['iso'],
+        ts['unix_ms'], evs[-1]['ts']['unix_ms'],
+    )
+    placeholders = ', '.join([P] * len(_TRACK_CLICK_COLS))
+    cursor.execute(
+        f'''INSERT INTO tracks ({', '.join(_TRACK_CLICK_COLS)}) VALUES ({placeholders})
+            ON CONFLICT (track_id) DO UPDATE
+            SET click_count = COALESCE(tracks.click_count, 0) + excluded.click_count,
+                last_seen   = excluded.last_seen,
+                last_seen_ms = excluded.last_seen_ms,
+                -- Network / geo
+                ip_address    = COALESCE(tracks.ip_address, excluded.ip_address),
+                country       = COALESCE(NULLIF(tracks.country, 'Local'), NULLIF(tracks.country, 'Unknown'), excluded.country),
+                region        = COALESCE(NULLIF(tracks.region,  'Local'), NULLIF(tracks.region,  'Unknown'), excluded.region),
+                city          = COALESCE(NULLIF(tracks.city,    'Local'), NULLIF(tracks.city,    'Unknown'), excluded.city),
+                latitude      = CASE WHEN tracks.latitude IS NULL OR tracks.latitude = 0
+                                     THEN excluded.latitude ELSE tracks.latitude END,
+                longitude     = CASE WHEN tracks.longitude IS NULL OR tracks.longitude = 0
+                                     THEN excluded.longitude ELSE tracks.longitude END,
+                timezone      = COALESCE(NULLIF(tracks.timezone, 'Local'), NULLIF(tracks.timezone, 'Unknown'), excluded.timezone),
+                isp           = COALESCE(NULLIF(tracks.isp,      'Local'), NULLIF(tracks.isp,      'Unknown'), excluded.isp),
+                org           = COALESCE(NULLIF(tracks.org, ''), excluded.org),
+                asn           = COALESCE(NULLIF(tracks.asn, ''), excluded.asn),
+                -- Device / UA
+                user_agent    = COALESCE(tracks.user_agent, excluded.user_agent),
+                browser       = COALESCE(NULLIF(tracks.browser, 'Unknown'), excluded.browser),
+                browser_version = COALESCE(tracks.browser_version, excluded.browser_version),
+                os            = COALESCE(NULLIF(tracks.os, 'Unknown'), excluded.os),
+                os_version    = COALESCE(tracks.os_version, excluded.os_version),
+                device_type   = COALESCE(NULLIF(tracks.device_type, 'Unknown'), excluded.device_type),
+                device_brand  = COALESCE(NULLIF(tracks.device_brand, 'Unknown'), excluded.device_brand),
+                is_mobile     = COALESCE(tracks.is_mobile, excluded.is_mobile),
+                is_bot        = COALESCE(tracks.is_bot, excluded.is_bot),
+                is_proxy      = COALESCE(tracks.is_proxy, excluded.is_proxy)''',
+        values
+    )
+
+
+def apply_clicks(cursor, P: str, events: list, dims: DimBatch = None) -> dict:
+    """
+    Persist a list of click events: one executemany into ``clicks`` (per month
+    partition), the rollup counter upserts, plus one ``tracks`` upsert per
+    distinct track_id.
+
+    Legacy ``/click/<url>`` events carry a hash link_id that may have no
+    ``links`` row yet; those are upserted first so the FK holds.
+    """
+    dims = dims or DimBatch(cursor, P)
+    ensure_links(cursor, P, {
+        ev['link_id']: ev['target_url'] for ev in events if not ev.get('registered')
+    })
+    ids  = dims.resolve([_click_dims(ev) for ev in events])
+    rows = [_click_values(ev, i) for ev, i in zip(events, ids)]
+    _insert_events(cursor, P, 'clicks', _CLICK_COLS, events, rows)
+    record_events(cursor, P, 'click', _rollup_items(events, ids, rows))
+
+    per_track = {}
+    for ev in events:
+        per_track.setdefault(ev['track_id'], []).append(ev)
+    for evs in per_track.values():
+        _upsert_track_clicks(cursor, P, evs)
+    # A click may fill the row's ip / geo / device: re-read on the next open
+    return dict.fromkeys(per_track)
+
+
+_APPLY = {'open': apply_opens, 'click': apply_clicks}
+
+
+def _stage_webhooks(cursor, P: str, batch: list) -> None:
+    """Write the batch's webhook payloads to the outbox in the same transaction."""
+    webhooks.enqueue(cursor, P, [
+        (kind, ev['webhook']) for kind, ev in batch if ev.get('webhook')
+    ])
+
+
+def _remember_tracks(states: dict) -> None:
+    """Apply the committed track states returned by apply_opens / apply_clicks."""
+    _track_cache.forget([tid for tid, state in states.items() if state is None])
+    _track_cache.put_many({tid: state for tid, state in states.items() if state is not None})
+
+
+def _after_commit(events) -> None:
+    """Hand committed events with a 'Pending' or failed geo lookup to the enrichers."""
+    staged = False
+    for ev in events:
+        if is_pending(ev['geo']):
+            enqueue_enrichment(ev['ip'])
+        elif ev.get('retry_geo'):
+            enrich_track_async(ev['track_id'], ev['ip'])
+        staged = staged or bool(ev.get('webhook'))
+    if staged:
+        webhooks.notify_outbox()
+
+
+def _write_inline(kind: str, event: dict) -> bool:
+    """Write one event on the request's own connection and commit."""
+    conn   = get_db()
+    cursor = get_cursor(conn)
+    try:
+        P = placeholder()
+        dims = DimBatch(cursor, P)
+        states = _APPLY[kind](cursor, P, [event], dims)
+        _stage_webhooks(cursor, P, [(kind, event)])
+        conn.commit()
+        bump_data_version(conn, cursor)
+        dims.publish()
+        _remember_tracks(states)
+        _after_commit([event])
+        return True
+    except Exception as e:
+        log.error("[INGEST] DB error for %s track_id=%s: %s",
+                  kind, event.get('track_id'), e, exc_info=True)
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        return False
+
+
+# ─── Write-behind buffer ──────────────────────────────────────────────────────
+
+_WAKEUP = object()   # queued on stop() so the flusher starts draining immediately
+
+
+class _WriteBehindBuffer:
+    """Bounded in-process queue drained by a single flusher thread."""
+
+    def __init__(self, app):
+        self._app    = app
+        self._queue  = queue.Queue(maxsize=max(1, Config.INGEST_QUEUE_SIZE))
+        self._stop   = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='naarad-ingest', daemon=True)
+        self._lock   = threading.Lock()     # stats are bumped from every request thread
+        self.stats = {
+            'enqueued': 0, 'rejected': 0, 'flushed': 0,
+            'batches': 0, 'failed': 0,
+        }
+
+    def start(self):
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, queued=self._queue.qsize())
+
+    def offer(self, kind: str, event: dict) -> bool:
+        """Enqueue an event; False when the buffer stayed full past the timeout."""
+        if self._stop.is_set():
+            return False
+        try:
+            self._queue.put((kind, event), timeout=Config.INGEST_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            self.count('rejected')
+            return False
+        self.count('enqueued')
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """Stop accepting events, flush whatever is queued, and join."""
+        self._stop.set()
+        try:
+            self._queue.put(_WAKEUP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def _take_batch(self) -> list:
+        """Gather events until the batch is full or the flush interval elapses.
+
+        Once stopping, the queue is drained without waiting.
+        """
+        batch_size = max(1, Config.INGEST_BATCH_SIZE)
+        deadline   = time.monotonic() + Config.INGEST_FLUSH_INTERVAL
+        batch = []
+        while len(batch) < batch_size:
+            remaining = 0 if self._stop.is_set() else deadline - time.monotonic()
+            try:
+                item = (self._queue.get(timeout=remaining) if remaining > 0
+                        else self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if item is not _WAKEUP:
+                batch.append(item)
+        return batch
+
+    def _run(self):
+        log.info("[INGEST] Write-behind flusher started (batch=%d, interval=%.2fs)",
+                 Config.INGEST_BATCH_SIZE, Config.INGEST_FLUSH_INTERVAL)
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._flush(batch)
+            elif self._stop.is_set():
+                break
+
+    def _flush(self, batch: list):
+        opens  = [ev for kind, ev in batch if kind == 'open']
+        clicks = [ev for kind, ev in batch if kind == 'click']
+        with self._app.app_context():
+            conn   = get_db()
+            cursor = get_cursor(conn)
+            P      = placeholder()
+            dims   = DimBatch(cursor, P)
+            try:
+                states = {}
+                if opens:
+                    states.update(apply_opens(cursor, P, opens, dims))
+                if clicks:
+                    states.update(apply_clicks(cursor, P, clicks, dims))
+                _stage_webhooks(cursor, P, batch)
+                conn.commit()
+                bump_data_version(conn, cursor)
+                dims.publish()
+                _remember_tracks(states)
+                _after_commit(ev for _, ev in batch)
+                self.count('batches')
+                self.count('flushed', len(batch))
+                log.debug("[INGEST] Flushed %d opens, %d clicks", len(opens), len(clicks))
+                return
+            except Exception as e:
+                log.warning("[INGEST] Batch of %d failed, retrying per event: %s", len(batch), e)
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+
+            # Isolate the poison event so one bad row doesn't drop the batch
+            for kind, ev in batch:
+                if _write_inline(kind, ev):
+                    self.count('flushed')
+                else:
+                    self.count('failed')
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def start_ingest_worker(app):
+    """Start the write-behind flusher when INGEST_MODE=buffered.
+
+    Must run after Gunicorn has forked — threads are not inherited by workers.
+    """
+    global _buffer
+    if Config.INGEST_MODE != 'buffered':
+        return
+    with _buffer_lock:
+        if _buffer is not None and _buffer.is_alive():
+            return
+        _buffer = _WriteBehindBuffer(app)
+        _buffer.start()
+
+
+def stop_ingest_worker(timeout: float = 10.0):
+    """Drain the buffer and stop the flusher (registered with atexit)."""
+    global _buffer
+    with _buffer_lock:
+        buf, _buffer = _buffer, None
+    if buf is not None:
+        buf.stop(timeout)
+        log.info("[INGEST] Flusher stopped: %s", buf.snapshot())
+
+
+atexit.register(stop_ingest_worker)
+
+
+def ingest_stats() -> dict:
+    """Counters of the running write-behind buffer (empty in sync mode)."""
+    buf = _buffer
+    if buf is None:
+        return {}
+    return buf.snapshot()
+
+
+def submit(kind: str, event: dict) -> None:
+    """
+    Record an 'open' or 'click' event.
+
+    In buffered mode the event is enqueued; if the buffer stays full for
+    INGEST_ENQUEUE_TIMEOUT the request writes the event itself, which pushes
+    back on producers at exactly the rate the database can absorb.
+    """
+    buf = _buffer
+    if buf is not None and buf.offer(kind, event):
+        return
+    _write_inline(kind, event)
@@ -0,0 +1,135 @@
+"""
+naarad - Registered Links
+Short base62 link IDs for click tracking.
+
+Target URLs are validated once, when they are registered via the API, and
+stored in the ``links`` table. Email HTML then carries ``/l/<track_id>/<id>``
+instead of the full encoded URL, and a click only needs an ID lookup, which
+is served from an in-process LRU index backed by the table.
+
+Legacy ``/click/<track_id>/<url>`` links still work: their link_id is
+``hash_url(url)`` and the ingest layer upserts a matching ``links`` row,
+so ``clicks.link_id`` always references a real link.
+"""
+import logging
+import secrets
+import threading
+from collections import OrderedDict
+
+from ..config import Config
+from ..database import get_db, get_cursor, placeholder
+from ..utils import now_iso, validate_redirect_url
+
+log = logging.getLogger(__name__)
+
+BASE62 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+_ID_LENGTH = 7          # 62^7 ≈ 3.5e12 IDs
+
+
+def new_link_id() -> str:
+    return ''.join(secrets.choice(BASE62) for _ in range(_ID_LENGTH))
+
+
+def is_link_id(value: str) -> bool:
+    return bool(value) and len(value) <= 32 and all(c in BASE62 for c in value)
+
+
+# ─── LRU index ────────────────────────────────────────────────────────────────
+
+_cache = OrderedDict()          # link_id -> target_url
+_cache_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def _cache_put(link_id: str, url: str) -> None:
+    with _cache_lock:
+        _cache[link_id] = url
+        _cache.move_to_end(link_id)
+        while len(_cache) > Config.LINK_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def resolve(link_id: str):
+    """Target URL of a registered link, or None if unknown."""
+    with _cache_lock:
+        url = _cache.get(link_id)
+        if url is not None:
+            _cache.move_to_end(link_id)
+            _cache_stats['hits'] += 1
+            return url
+        _cache_stats['misses'] += 1
+
+    if not is_link_id(link_id):
+        return None
+    cursor = get_cursor(get_db())
+    cursor.execute(f'SELECT target_url FROM links WHERE link_id = {placeholder()}', (link_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    url = row['target_url'] if hasattr(row, 'keys') else row[0]
+    _cache_put(link_id, url)
+    return url
+
+
+def link_cache_stats() -> dict:
+    with _cache_lock:
+        return dict(_cache_stats, size=len(_cache))
+
+
+# ─── Writes ───────────────────────────────────────────────────────────────────
+
+def ensure_links(cursor, P: str, links: dict) -> set:
+    """
+    Upsert ``{link_id: target_url}`` rows for legacy / synced clicks.
+
+    Target URLs go through the same validate_redirect_url() check as
+    register_link(); entries that fail it are skipped, so a peer cannot plant
+    an open redirect. Returns the link_ids that were accepted.
+    """
+    safe = {link_id: validate_redirect_url(url) for link_id, url in links.items()}
+    safe = {link_id: url for link_id, url in safe.items() if url}
+    if not safe:
+        return set()
+    created = now_iso()
+    cursor.executemany(
+        f'''INSERT INTO links (link_id, target_url, created_at, is_registered)
+            VALUES ({P}, {P}, {P}, 0)
+            ON CONFLICT (link_id) DO NOTHING''',
+        [(link_id, url, created) for link_id, url in safe.items()]
+    )
+    return set(safe)
+
+
+def register_link(cursor, P: str, url: str):
+    """
+    Register a target URL and return its link_id (None if the URL is invalid).
+
+    Registering the same URL again returns the existing ID. The LRU index is
+    left alone: it is filled by resolve() from committed rows only, so a
+    rolled-back registration can never be followed.
+    """
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    safe_url = validate_redirect_url(url)
+    if not safe_url:
+        return None
+
+    cursor.execute(
+        f'SELECT link_id FROM links WHERE target_url = {P} AND is_registered = 1',
+        (safe_url,)
+    )
+    row = cursor.fetchone()
+    if row:
+        return row['link_id'] if hasattr(row, 'keys') else row[0]
+
+    for _ in range(5):
+        link_id = new_link_id()
+        cursor.execute(
+            f'''INSERT INTO links (link_id, target_url, created_at, is_registered)
+                VALUES ({P}, {P}, {P}, 1)
+                ON CONFLICT (link_id) DO NOTHING''',
+            (link_id, safe_url, now_iso())
+        )
+        if cursor.rowcount:
+            return link_id
+    raise RuntimeError('could not allocate a unique link_id')
@@ -0,0 +1,130 @@
+"""
+naarad - Maintenance Scheduler
+Periodic housekeeping (cache expiry and the like) kept off the request path.
+
+One light timer thread decides what is due and hands each job to the shared
+background executor, so jobs run with the pool's app context / connection
+and never overlap themselves. The first run of every job is jittered:
+with several Gunicorn workers the sweeps spread out instead of all firing
+on the same tick.
+"""
+import logging
+import random
+import threading
+import time
+
+from ..config import Config
+from .executor import submit
+
+log = logging.getLogger(__name__)
+
+
+class _Job:
+    __slots__ = ('name', 'interval', 'fn', 'next_run', 'running',
+                 'runs', 'failures', 'last_result', 'last_duration_ms')
+
+    def __init__(self, name, interval, fn):
+        self.name     = name
+        self.interval = interval
+        self.fn       = fn
+        self.next_run = time.monotonic() + random.uniform(0, min(interval, 60.0))
+        self.running  = False
+        self.runs = self.failures = 0
+        self.last_result = self.last_duration_ms = None
+
+
+class MaintenanceScheduler:
+    """Runs registered jobs every ``interval`` seconds on the background executor."""
+
+    def __init__(self, tick: float = 1.0):
+        self._tick   = tick
+        self._jobs   = []
+        self._lock   = threading.Lock()
+        self._stop   = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='naarad-maintenance', daemon=True)
+
+    def add(self, name: str, interval: float, fn) -> None:
+        if interval > 0:
+            with self._lock:
+                self._jobs.append(_Job(name, interval, fn))
+
+    def start(self):
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        log.info("[MAINT] Scheduler started (%s)", ', '.join(j.name for j in self._jobs) or 'no jobs')
+        while not self._stop.wait(self._tick):
+            self.run_pending()
+
+    def run_pending(self, now: float = None) -> None:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            due = [j for j in self._jobs if not j.running and j.next_run <= now]
+            for job in due:
+                job.running  = True
+                job.next_run = now + job.interval
+        for job in due:
+            if not submit('maintenance', self._execute, job):
+                with self._lock:
+                    job.running = False          # executor busy; retried next interval
+
+    def _execute(self, job):
+        start = time.perf_counter()
+        try:
+            result = job.fn()
+            ok = True
+        except Exception as e:
+            result, ok = None, False
+            log.warning("[MAINT] %s failed: %s", job.name, e)
+        with self._lock:
+            job.running = False
+            job.runs += 1
+            job.failures += 0 if ok else 1
+            job.last_result = result
+            job.last_duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        if ok and result:
+            log.info("[MAINT] %s: %s", job.name, result)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                j.name: {'interval': j.interval, 'runs': j.runs, 'failures': j.failures,
+                         'last_result': j.last_result, 'last_duration_ms': j.last_duration_ms}
+                for j in self._jobs
+            }
+
+
+def _default_jobs(scheduler: MaintenanceScheduler) -> None:
+    from .geo import purge_expired_geo_cache
+    scheduler.add('geo_cache_purge', Config.GEO_CACHE_PURGE_INTERVAL, purge_expired_geo_cache)
+    from .partitions import maintain_event_partitions
+    scheduler.add('event_partitions', Config.PARTITION_MAINTENANCE_INTERVAL, maintain_event_partitions)
+    from .rollups import compact_events
+    scheduler.add('event_rollups', Config.EVENT_ROLLUP_INTERVAL, compact_events)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_maintenance(app):
+    """Start the scheduler (after Gunicorn has forked; jobs need the executor)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None and _scheduler.is_alive():
+            return
+        _scheduler = MaintenanceScheduler()
+        _default_jobs(_scheduler)
+        _scheduler.start()
+
+
+def maintenance_stats() -> dict:
+    """Per-job run counters and the last result of each job."""
+    sched = _scheduler
+    return sched.stats() if sched is not None else {}
@@ -0,0 +1,203 @@
+"""
+naarad - Network Classification
+One longest-prefix-match lookup tells whether an IP is private / reserved or
+belongs to a known mail-proxy or security-scanner network.
+
+Prefixes are compiled into a byte-stride trie (one level per address byte):
+a lookup walks at most 4 levels for IPv4 and 16 for IPv6, on the packed
+bytes from ``socket.inet_pton`` — no ``ipaddress`` objects per request.
+Prefix lengths that are not a multiple of 8 are expanded within their last
+byte, with the longer prefix winning where expansions overlap.
+
+Kinds
+  - private : non-routable; resolved locally, never sent to the geo API
+  - proxy   : fetches images on the reader's behalf (Apple MPP, Gmail);
+              tagged is_proxy — the open happened, but not on a known device
+  - scanner : security gateways that pre-fetch every link and pixel;
+              tagged is_bot
+
+Extra prefixes can be loaded from NETCLASS_FILE, one per line:
+
+    17.0.0.0/8      proxy    Apple Mail Privacy Protection
+    # comments and blank lines are ignored
+"""
+import ipaddress
+import logging
+import socket
+import threading
+
+from ..config import Config
+
+log = logging.getLogger(__name__)
+
+PRIVATE, PROXY, SCANNER = 'private', 'proxy', 'scanner'
+KINDS = (PRIVATE, PROXY, SCANNER)
+
+_BUILTIN = [
+    # Private / non-routable IPv4
+    ('0.0.0.0/8',          PRIVATE, 'This network'),
+    ('10.0.0.0/8',         PRIVATE, 'Private'),
+    ('100.64.0.0/10',      PRIVATE, 'CGNAT'),
+    ('127.0.0.0/8',        PRIVATE, 'Loopback'),
+    ('169.254.0.0/16',     PRIVATE, 'Link-local'),
+    ('172.16.0.0/12',      PRIVATE, 'Private'),
+    ('192.0.0.0/24',       PRIVATE, 'IETF protocol'),
+    ('192.168.0.0/16',     PRIVATE, 'Private'),
+    ('198.18.0.0/15',      PRIVATE, 'Benchmarking'),
+    ('198.51.100.0/24',    PRIVATE, 'Documentation'),
+    ('203.0.113.0/24',     PRIVATE, 'Documentation'),
+    ('240.0.0.0/4',        PRIVATE, 'Reserved'),
+    ('255.255.255.255/32', PRIVATE, 'Broadcast'),
+    # Private / non-routable IPv6
+    ('::/128',             PRIVATE, 'Unspecified'),
+    ('::1/128',            PRIVATE, 'Loopback'),
+    ('100::/64',           PRIVATE, 'Discard'),
+    ('2001::/23',          PRIVATE, 'IETF protocol'),
+    ('2001:db8::/32',      PRIVATE, 'Documentation'),
+    ('fc00::/7',           PRIVATE, 'Unique-local'),
+    ('fe80::/10',          PRIVATE, 'Link-local'),
+    # Mail image proxies
+    ('17.0.0.0/8',         PROXY,   'Apple Mail Privacy Protection'),
+    ('66.102.0.0/20',      PROXY,   'Google Image Proxy'),
+    ('66.249.80.0/20',     PROXY,   'Google Image Proxy'),
+    # Security scanners (link / attachment pre-fetch)
+    ('205.139.110.0/24',   SCANNER, 'Mimecast'),
+    ('207.211.30.0/24',    SCANNER, 'Mimecast'),
+    ('207.211.31.0/25',    SCANNER, 'Mimecast'),
+    ('67.231.144.0/20',    SCANNER, 'Proofpoint'),
+    ('148.163.128.0/19',   SCANNER, 'Proofpoint'),
+    ('64.235.144.0/20',    SCANNER, 'Barracuda'),
+    ('209.222.80.0/21',    SCANNER, 'Barracuda'),
+]
+
+# Unparseable addresses are treated as local (nothing useful to look up)
+_UNPARSEABLE = (PRIVATE, 'Unparseable')
+_V4_MAPPED = b'\x00' * 10 + b'\xff\xff'
+
+
+class NetworkClassifier:
+    """Longest-prefix-match over IPv4 and IPv6 prefixes -> (kind, label)."""
+
+    def __init__(self, prefixes=()):
+        self._roots = {4: {}, 6: {}}     # byte -> [child node or None, (kind, label), prefix_len]
+        self.size = 0
+        for cidr, kind, label in prefixes:
+            self.add(cidr, kind, label)
+
+    def add(self, cidr: str, kind: str, label: str) -> None:
+        if kind not in KINDS:
+            raise ValueError(f'unknown network kind {kind!r}')
+        net = ipaddress.ip_network(cidr, strict=False)
+        plen = net.prefixlen
+        if plen == 0:
+            raise ValueError('a default route cannot be classified')
+        packed = net.network_address.packed
+        full, rem = divmod(plen, 8)
+        if rem == 0:
+            full, rem = full - 1, 8
+
+        node = self._roots[net.version]
+        for b in packed[:full]:
+            entry = node.get(b)
+            if entry is None:
+                entry = node[b] = [None, None, 0]
+            if entry[0] is None:
+                entry[0] = {}
+            node = entry[0]
+
+        first = packed[full] & (0xFF << (8 - rem)) & 0xFF
+        for b in range(first, first + (1 << (8 - rem))):
+            entry = node.get(b)
+            if entry is None:
+                node[b] = [None, (kind, label), plen]
+            elif entry[2] <= plen:
+                entry[1], entry[2] = (kind, label), plen
+        self.size += 1
+
+    def classify(self, ip: str):
+        """(kind, label) of the most specific matching prefix, or None."""
+        if not ip:
+            return _UNPARSEABLE
+        try:
+            packed, node = socket.inet_pton(socket.AF_INET, ip), self._roots[4]
+        except OSError:
+            try:
+                packed, node = socket.inet_pton(socket.AF_INET6, ip), self._roots[6]
+            except (OSError, ValueError):
+                return _UNPARSEABLE
+            if packed[:12] == _V4_MAPPED:
+                packed, node = packed[12:], self._roots[4]
+        except ValueError:               # embedded NUL etc.
+            return _UNPARSEABLE
+
+        best = None
+        for b in packed:
+            entry = node.get(b)
+            if entry is None:
+                break
+            if entry[1] is not None:
+                best = entry[1]
+            node = entry[0]
+            if node is None:
+                break
+        return best
+
+
+def _load_file(path: str):
+    prefixes = []
+    with open(path, encoding='utf-8') as fh:
+        for lineno, line in enumerate(fh, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split(None, 2)
+            if len(parts) < 2:
+                log.warning("[NET] %s:%d: expected 'CIDR KIND [LABEL]'", path, lineno)
+                continue
+            prefixes.append((parts[0], parts[1].lower(), parts[2] if len(parts) > 2 else parts[1]))
+    return prefixes
+
+
+def build_classifier(extra_file: str = None) -> NetworkClassifier:
+    """Built-in prefixes plus those from ``extra_file`` (bad lines are logged and skipped)."""
+    classifier = NetworkClassifier(_BUILTIN)
+    if extra_file:
+        try:
+            prefixes = _load_file(extra_file)
+        except OSError as e:
+            log.error("[NET] Cannot read NETCLASS_FILE %s: %s", extra_file, e)
+            prefixes = []
+        for cidr, kind, label in prefixes:
+            try:
+                classifier.add(cidr, kind, label)
+            except ValueError as e:
+                log.warning("[NET] Skipping %s (%s): %s", cidr, kind, e)
+    return classifier
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> NetworkClassifier:
+    """The process-wide classifier, built on first use."""
+    global _classifier
+    classifier = _classifier
+    if classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = build_classifier(Config.NETCLASS_FILE)
+                log.info("[NET] Network classifier loaded (%d prefixes)", _classifier.size)
+            classifier = _classifier
+    return classifier
+
+
+def classify(ip: str):
+    """(kind, label) for ``ip`` — kind is 'private', 'proxy' or 'scanner' — or None."""
+    return get_classifier().classify(ip)
+
+
+def is_private(ip: str) -> bool:
+    """True if the IP is private, loopback, link-local, reserved or unparseable."""
+    net = get_classifier().classify(ip)
+    return net is not None and net[0] == PRIVATE
@@ -0,0 +1,379 @@
+"""
+naarad - Event Partitions
+open_events and clicks are split by calendar month (UTC) of ``unix_ms``, so
+time-range reads only touch the months they cover and retention drops whole
+months instead of deleting rows one by one.
+
+PostgreSQL: declarative RANGE partitions (``open_events_p202603`` ...) plus a
+DEFAULT partition for rows outside every month (no unix_ms, month not created
+yet). Inserts go to the parent table and are routed by PostgreSQL.
+
+SQLite: one table per month plus ``{table}_pdefault`` behind a UNION ALL view
+that keeps the old table name, so reads are unchanged. The view's INSTEAD OF
+INSERT trigger routes ad-hoc inserts; ingest and sync write the month table
+directly (``insert_target``). Every month table carries its own copy of the
+per-track indexes, and its AUTOINCREMENT sequence starts at
+``month_index << 32`` so ids stay unique across months.
+
+The maintenance job keeps the current and the next PARTITION_PREMAKE_MONTHS
+months created and, with EVENT_RETENTION_MONTHS set, drops the months that
+fell out of the window.
+"""
+import logging
+import threading
+from datetime import datetime, timezone
+
+from ..config import Config
+from ..database import (USE_POSTGRES, get_db, get_cursor, placeholder,
+                        _EVENT_TABLES, _QUERY_INDEXES, _table_columns)
+from ..utils import now, to_ms
+
+log = logging.getLogger(__name__)
+
+EVENT_TABLES = ('open_events', 'clicks')
+DEFAULT = 'default'
+
+
+# ─── Month arithmetic ─────────────────────────────────────────────────────────
+# A month is keyed YYYYMM (int); bounds are [first ms, first ms of next month).
+
+def month_key(ms: int) -> int:
+    dt = datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+    return dt.year * 100 + dt.month
+
+
+def shift_month(key: int, months: int) -> int:
+    index = (key // 100) * 12 + (key % 100 - 1) + months
+    return (index // 12) * 100 + index % 12 + 1
+
+
+def month_bounds(key: int) -> tuple:
+    def first_ms(k):
+        return to_ms(datetime(k // 100, k % 100, 1, tzinfo=timezone.utc))
+    return first_ms(key), first_ms(shift_month(key, 1))
+
+
+def current_month() -> int:
+    return month_key(to_ms(now()))
+
+
+def partition_name(table: str, key) -> str:
+    return f'{table}_p{key}'
+
+
+# ─── Catalog ──────────────────────────────────────────────────────────────────
+
+def _names(cursor) -> list:
+    return [r['name'] if hasattr(r, 'keys') else r[0] for r in cursor.fetchall()]
+
+
+def is_partitioned(cursor, table: str) -> bool:
+    if USE_POSTGRES:
+        cursor.execute("SELECT relkind AS name FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+        return _names(cursor) == ['p']
+    cursor.execute("SELECT type AS name FROM sqlite_master WHERE name = ?", (table,))
+    return _names(cursor) == ['view']
+
+
+def list_partitions(cursor, table: str) -> dict:
+    """``{YYYYMM: partition name}`` of the month partitions (DEFAULT excluded)."""
+    if USE_POSTGRES:
+        cursor.execute(
+            "SELECT c.relname AS name FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)", (table,)
+        )
+    else:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (f'{table}_p%',)
+        )
+    prefix = f'{table}_p'
+    return {int(n[len(prefix):]): n for n in _names(cursor)
+            if n.startswith(prefix) and n[len(prefix):].isdigit()}
+
+
+def event_tables(cursor, table: str) -> list:
+    """Physical tables behind ``table`` for UPDATE / DELETE (SQLite views are read-only)."""
+    if USE_POSTGRES or not is_partitioned(cursor, table):
+        return [table]
+    months = list_partitions(cursor, table)
+    return [partition_name(table, DEFAULT)] + [months[k] for k in sorted(months)]
+
+
+# ─── DDL ──────────────────────────────────────────────────────────────────────
+
+def _columns(table: str) -> list:
+    """Column names of the event table, in DDL order."""
+    names = ['id']
+    for line in _EVENT_TABLES[table].splitlines():
+        line = line.strip()
+        if line:
+            names.append(line.split()[0])
+    return names
+
+
+def _lock(cursor) -> None:
+    """Serialize partition DDL across workers for the rest of the transaction."""
+    if USE_POSTGRES:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('naarad_partitions'))")
+    elif not cursor.connection.in_transaction:
+        cursor.execute('BEGIN IMMEDIATE')
+
+
+def _seed_sequence(cursor, name: str, seq: int) -> None:
+    """Make SQLite's AUTOINCREMENT for ``name`` continue after ``seq``."""
+    cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq, name))
+    cursor.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT ?, ? "
+        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)",
+        (name, seq, name)
+    )
+
+
+def _create_parent(cursor, table: str) -> None:
+    """Empty partitioned ``table`` plus its DEFAULT partition."""
+    columns = _EVENT_TABLES[table]
+    default = partition_name(table, DEFAULT)
+    if USE_POSTGRES:
+        # The partition key must be part of the primary key
+        cursor.execute(f'''
+            CREATE TABLE {table} (
+                id              BIGSERIAL,{columns.format(bigint='BIGINT')},
+                PRIMARY KEY (id, unix_ms)
+            ) PARTITION BY RANGE (unix_ms)
+        ''')
+        cursor.execute(f'CREATE TABLE {default} PARTITION OF {table} DEFAULT')
+    else:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {default} (
+                id              INTEGER PRIMARY KEY AUTOINCREMENT,{columns.format(bigint='INTEGER')})
+        ''')
+        _sqlite_partition_indexes(cursor, table, default)
+
+
+def _sqlite_partition_indexes(cursor, table: str, partition: str) -> None:
+    for name, idx_table, columns in _QUERY_INDEXES:
+        if idx_table == table:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name.replace(table, partition, 1)} '
+                f'ON {partition}({columns})'
+            )
+
+
+def _create_partition(cursor, table: str, key: int) -> str:
+    """Create one month; rows already parked in DEFAULT for that month move into it."""
+    name    = partition_name(table, key)
+    default = partition_name(table, DEFAULT)
+    lo, hi  = month_bounds(key)
+    if USE_POSTGRES:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'''WITH moved AS (
+                    DELETE FROM {default} WHERE unix_ms >= %s AND unix_ms < %s RETURNING *
+                ) INSERT INTO {name} SELECT * FROM moved''',
+            (lo, hi)
+        )
+        cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ({lo}) TO ({hi})')
+        return name
+
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id              INTEGER PRIMARY KEY AUTOINCREMENT,{_EVENT_TABLES[table].format(bigint='INTEGER')})
+    ''')
+    _seed_sequence(cursor, name, ((key // 100) * 12 + key % 100 - 1) << 32)
+    cols = ', '.join(_columns(table))
+    cursor.execute(
+        f'INSERT INTO {name} ({cols}) SELECT {cols} FROM {default} WHERE unix_ms >= ? AND unix_ms < ?',
+        (lo, hi)
+    )
+    cursor.execute(f'DELETE FROM {default} WHERE unix_ms >= ? AND unix_ms < ?', (lo, hi))
+    _sqlite_partition_indexes(cursor, table, name)
+    return name
+
+
+def _rebuild_sqlite_view(cursor, table: str) -> None:
+    """Recreate the UNION ALL view and its insert-routing trigger over the current months."""
+    months  = list_partitions(cursor, table)
+    default = partition_name(table, DEFAULT)
+    cols    = _columns(table)
+    arms    = [default] + [months[k] for k in sorted(months)]
+    cursor.execute(f'DROP VIEW IF EXISTS {table}')
+    cursor.execute(f'CREATE VIEW {table} AS ' + ' UNION ALL '.join(f'SELECT * FROM {t}' for t in arms))
+
+    values = ', '.join(f'NEW.{c}' for c in cols)
+    ranges, routes = [], []
+    for key in sorted(months):
+        lo, hi = month_bounds(key)
+        cond = f'NEW.unix_ms >= {lo} AND NEW.unix_ms < {hi}'
+        ranges.append(f'({cond})')
+        routes.append(f"INSERT INTO {months[key]} ({', '.join(cols)}) SELECT {values} WHERE {cond};")
+    in_month = ' OR '.join(ranges) or '0'
+    routes.append(
+        f"INSERT INTO {default} ({', '.join(cols)}) SELECT {values} "
+        f"WHERE NEW.unix_ms IS NULL OR NOT ({in_month});"
+    )
+    cursor.execute(
+        f"CREATE TRIGGER {table}_route INSTEAD OF INSERT ON {table} BEGIN {' '.join(routes)} END"
+    )
+
+
+def ensure_partitions(cursor, table: str, keys) -> list:
+    """Create the missing months among ``keys``; returns the new partition names."""
+    _lock(cursor)
+    existing = list_partitions(cursor, table)
+    created = [_create_partition(cursor, table, k) for k in sorted(set(keys)) if k not in existing]
+    if created and not USE_POSTGRES:
+        _rebuild_sqlite_view(cursor, table)
+    return created
+
+
+def drop_partitions_before(cursor, table: str, key: int) -> list:
+    """Drop every month older than ``key`` (and DEFAULT rows from before it)."""
+    _lock(cursor)
+    P = placeholder()
+    dropped = [name for k, name in sorted(list_partitions(cursor, table).items()) if k < key]
+    for name in dropped:
+        cursor.execute(f'DROP TABLE {name}')
+        _forget(name)
+    cursor.execute(
+        f'DELETE FROM {partition_name(table, DEFAULT)} WHERE unix_ms < {P}', (month_bounds(key)[0],)
+    )
+    if dropped and not USE_POSTGRES:
+        _rebuild_sqlite_view(cursor, table)
+    return dropped
+
+
+def _upcoming_months() -> list:
+    current = current_month()
+    return [shift_month(current, i) for i in range(max(0, Config.PARTITION_PREMAKE_MONTHS) + 1)]
+
+
+def _oldest_kept() -> int:
+    """First month inside EVENT_RETENTION_MONTHS (the current month counts)."""
+    return shift_month(current_month(), 1 - Config.EVENT_RETENTION_MONTHS)
+
+
+def partition_event_tables(conn, cursor) -> None:
+    """Move plain open_events / clicks into monthly partitions (v8); skips tables already split.
+
+    Callers drop the views over the event tables first; ids are preserved.
+    """
+    for table in EVENT_TABLES:
+        if is_partitioned(cursor, table):
+            continue
+        legacy = f'{table}_unpartitioned'
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+        cols = [c for c in _columns(table) if c in _table_columns(cursor, legacy)]
+        col_list = ', '.join(cols)
+
+        if USE_POSTGRES:
+            cursor.execute(
+                f"SELECT DISTINCT CAST(to_char(to_timestamp(unix_ms / 1000.0) AT TIME ZONE 'UTC', "
+                f"'YYYYMM') AS INTEGER) FROM {legacy} WHERE unix_ms IS NOT NULL"
+            )
+        else:
+            cursor.execute(
+                f"SELECT DISTINCT CAST(strftime('%Y%m', unix_ms / 1000, 'unixepoch') AS INTEGER) "
+                f"FROM {legacy} WHERE unix_ms IS NOT NULL"
+            )
+        months = {r[0] for r in cursor.fetchall()}
+
+        _create_parent(cursor, table)
+        for key in sorted(months | set(_upcoming_months())):
+            _create_partition(cursor, table, key)
+
+        if USE_POSTGRES:
+            # unix_ms is part of the key: rows without one are parked in DEFAULT as 0
+            select = col_list.replace('unix_ms', 'COALESCE(unix_ms, 0)')
+            cursor.execute(f'INSERT INTO {table} ({col_list}) SELECT {select} FROM {legacy}')
+            moved = cursor.rowcount
+            cursor.execute(f'DROP TABLE {legacy}')
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+            )
+        else:
+            moved = 0
+            for key in sorted(months):
+                lo, hi = month_bounds(key)
+                cursor.execute(
+                    f'INSERT INTO {partition_name(table, key)} ({col_list}) '
+                    f'SELECT {col_list} FROM {legacy} WHERE unix_ms >= ? AND unix_ms < ?', (lo, hi)
+                )
+                moved += cursor.rowcount
+            default = partition_name(table, DEFAULT)
+            cursor.execute(
+                f'INSERT INTO {default} ({col_list}) SELECT {col_list} FROM {legacy} WHERE unix_ms IS NULL'
+            )
+            moved += cursor.rowcount
+            # New DEFAULT rows continue after the old ids; months have their own ranges
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {legacy}')
+            _seed_sequence(cursor, default, cursor.fetchone()[0])
+            cursor.execute(f'DROP TABLE {legacy}')
+            _rebuild_sqlite_view(cursor, table)
+        conn.commit()
+        log.info("[DB] Partitioned %s by month (%d rows, %d months)", table, moved, len(months))
+
+
+# ─── Runtime ──────────────────────────────────────────────────────────────────
+
+_known = set()          # SQLite month tables seen to exist (this DB_FILE)
+_known_db = None
+_known_lock = threading.Lock()
+
+
+def _forget(name: str) -> None:
+    with _known_lock:
+        _known.discard(name)
+
+
+def forget_partitions() -> None:
+    global _known_db
+    with _known_lock:
+        _known.clear()
+        _known_db = None
+
+
+def insert_target(cursor, table: str, unix_ms) -> str:
+    """Table an event row should be INSERTed into.
+
+    PostgreSQL routes on its own. On SQLite this is the month table when it
+    exists, else the view (whose trigger parks the row in DEFAULT).
+    """
+    global _known_db
+    if USE_POSTGRES or unix_ms is None:
+        return table
+    key = month_key(unix_ms)
+    if Config.EVENT_RETENTION_MONTHS > 0 and key < _oldest_kept():
+        return table        # outside the window; the month may already be dropped
+    name = partition_name(table, key)
+    with _known_lock:
+        if _known_db != Config.DB_FILE:
+            _known.clear()
+            _known_db = Config.DB_FILE
+        if name in _known:
+            return name
+    months = list_partitions(cursor, table)
+    with _known_lock:
+        _known.update(months.values())
+    return name if key in months else table
+
+
+def maintain_event_partitions():
+    """Maintenance job: create upcoming months, drop months past EVENT_RETENTION_MONTHS."""
+    conn   = get_db()
+    cursor = get_cursor(conn)
+    created, dropped = [], []
+    for table in EVENT_TABLES:
+        try:
+            if not is_partitioned(cursor, table):
+                continue
+            created += ensure_partitions(cursor, table, _upcoming_months())
+            if Config.EVENT_RETENTION_MONTHS > 0:
+                dropped += drop_partitions_before(cursor, table, _oldest_kept())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    if created or dropped:
+        return {'created': created, 'dropped': dropped}
+    return None
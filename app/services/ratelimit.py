@@ -0,0 +1,250 @@
+"""
+naarad - Rate Limiting
+Per-key sliding-window-counter limiter shared by the tracking and API routes.
+
+Each key holds a fixed three-slot state — (window index, previous window
+count, current window count) — instead of a list of hit timestamps. A hit
+is allowed while
+
+    prev * (1 - elapsed_fraction_of_current_window) + curr < limit
+
+which approximates a true sliding 60 s window in O(1) time and memory.
+
+Keys are spread over lock stripes so concurrent requests for different IPs
+rarely contend. Each stripe keeps its keys in least-recently-hit order.
+Every hit evicts a couple of expired keys from the front, so memory stays
+bounded without a periodic full scan under a global lock.
+
+Backends (RATE_LIMIT_BACKEND)
+  - memory : per-process dict — with N Gunicorn workers the effective
+             limit is N x the configured value (default)
+  - shared : fixed-size hash table in a memory-mapped file shared by every
+             worker on the host; stripes are guarded by fcntl byte-range
+             locks (plus a thread lock), so limits are exact per host
+"""
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from time import time
+
+from ..config import Config
+
+try:
+    import fcntl
+except ImportError:          # Windows — shared backend unavailable
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+WINDOW_SECONDS = 60.0
+_STRIPES       = 64        # power of two
+_MAX_KEYS      = 100_000   # across all stripes
+_EVICT_PER_HIT = 2
+
+
+class _Stripe:
+    __slots__ = ('lock', 'keys')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = OrderedDict()    # key -> [window_idx, prev_count, curr_count]
+
+
+class SlidingWindowLimiter:
+    """In-process limiter; exact per worker process."""
+
+    def __init__(self, window: float = WINDOW_SECONDS, stripes: int = _STRIPES,
+                 max_keys: int = _MAX_KEYS):
+        self._window   = window
+        self._stripes  = [_Stripe() for _ in range(stripes)]
+        self._mask     = stripes - 1
+        self._cap      = max(1, max_keys // stripes)
+
+    def hit(self, key: str, limit: int, now: float = None) -> bool:
+        """Count one hit for ``key``. Returns True if it exceeds ``limit``."""
+        if not limit:
+            return False
+        now    = time() if now is None else now
+        idx    = int(now // self._window)
+        weight = 1.0 - (now % self._window) / self._window
+        stripe = self._stripes[hash(key) & self._mask]
+
+        with stripe.lock:
+            keys  = stripe.keys
+            state = keys.get(key)
+            if state is None:
+                state = keys[key] = [idx, 0, 0]
+            else:
+                if state[0] != idx:
+                    prev = state[2] if state[0] == idx - 1 else 0
+                    state[0], state[1], state[2] = idx, prev, 0
+                keys.move_to_end(key)
+
+            limited = state[1] * weight + state[2] >= limit
+            if not limited:
+                state[2] += 1
+            self._evict(keys, idx)
+        return limited
+
+    def _evict(self, keys: OrderedDict, idx: int) -> None:
+        """Drop a few least-recently-hit keys whose windows have both expired."""
+        for _ in range(_EVICT_PER_HIT):
+            oldest_key, oldest = next(iter(keys.items()))
+            if oldest[0] >= idx - 1:
+                break
+            del keys[oldest_key]
+        while len(keys) > self._cap:
+            keys.popitem(last=False)
+
+    def __len__(self):
+        return sum(len(s.keys) for s in self._stripes)
+
+
+# ─── Shared-memory backend ────────────────────────────────────────────────────
+
+_SHM_MAGIC  = b'NRRL'
+_SHM_HEADER = struct.Struct('<4sII')     # magic, slot count, stripe count
+_SHM_SLOT   = struct.Struct('<QqII')     # key hash (0 = empty), window idx, prev, curr
+
+
+class SharedMemoryLimiter:
+    """
+    Sliding-window counters in an mmap'd open-addressing hash table.
+
+    The table is split into stripes; a key hashes to one stripe and probes
+    linearly inside it, so one stripe lock covers every slot a key can use.
+    Slots are never emptied: a slot whose windows have both expired is
+    reused in place, which keeps probe chains intact without tombstones.
+    """
+
+    def __init__(self, path: str, slots: int = 65536, stripes: int = 256,
+                 window: float = WINDOW_SECONDS):
+        if fcntl is None:
+            raise RuntimeError('shared rate limiting needs fcntl (POSIX)')
+        stripes = max(1, min(stripes, slots))
+        self._window     = window
+        self._stripes    = stripes
+        self._per_stripe = max(1, slots // stripes)
+        self._slots      = self._per_stripe * stripes
+        self._size       = _SHM_HEADER.size + self._slots * _SHM_SLOT.size
+        self._locks      = [threading.Lock() for _ in range(stripes)]
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)           # whole file while initialising
+        try:
+            header = os.pread(self._fd, _SHM_HEADER.size, 0)
+            expected = _SHM_HEADER.pack(_SHM_MAGIC, self._slots, stripes)
+            if header != expected:
+                if header:
+                    log.warning("[RATE] Re-initialising %s (layout changed)", path)
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self._size)
+                os.pwrite(self._fd, expected, 0)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self._mm = mmap.mmap(self._fd, self._size)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        # Stable across processes (builtin hash() is salted per process)
+        h = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+        return h or 1
+
+    def hit(self, key: str, limit: int, now: float = None) -> bool:
+        """Count one hit for ``key``. Returns True if it exceeds ``limit``."""
+        if not limit:
+            return False
+        now    = time() if now is None else now
+        idx    = int(now // self._window)
+        weight = 1.0 - (now % self._window) / self._window
+        h      = self._hash(key)
+        stripe = h % self._stripes
+        base   = _SHM_HEADER.size + stripe * self._per_stripe * _SHM_SLOT.size
+        length = self._per_stripe * _SHM_SLOT.size
+        start  = (h >> 32) % self._per_stripe
+
+        with self._locks[stripe]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, base)
+            try:
+                return self._hit_locked(h, base, start, idx, weight, limit)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, base)
+
+    def _hit_locked(self, h, base, start, idx, weight, limit) -> bool:
+        mm, slot, n = self._mm, _SHM_SLOT, self._per_stripe
+        found = reuse = oldest = None
+        oldest_idx = None
+        for i in range(n):
+            off = base + ((start + i) % n) * slot.size
+            kh, widx, prev, curr = slot.unpack_from(mm, off)
+            if kh == h:
+                found = (off, widx, prev, curr)
+                break
+            if kh == 0:
+                if reuse is None:
+                    reuse = off
+                break                      # end of probe chain — key absent
+            if reuse is None and widx < idx - 1:
+                reuse = off                # expired: reusable in place
+            if oldest_idx is None or widx < oldest_idx:
+                oldest, oldest_idx = off, widx
+
+        if found is not None:
+            off, widx, prev, curr = found
+            if widx != idx:
+                prev, curr = (curr if widx == idx - 1 else 0), 0
+        else:
+            # Full stripe with nothing expired: evict the least recent key
+            off = reuse if reuse is not None else oldest
+            prev = curr = 0
+
+        limited = prev * weight + curr >= limit
+        if not limited:
+            curr += 1
+        slot.pack_into(mm, off, h, idx, prev, curr)
+        return limited
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+
+# ─── Backend selection ────────────────────────────────────────────────────────
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend():
+    if Config.RATE_LIMIT_BACKEND == 'shared':
+        try:
+            limiter = SharedMemoryLimiter(Config.RATE_LIMIT_SHM_PATH, Config.RATE_LIMIT_SHM_SLOTS)
+            log.info("[RATE] Shared rate-limit table at %s (%d slots)",
+                     Config.RATE_LIMIT_SHM_PATH, Config.RATE_LIMIT_SHM_SLOTS)
+            return limiter
+        except Exception as e:
+            log.warning("[RATE] Shared backend unavailable (%s) — using per-process limits", e)
+    return SlidingWindowLimiter()
+
+
+def get_limiter():
+    """The process-wide limiter, created on first use (after Gunicorn forks)."""
+    global _backend
+    limiter = _backend
+    if limiter is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend()
+            limiter = _backend
+    return limiter
+
+
+def is_rate_limited(scope: str, key: str, limit: int) -> bool:
+    """True if ``key`` has exceeded ``limit`` hits per minute within ``scope``."""
+    if not limit:
+        return False
+    return get_limiter().hit(f'{scope}:{key}', limit)
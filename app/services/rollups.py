@@ -0,0 +1,227 @@
+"""
+naarad - Event Rollups
+Counter tables kept up to date by the ingest path, in the same transaction
+as the raw open_events / clicks rows:
+
+  rollup_daily           (track_id, kind, day)                 -> events
+  rollup_visits          (track_id, kind, day, ua_id, geo_id)  -> events
+  rollup_fingerprints    (track_id, kind, fingerprint)
+  rollup_campaign_daily  (campaign_id, kind, day, track_id)    -> events
+
+``kind`` is 'open' or 'click'. rollup_visits counts by dimension id, and the
+device / browser / country histograms are joined in at read time, so deferred
+geo enrichment and ``manage.py reparse_ua`` show up in them like they do in
+the raw rows. Fingerprints are kept as a set per track (not per day), so
+unique counts stay exact.
+
+Analytics read only these tables: cost follows distinct visitors and days,
+not the number of events. With EVENT_ROLLUP_DAYS set, the compaction job
+deletes raw rows older than the cutoff in chunks (their counts already live
+here).
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from ..config import Config
+from ..database import get_db, get_cursor, placeholder
+from ..utils import now, to_ms, ms_to_iso
+from .partitions import event_tables
+
+log = logging.getLogger(__name__)
+
+# kind -> (event table, date column)
+KINDS = {
+    'open':  ('open_events', 'open_date'),
+    'click': ('clicks', 'click_date'),
+}
+BREAKDOWNS = ('device_type', 'browser', 'country')
+_VISIT_KEYS = ('track_id', 'kind', 'day', 'ua_id', 'geo_id')
+_BACKFILL_CHUNK = 1000
+
+
+def _row_get(r, idx, key):
+    return r[key] if hasattr(r, 'keys') else r[idx]
+
+
+def rollup_cutoff_ms() -> int:
+    """Start of the oldest UTC day still kept as raw rows."""
+    today = now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return to_ms(today - timedelta(days=Config.EVENT_ROLLUP_DAYS))
+
+
+# ─── Writes ───────────────────────────────────────────────────────────────────
+
+def _add_counts(cursor, P: str, table: str, keys: tuple, counts: Counter) -> None:
+    """Upsert ``{key tuple: events}`` into a counter table (one statement per batch)."""
+    if not counts:
+        return
+    sql = (
+        f"INSERT INTO {table} ({', '.join(keys)}, events) VALUES ({', '.join([P] * (len(keys) + 1))}) "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET events = {table}.events + excluded.events"
+    )
+    rows = [key + (n,) for key, n in counts.items()]
+    if len(rows) == 1:
+        cursor.execute(sql, rows[0])
+    else:
+        cursor.executemany(sql, rows)
+
+
+def record_events(cursor, P: str, kind: str, items: list) -> None:
+    """
+    Count events into the rollups (call in the transaction that inserts them).
+
+    ``items``: ``(track_id, campaign_id, day, fingerprint, ua_id, geo_id)``
+    per event; a batch is folded into one upsert per counter row.
+    """
+    daily, visits, campaigns, fingerprints = Counter(), Counter(), Counter(), set()
+    for track_id, campaign_id, day, fingerprint, ua_id, geo_id in items:
+        daily[(track_id, kind, day)] += 1
+        visits[(track_id, kind, day, ua_id or 0, geo_id or 0)] += 1
+        if campaign_id:
+            campaigns[(campaign_id, kind, day, track_id)] += 1
+        if fingerprint is not None:
+            fingerprints.add((track_id, kind, fingerprint))
+
+    for table, keys, counts in (
+        ('rollup_daily',          ('track_id', 'kind', 'day'),                 daily),
+        ('rollup_visits',         _VISIT_KEYS,                                 visits),
+        ('rollup_campaign_daily', ('campaign_id', 'kind', 'day', 'track_id'),  campaigns),
+    ):
+        _add_counts(cursor, P, table, keys, counts)
+    if fingerprints:
+        cursor.executemany(
+            f'''INSERT INTO rollup_fingerprints (track_id, kind, fingerprint) VALUES ({P}, {P}, {P})
+                ON CONFLICT (track_id, kind, fingerprint) DO NOTHING''',
+            list(fingerprints)
+        )
+
+
+def backfill_rollups(conn, cursor) -> None:
+    """Count every raw event still on disk into the rollups (v9, one transaction).
+
+    rollup_visits only gets rows from this back-fill or from ingest after it,
+    so a non-empty table means the events are already counted.
+    """
+    P = placeholder()
+    cursor.execute('SELECT 1 FROM rollup_visits LIMIT 1')
+    if not cursor.fetchone():
+        _count_raw_events(cursor, P)
+        conn.commit()
+
+
+def _count_raw_events(cursor, P: str) -> None:
+    total = 0
+    for kind, (table, date_col) in KINDS.items():
+        for target in event_tables(cursor, table):
+            last_id = None
+            while True:
+                where = '' if last_id is None else f'WHERE id > {P}'
+                cursor.execute(
+                    f'''SELECT id, track_id, campaign_id, {date_col}, unix_ms, fingerprint, ua_id, geo_id
+                        FROM {target} {where} ORDER BY id LIMIT {_BACKFILL_CHUNK}''',
+                    () if last_id is None else (last_id,)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                record_events(cursor, P, kind, [
+                    (r[1], r[2], r[3] or (ms_to_iso(r[4])[:10] if r[4] is not None else None),
+                     r[5], r[6], r[7])
+                    for r in rows if r[3] or r[4] is not None
+                ])
+                total += len(rows)
+                last_id = rows[-1][0]
+    if total:
+        log.info("[DB] Counted %d existing events into the rollup tables", total)
+
+
+# ─── Compaction ───────────────────────────────────────────────────────────────
+
+def compact_events(chunk=None):
+    """
+    Maintenance job: delete raw events older than EVENT_ROLLUP_DAYS in
+    LIMITed chunks (one short transaction each). Their counts were added to
+    the rollups when they were ingested.
+
+    Returns ``{kind: rows deleted}``, or None when disabled / nothing to do.
+    """
+    if Config.EVENT_ROLLUP_DAYS <= 0:
+        return None
+    chunk  = chunk or Config.EVENT_ROLLUP_CHUNK
+    cutoff = rollup_cutoff_ms()
+    conn   = get_db()
+    cursor = get_cursor(conn)
+    P      = placeholder()
+    compacted = {}
+    for kind, (table, _) in KINDS.items():
+        for target in event_tables(cursor, table):
+            while True:
+                cursor.execute(
+                    f'''DELETE FROM {target} WHERE id IN (
+                           SELECT id FROM {target} WHERE unix_ms < {P} LIMIT {P})''',
+                    (cutoff, chunk)
+                )
+                conn.commit()
+                if cursor.rowcount > 0:
+                    compacted[kind] = compacted.get(kind, 0) + cursor.rowcount
+                if cursor.rowcount < chunk:
+                    break
+    if compacted:
+        log.info("[ROLLUP] Deleted raw events older than %s: %s", ms_to_iso(cutoff), compacted)
+        return compacted
+    return None
+
+
+# ─── Reads ────────────────────────────────────────────────────────────────────
+
+def unique_fingerprints(cursor, P: str, track_id: str) -> dict:
+    """``{kind: distinct fingerprints}`` of one track."""
+    cursor.execute(
+        f'''SELECT kind, COUNT(*) AS n FROM rollup_fingerprints
+            WHERE track_id = {P} GROUP BY kind''',
+        (track_id,)
+    )
+    counts = dict.fromkeys(KINDS, 0)
+    counts.update({_row_get(r, 0, 'kind'): _row_get(r, 1, 'n') for r in cursor.fetchall()})
+    return counts
+
+
+def breakdowns(cursor, P: str, track_id: str, kind: str) -> dict:
+    """``{dimension: {value: events}}`` for device_type, browser and country."""
+    cursor.execute(
+        f'''SELECT u.device_type, u.browser, g.country, SUM(r.events) AS events
+            FROM rollup_visits r
+            LEFT JOIN ua_dim u  ON u.id = r.ua_id
+            LEFT JOIN geo_dim g ON g.id = r.geo_id
+            WHERE r.track_id = {P} AND r.kind = {P}
+            GROUP BY u.device_type, u.browser, g.country''',
+        (track_id, kind)
+    )
+    result = {dimension: Counter() for dimension in BREAKDOWNS}
+    for r in cursor.fetchall():
+        events = int(_row_get(r, 3, 'events'))
+        for i, dimension in enumerate(BREAKDOWNS):
+            result[dimension][_row_get(r, i, dimension)] += events
+    return {dimension: dict(counts) for dimension, counts in result.items()}
+
+
+def timelines(cursor, P: str, key_col: str, key: str) -> dict:
+    """``{kind: [{'date', 'count'}, ...]}`` per day for one track or campaign."""
+    if key_col == 'track_id':
+        sql = f'SELECT kind, day, events FROM rollup_daily WHERE track_id = {P} ORDER BY kind, day'
+    else:
+        sql = f'''SELECT kind, day, SUM(events) AS events FROM rollup_campaign_daily
+                  WHERE campaign_id = {P} GROUP BY kind, day ORDER BY kind, day'''
+    cursor.execute(sql, (key,))
+    result = {kind: [] for kind in KINDS}
+    for r in cursor.fetchall():
+        result[_row_get(r, 0, 'kind')].append(
+            {'date': _row_get(r, 1, 'day'), 'count': _row_get(r, 2, 'events')}
+        )
+    return result
+
+
+def delete_rollups(cursor, P: str, track_id: str) -> None:
+    for table in ('rollup_daily', 'rollup_visits', 'rollup_fingerprints', 'rollup_campaign_daily'):
+        cursor.execute(f'DELETE FROM {table} WHERE track_id = {P}', (track_id,))
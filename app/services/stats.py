@@ -0,0 +1,146 @@
+"""
+naarad - Dashboard Stats Cache
+/api/stats aggregates the whole ``tracks`` table, and every open dashboard
+tab asks for it every 30 s. The result is cached per process and keyed by a
+global data version that every writer of ``tracks`` bumps right after its
+commit. It is never bumped inside the writer's transaction, so it takes no
+lock that writers would queue on: PostgreSQL uses a sequence (``nextval``
+is not transactional), and SQLite a one-row table in its own short
+transaction (SQLite has a single writer anyway).
+
+A snapshot younger than STATS_CACHE_SECONDS is served as is. After that, one
+primary-key read of the version decides. If the version is unchanged, the
+snapshot is kept for another period; otherwise it is recomputed. The
+recompute is single-flight: one thread runs it while concurrent requests
+get the previous snapshot instead of queueing on the same aggregates.
+"""
+import logging
+import threading
+import time
+
+from ..config import Config
+from ..database import USE_POSTGRES
+
+log = logging.getLogger(__name__)
+
+
+def bump_data_version(conn, cursor) -> None:
+    """Mark the stats stale. Call after the write has committed, never before:
+    a snapshot taken in between is recomputed once more, never kept stale."""
+    try:
+        if USE_POSTGRES:
+            cursor.execute("SELECT nextval('data_version_seq')")
+        else:
+            cursor.execute('UPDATE data_version SET version = version + 1 WHERE id = 1')
+        conn.commit()
+    except Exception as e:
+        log.warning("[STATS] Could not bump the data version: %s", e)
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+
+def read_data_version(cursor) -> int:
+    if USE_POSTGRES:
+        cursor.execute('SELECT last_value AS version, is_called FROM data_version_seq')
+        r = cursor.fetchone()
+        version, is_called = (r['version'], r['is_called']) if hasattr(r, 'keys') else r
+        return version if is_called else 0
+    cursor.execute('SELECT version FROM data_version WHERE id = 1')
+    r = cursor.fetchone()
+    if r is None:
+        return 0
+    return r['version'] if hasattr(r, 'keys') else r[0]
+
+
+class _StatsCache:
+    """Latest stats snapshot plus the data version it was computed at."""
+
+    def __init__(self):
+        self._lock    = threading.Lock()
+        self._refresh = threading.Lock()        # single-flight recompute
+        self._db      = None
+        self._payload = None
+        self._version = None
+        self._checked = 0.0                     # monotonic time the snapshot was last confirmed
+        self.stats    = {'hits': 0, 'version_checks': 0, 'recomputes': 0, 'stale_served': 0}
+
+    def _fresh(self):
+        """The snapshot if it is still within its budget (call with _lock held)."""
+        if self._db != (Config.DATABASE_URL or Config.DB_FILE):
+            return None
+        if time.monotonic() - self._checked < Config.STATS_CACHE_SECONDS:
+            return self._payload
+        return None
+
+    def _current(self):
+        with self._lock:
+            if self._db == (Config.DATABASE_URL or Config.DB_FILE):
+                return self._payload
+            return None
+
+    def get(self, cursor, compute):
+        if Config.STATS_CACHE_SECONDS <= 0:
+            return compute()
+        with self._lock:
+            payload = self._fresh()
+            if payload is not None:
+                self.stats['hits'] += 1
+                return payload
+        previous = self._current()
+
+        # Only the first request ever (no snapshot yet) waits for the recompute
+        if not self._refresh.acquire(blocking=previous is None):
+            with self._lock:
+                self.stats['stale_served'] += 1
+            return previous
+        try:
+            with self._lock:
+                payload = self._fresh()     # refreshed while we waited
+                if payload is not None:
+                    self.stats['hits'] += 1
+                    return payload
+            version = read_data_version(cursor)
+            with self._lock:
+                self.stats['version_checks'] += 1
+                if previous is not None and version == self._version:
+                    self._checked = time.monotonic()
+                    return previous
+            # Version read first: a write landing during compute() shows up next time
+            payload = compute()
+            with self._lock:
+                self._db      = Config.DATABASE_URL or Config.DB_FILE
+                self._payload = payload
+                self._version = version
+                self._checked = time.monotonic()
+                self.stats['recomputes'] += 1
+            return payload
+        finally:
+            self._refresh.release()
+
+    def clear(self):
+        with self._lock:
+            self._payload = self._version = self._db = None
+            self._checked = 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, version=self._version,
+                        age_s=round(time.monotonic() - self._checked, 1) if self._payload else None)
+
+
+_cache = _StatsCache()
+
+
+def cached_stats(cursor, compute):
+    """``compute()``'s result, recomputed only when the data version moved."""
+    return _cache.get(cursor, compute)
+
+
+def forget_stats() -> None:
+    _cache.clear()
+
+
+def stats_cache_stats() -> dict:
+    return _cache.snapshot()
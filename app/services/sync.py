@@ -8,11 +8,17 @@ import time
 import json
 import logging
 import threading
+import urllib.parse
 import urllib.request
-from datetime import datetime, timezone
+from flask import g
 from ..config import Config
 from ..database import get_db, get_cursor, placeholder
-from ..utils import now_iso
+from ..utils import iso_to_ms, ms_to_iso
+from .links import ensure_links
+from .dims import DIMENSIONS, DimBatch, row_values
+from .partitions import event_tables, insert_target
+from .rollups import record_events
+from .stats import bump_data_version
 
 log = logging.getLogger(__name__)
 
@@ -27,38 +33,59 @@ _ALLOWED_TRACK_COLS = frozenset([
     'ip_address', 'country', 'region', 'city', 'latitude', 'longitude',
     'timezone', 'isp', 'org', 'asn',
     'user_agent', 'browser', 'browser_version', 'os', 'os_version',
-    'device_type', 'device_brand', 'is_mobile', 'is_bot',
+    'device_type', 'device_brand', 'is_mobile', 'is_bot', 'is_proxy',
     'referer', 'accept_language', 'accept_encoding', 'accept_header',
     'connection_type', 'do_not_track', 'cache_control',
     'sec_ch_ua', 'sec_ch_ua_mobile', 'sec_ch_ua_platform',
-    'open_count', 'click_count', 'first_seen', 'last_seen',
+    'open_count', 'click_count', 'first_seen', 'last_seen', 'first_seen_ms', 'last_seen_ms',
 ])
 
 _ALLOWED_CLICK_COLS = frozenset([
-    'id', 'timestamp', 'track_id', 'campaign_id', 'link_id', 'target_url',
+    'id', 'timestamp', 'unix_ms', 'track_id', 'campaign_id', 'link_id', 'target_url',
     'ip_address', 'country', 'city', 'user_agent', 'browser',
     'os', 'device_type', 'referer',
 ])
 
+# Stored on the clicks row itself; the rest is interned into the dimension tables
+_CLICK_EVENT_COLS = ('timestamp', 'unix_ms', 'track_id', 'campaign_id', 'link_id', 'target_url')
+
 
 def _filter_keys(record, allowed_cols):
     """Return a new dict with only whitelisted keys (prevent SQL injection)."""
     return {k: v for k, v in record.items() if k in allowed_cols}
 
 
-def _get_max_timestamp(conn, cursor, table_name, column_name):
-    """Get the latest timestamp we have locally to avoid pulling old data."""
+def _fill_epoch_ms(record, ms_col, *iso_cols):
+    """Derive ``ms_col`` from the ISO columns when the remote did not send it (older nodes)."""
+    if record.get(ms_col) is None:
+        for col in iso_cols:
+            ms = iso_to_ms(record.get(col))
+            if ms is not None:
+                record[ms_col] = ms
+                break
+    return record
+
+
+def _get_max_ms(conn, cursor, table_name, column_name):
+    """Latest epoch-ms watermark we have locally (0 if empty) to avoid pulling old data."""
     # Only allow known table/column names to prevent injection
-    allowed = {'tracks': ['last_seen', 'timestamp'], 'clicks': ['timestamp']}
+    allowed = {'tracks': ['last_seen_ms'], 'clicks': ['unix_ms']}
     if table_name not in allowed or column_name not in allowed[table_name]:
-        return '1970-01-01T00:00:00Z'
+        return 0
     try:
-        cursor.execute(f"SELECT MAX({column_name}) as max_ts FROM {table_name}")
+        if table_name == 'clicks':
+            # MAX per partition (index-only), not over the whole UNION ALL view
+            arms = ' UNION ALL '.join(
+                f"SELECT MAX({column_name}) AS max_ms FROM {t}" for t in event_tables(cursor, table_name)
+            )
+            cursor.execute(f"SELECT MAX(max_ms) as max_ms FROM ({arms}) m")
+        else:
+            cursor.execute(f"SELECT MAX({column_name}) as max_ms FROM {table_name}")
         row = cursor.fetchone()
-        max_ts = row['max_ts'] if hasattr(row, 'keys') else row[0]
-        return max_ts or '1970-01-01T00:00:00Z'
+        max_ms = row['max_ms'] if hasattr(row, 'keys') else row[0]
+        return int(max_ms or 0)
     except Exception:
-        return '1970-01-01T00:00:00Z'
+        return 0
 
 
 def _sync_loop(app_context_func):
@@ -71,21 +98,17 @@ def _sync_loop(app_context_func):
             time.sleep(Config.SYNC_INTERVAL)
             
             with app_context_func():
+                g.db_workload = 'analytics'     # keep bulk sync off the ingest pool
                 conn = get_db()
                 cursor = get_cursor(conn)
                 P = placeholder()
                 
                 try:
                     # 1. Ask remote for all records newer than our newest record
-                    last_seen = _get_max_timestamp(conn, cursor, 'tracks', 'last_seen')
-                    last_click = _get_max_timestamp(conn, cursor, 'clicks', 'timestamp')
-                    # Use datetime parsing for comparison instead of string
-                    try:
-                        dt_seen = datetime.fromisoformat(last_seen.replace('Z', '+00:00'))
-                        dt_click = datetime.fromisoformat(last_click.replace('Z', '+00:00'))
-                        query_since = last_seen if dt_seen >= dt_click else last_click
-                    except (ValueError, AttributeError):
-                        query_since = max(last_seen, last_click)
+                    since_ms = max(_get_max_ms(conn, cursor, 'tracks', 'last_seen_ms'),
+                                   _get_max_ms(conn, cursor, 'clicks', 'unix_ms'))
+                    # Sent as ISO so remotes that predate the epoch-ms columns understand it
+                    query_since = urllib.parse.quote(ms_to_iso(since_ms))
                     
                     # 2. Fetch data
                     req = urllib.request.Request(
@@ -107,11 +130,15 @@ def _sync_loop(app_context_func):
                     is_postgres = bool(Config.DATABASE_URL)
                     
                     # Merge clicks with deduplication check
+                    dims = DimBatch(cursor, P)
                     if clicks:
                         for click in clicks:
                             safe_click = _filter_keys(click, _ALLOWED_CLICK_COLS)
                             if not safe_click or 'track_id' not in safe_click or 'timestamp' not in safe_click:
                                 continue
+                            _fill_epoch_ms(safe_click, 'unix_ms', 'timestamp')
+                            if safe_click.get('unix_ms') is None:
+                                continue  # unix_ms is the partition key
                             # Dedup on track_id + timestamp + link_id for stronger uniqueness
                             link_id = safe_click.get('link_id', '')
                             cursor.execute(
@@ -121,13 +148,31 @@ def _sync_loop(app_context_func):
                             if cursor.fetchone():
                                 continue  # Skip duplicate
                             
-                            cols = [k for k in safe_click.keys() if k != 'id']
+                            # clicks.link_id references links — make sure the row exists.
+                            # A target the local check rejects keeps the click but not the link.
+                            if link_id and safe_click.get('target_url'):
+                                if not ensure_links(cursor, P, {link_id: safe_click['target_url']}):
+                                    safe_click.pop('link_id')
+                                    safe_click.pop('target_url')
+
+                            dim_ids = dims.resolve([{
+                                name: row_values(safe_click, fields)
+                                for name, (_, fields) in DIMENSIONS.items()
+                            }])[0]
+                            cols = [k for k in _CLICK_EVENT_COLS if k in safe_click]
                             vals = [safe_click[c] for c in cols]
+                            cols += ['geo_id', 'ua_id', 'header_id']
+                            vals += [dim_ids['geo'], dim_ids['ua'], dim_ids['header']]
                             places = ', '.join([P] * len(cols))
+                            target = insert_target(cursor, 'clicks', safe_click['unix_ms'])
                             cursor.execute(
-                                f"INSERT INTO clicks ({', '.join(cols)}) VALUES ({places})",
+                                f"INSERT INTO {target} ({', '.join(cols)}) VALUES ({places})",
                                 vals
                             )
+                            record_events(cursor, P, 'click', [(
+                                safe_click['track_id'], safe_click.get('campaign_id'),
+                                ms_to_iso(safe_click['unix_ms'])[:10], None, dim_ids['ua'], dim_ids['geo']
+                            )])
                     
                     # Merge tracks with proper upsert preserving local-only fields
                     if tracks:
@@ -139,6 +184,8 @@ def _sync_loop(app_context_func):
                             track_id = safe_track['track_id']
                             # Remove 'id' — let the local DB assign its own
                             safe_track.pop('id', None)
+                            _fill_epoch_ms(safe_track, 'first_seen_ms', 'first_seen', 'timestamp')
+                            _fill_epoch_ms(safe_track, 'last_seen_ms', 'last_seen', 'first_seen', 'timestamp')
                             
                             # Check if track exists locally
                             cursor.execute(
@@ -168,24 +215,18 @@ def _sync_loop(app_context_func):
                                 )
                     
                     conn.commit()
+                    bump_data_version(conn, cursor)
+                    dims.publish()
                     log.info("[SYNC] Merge complete.")
                     
                     # 4. Auto-wipe the remote if configured
                     if Config.SYNC_AUTO_WIPE:
-                        # Use datetime parsing for reliable comparison
-                        def _parse_ts(ts_str):
-                            try:
-                                return datetime.fromisoformat(ts_str.replace('Z', '+00:00'))
-                            except (ValueError, AttributeError):
-                                return datetime(1970, 1, 1, tzinfo=timezone.utc)
-                        
-                        track_ts = [_parse_ts(t.get('last_seen', '1970')) for t in tracks]
-                        click_ts = [_parse_ts(c.get('timestamp', '1970')) for c in clicks]
-                        all_ts = track_ts + click_ts
+                        track_ts = [iso_to_ms(t.get('last_seen_ms') or t.get('last_seen')) for t in tracks]
+                        click_ts = [iso_to_ms(c.get('unix_ms') or c.get('timestamp')) for c in clicks]
+                        all_ts = [ms for ms in track_ts + click_ts if ms is not None]
                         
                         if all_ts:
-                            max_dt = max(all_ts)
-                            wipe_until = max_dt.isoformat()
+                            wipe_until = urllib.parse.quote(ms_to_iso(max(all_ts)))
                             del_req = urllib.request.Request(
                                 f"{Config.SYNC_REMOTE_URL}/api/sync?until={wipe_until}",
                                 method='DELETE',
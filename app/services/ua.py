@@ -1,8 +1,22 @@
 """
 naarad - User-Agent Parsing
+
+All patterns are compiled once at import. Results are memoised in a bounded
+LRU keyed by the raw UA string (UA_CACHE_SIZE) — the set of distinct UAs
+hitting a tracker is small (mostly email clients), so nearly every open and
+click is a cache hit.
+
+Email clients are recognised before generic browsers: Gmail / Yahoo image
+proxies, Outlook, Apple Mail (WebKit without a Safari token) and Thunderbird.
 """
 
 import re
+from functools import lru_cache
+
+from ..config import Config
+
+# Longer UAs are parsed on their first _UA_MAX_LEN chars (bounds memo memory)
+_UA_MAX_LEN = 512
 
 
 def _get_empty_ua():
@@ -10,94 +24,131 @@ def _get_empty_ua():
     return {
         'browser': 'Unknown', 'browser_version': '', 'os': 'Unknown',
         'os_version': '', 'device_type': 'Unknown', 'device_brand': 'Unknown',
-        'is_mobile': False, 'is_bot': False
+        'is_mobile': False, 'is_bot': False, 'is_proxy': False
     }
 
 
-def parse_user_agent(ua_string):
-    """
-    Parse a User-Agent string to extract browser, OS, and device type.
-    Returns a dict with: browser, browser_version, os, os_version,
-    device_type, device_brand, is_mobile, is_bot
-    """
-    if not ua_string:
-        return _get_empty_ua()
+# ── Email clients (checked first) ─────────────────────────────────────────────
+# (pattern, client name, device_type override or None)
+_EMAIL_CLIENT_PATTERNS = [
+    # Image proxies fetch pixels on behalf of the reader — no real device info
+    (re.compile(r'googleimageproxy'), 'Gmail', 'Proxy'),
+    (re.compile(r'yahoomailproxy'), 'Yahoo Mail', 'Proxy'),
+    (re.compile(r'microsoft outlook ([\d.]+)'), 'Outlook', None),
+    (re.compile(r'msoffice ([\d.]+)'), 'Outlook', None),
+    (re.compile(r'outlook-(?:ios|android)/([\d.]+)'), 'Outlook', None),
+    (re.compile(r'thunderbird/([\d.]+)'), 'Thunderbird', None),
+]
 
-    ua_lower = ua_string.lower()
+# Apple Mail (macOS / iOS) renders with WebKit but sends no Safari/Chrome token
+_APPLE_WEBKIT_RE = re.compile(r'applewebkit/([\d.]+)')
+_APPLE_DEVICE_RE = re.compile(r'macintosh|iphone|ipad')
+_WEB_BROWSER_RE  = re.compile(r'safari|chrome|crios|fxios|edg')
+
+# ── Browsers ──────────────────────────────────────────────────────────────────
+# Order matters: most specific first to avoid misidentification.
+# Edge must come before Chrome; Opera before Chrome; Chromium before Chrome.
+_BROWSER_PATTERNS = [
+    (re.compile(r'edg(?:e|\/)([\d.]+)'), 'Edge'),
+    (re.compile(r'opr\/([\d.]+)'), 'Opera'),
+    (re.compile(r'chromium\/([\d.]+)'), 'Chromium'),
+    (re.compile(r'chrome\/([\d.]+)'), 'Chrome'),
+    (re.compile(r'firefox\/([\d.]+)'), 'Firefox'),
+    # Safari must be last: Chrome/Edge UAs also contain "Safari/"
+    (re.compile(r'version\/([\d.]+).*safari'), 'Safari'),
+]
+
+# ── Operating systems ─────────────────────────────────────────────────────────
+_OS_PATTERNS = [
+    (re.compile(r'windows nt ([\d.]+)'), 'Windows'),
+    (re.compile(r'mac os x ([\d_.]+)'), 'macOS'),
+    (re.compile(r'android ([\d.]+)'), 'Android'),
+    (re.compile(r'iphone os ([\d_]+)'), 'iOS'),
+    (re.compile(r'ipad.*os ([\d_]+)'), 'iPadOS'),
+    (re.compile(r'linux'), 'Linux'),
+]
+
+_BOT_RE = re.compile(
+    r'bot|crawler|spider|preview|slurp|facebot|ia_archiver'
+)
+_MOBILE_RE = re.compile(r'mobile|iphone|ipod')
 
-    # ── Browser Detection ───────────────────────────────────────────────────
-    # Order matters: most specific first to avoid misidentification.
-    # Edge must come before Chrome; Opera before Chrome; Chromium before Chrome.
-    browser, browser_version = 'Other', ''
-    patterns = [
-        (r'edg(?:e|\/)([\d.]+)', 'Edge'),
-        (r'opr\/([\d.]+)', 'Opera'),
-        (r'chromium\/([\d.]+)', 'Chromium'),
-        (r'chrome\/([\d.]+)', 'Chrome'),
-        (r'firefox\/([\d.]+)', 'Firefox'),
-        # Safari must be last: Chrome/Edge UAs also contain "Safari/"
-        (r'version\/([\d.]+).*safari', 'Safari'),
-    ]
+_BRANDS = [
+    (re.compile(r'iphone|ipad|macintosh'), 'Apple'),
+    (re.compile(r'samsung'), 'Samsung'),
+    (re.compile(r'pixel'), 'Google'),
+    (re.compile(r'huawei'), 'Huawei'),
+    (re.compile(r'xiaomi|redmi'), 'Xiaomi'),
+]
+
+
+def _first_match(patterns, ua_lower):
     for pattern, name in patterns:
-        match = re.search(pattern, ua_lower)
+        match = pattern.search(ua_lower)
         if match:
-            browser, browser_version = name, match.group(1)
-            break
+            return name, match
+    return None, None
 
-    # ── OS Detection ────────────────────────────────────────────────────────
-    os_name, os_version = 'Other', ''
-    os_patterns = [
-        (r'windows nt ([\d.]+)', 'Windows'),
-        (r'mac os x ([\d_.]+)', 'macOS'),
-        (r'android ([\d.]+)', 'Android'),
-        (r'iphone os ([\d_]+)', 'iOS'),
-        (r'ipad.*os ([\d_]+)', 'iPadOS'),
-        (r'linux', 'Linux'),
-    ]
-    for pattern, name in os_patterns:
-        match = re.search(pattern, ua_lower)
+
+def _detect_client(ua_lower):
+    """(name, version, device_override) for a known email client, else None."""
+    for pattern, name, device in _EMAIL_CLIENT_PATTERNS:
+        match = pattern.search(ua_lower)
         if match:
-            os_name = name
-            if match.lastindex:
-                os_version = match.group(1).replace('_', '.')
-            break
+            return name, (match.group(1) if match.lastindex else ''), device
+    webkit = _APPLE_WEBKIT_RE.search(ua_lower)
+    if webkit and _APPLE_DEVICE_RE.search(ua_lower) and not _WEB_BROWSER_RE.search(ua_lower):
+        return 'Apple Mail', webkit.group(1), None
+    return None
+
+
+@lru_cache(maxsize=Config.UA_CACHE_SIZE)
+def _parse(ua_string):
+    ua_lower = ua_string.lower()
+
+    # ── Email client / Browser Detection ────────────────────────────────────
+    device_override = None
+    client = _detect_client(ua_lower)
+    if client:
+        browser, browser_version, device_override = client
+    else:
+        browser, match = _first_match(_BROWSER_PATTERNS, ua_lower)
+        if browser:
+            browser_version = match.group(1)
+        else:
+            browser, browser_version = 'Other', ''
+
+    # ── OS Detection ────────────────────────────────────────────────────────
+    os_name, match = _first_match(_OS_PATTERNS, ua_lower)
+    os_version = ''
+    if os_name:
+        if match.lastindex:
+            os_version = match.group(1).replace('_', '.')
+    else:
+        os_name = 'Other'
 
     # ── Device Classification ───────────────────────────────────────────────
     # Check tablet before mobile: iPad sends "mobile safari" in some UAs.
-    is_bot = any(x in ua_lower for x in [
-        'bot', 'crawler', 'spider', 'preview', 'googlebot', 'bingbot',
-        'slurp', 'duckduckbot', 'facebot', 'ia_archiver', 'ahrefsbot',
-    ])
+    is_bot = bool(_BOT_RE.search(ua_lower))
     is_tablet = (
         'ipad' in ua_lower or
         'tablet' in ua_lower or
         ('android' in ua_lower and 'mobile' not in ua_lower)  # Android tablet pattern
     )
-    is_mobile = (
-        not is_tablet and
-        any(x in ua_lower for x in ['mobile', 'iphone', 'ipod'])
-    )
+    is_mobile = not is_tablet and bool(_MOBILE_RE.search(ua_lower))
 
     device_type = 'Desktop'
     if is_bot:
         device_type = 'Bot'
+    elif device_override:
+        device_type = device_override
     elif is_tablet:
         device_type = 'Tablet'
     elif is_mobile:
         device_type = 'Mobile'
 
     # ── Brand Detection ─────────────────────────────────────────────────────
-    device_brand = 'Unknown'
-    if 'iphone' in ua_lower or 'ipad' in ua_lower or 'macintosh' in ua_lower:
-        device_brand = 'Apple'
-    elif 'samsung' in ua_lower:
-        device_brand = 'Samsung'
-    elif 'pixel' in ua_lower:
-        device_brand = 'Google'
-    elif 'huawei' in ua_lower:
-        device_brand = 'Huawei'
-    elif 'xiaomi' in ua_lower or 'redmi' in ua_lower:
-        device_brand = 'Xiaomi'
+    device_brand, _ = _first_match(_BRANDS, ua_lower)
 
     return {
         'browser': browser,
@@ -105,7 +156,41 @@ def parse_user_agent(ua_string):
         'os': os_name,
         'os_version': os_version,
         'device_type': device_type,
-        'device_brand': device_brand,
+        'device_brand': device_brand or 'Unknown',
         'is_mobile': is_mobile,
         'is_bot': is_bot,
+        'is_proxy': device_type == 'Proxy',
     }
+
+
+def parse_user_agent(ua_string):
+    """
+    Parse a User-Agent string to extract browser, OS, and device type.
+    Returns a dict with: browser, browser_version, os, os_version,
+    device_type, device_brand, is_mobile, is_bot, is_proxy
+
+    'browser' is the email client when one is recognised (Gmail, Outlook,
+    Apple Mail, Thunderbird, Yahoo Mail); image proxies get device_type 'Proxy'.
+    """
+    if not ua_string:
+        return _get_empty_ua()
+    # Copy: the memoised dict is shared between callers
+    return dict(_parse(ua_string[:_UA_MAX_LEN]))
+
+
+def parse_many(ua_strings):
+    """Parse a batch of UA strings (e.g. for back-fills); each distinct UA is parsed once."""
+    parsed = {}
+    out = []
+    for ua in ua_strings:
+        if ua not in parsed:
+            parsed[ua] = parse_user_agent(ua)
+        out.append(dict(parsed[ua]))
+    return out
+
+
+def ua_cache_stats() -> dict:
+    """Hit / miss counters of the UA memo."""
+    info = _parse.cache_info()
+    return {'hits': info.hits, 'misses': info.misses,
+            'size': info.currsize, 'max_size': info.maxsize}
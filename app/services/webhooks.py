@@ -0,0 +1,267 @@
+"""
+naarad - Webhook Outbox
+Durable, at-least-once webhook delivery.
+
+Events are written to ``webhook_outbox`` in the same transaction as the
+open/click rows (see services/ingest.py), so a crash or a slow receiver can
+no longer lose them. A delivery worker claims due rows under a lease, POSTs
+them in batches of WEBHOOK_BATCH_SIZE (HMAC-signed with WEBHOOK_SECRET) with
+at most WEBHOOK_MAX_INFLIGHT requests in flight, deletes delivered rows and
+reschedules failures with exponential backoff.
+
+Payload format
+  WEBHOOK_BATCH_SIZE = 1 : {"event": ..., "timestamp": ..., "data": {...}}
+  WEBHOOK_BATCH_SIZE > 1 : {"event": "batch", "timestamp": ..., "events": [...]}
+"""
+import atexit
+import hmac
+import json
+import hashlib
+import logging
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from ..config import Config
+from ..database import get_db, get_cursor, placeholder
+from ..utils import now_iso
+
+log = logging.getLogger(__name__)
+
+# Seconds a claimed batch stays invisible to other workers
+_LEASE_SECONDS = 120
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def enqueue(cursor, P: str, events: list) -> None:
+    """Stage webhook events in the caller's transaction.
+
+    ``events`` is a list of (event_type, data) tuples. No-op without WEBHOOK_URL.
+    """
+    if not Config.WEBHOOK_URL or not events:
+        return
+    created, due = now_iso(), _now_ms()
+    rows = [
+        (event_type,
+         json.dumps({'event': event_type, 'timestamp': created, 'data': data}),
+         created, due)
+        for event_type, data in events
+    ]
+    cursor.executemany(
+        f'''INSERT INTO webhook_outbox (event_type, payload, created_at, next_attempt_at)
+            VALUES ({P}, {P}, {P}, {P})''',
+        rows
+    )
+
+
+def sign(payload: bytes) -> dict:
+    """Request headers for a payload, HMAC-signed when WEBHOOK_SECRET is set."""
+    headers = {'Content-Type': 'application/json'}
+    if Config.WEBHOOK_SECRET:
+        # Send HMAC signature, not the raw secret
+        signature = hmac.new(
+            Config.WEBHOOK_SECRET.encode('utf-8'), payload, hashlib.sha256
+        ).hexdigest()
+        headers['X-Webhook-Signature'] = f'sha256={signature}'
+    return headers
+
+
+def _build_body(envelopes: list) -> bytes:
+    if Config.WEBHOOK_BATCH_SIZE <= 1:
+        return json.dumps(envelopes[0]).encode()
+    return json.dumps({
+        'event': 'batch', 'timestamp': now_iso(), 'events': envelopes,
+    }).encode()
+
+
+def _post(envelopes: list):
+    """POST one batch. Returns None on success, else the error string."""
+    body = _build_body(envelopes)
+    try:
+        req = urllib.request.Request(Config.WEBHOOK_URL, data=body, headers=sign(body))
+        with urllib.request.urlopen(req, timeout=Config.WEBHOOK_TIMEOUT) as resp:
+            resp.read()
+        return None
+    except Exception as e:
+        return str(e)[:500]
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff for the Nth failed attempt, capped at WEBHOOK_RETRY_MAX."""
+    return min(Config.WEBHOOK_RETRY_BASE * (2 ** max(0, attempts - 1)), Config.WEBHOOK_RETRY_MAX)
+
+
+class _OutboxWorker:
+    """Single claiming thread + a bounded pool of POSTs in flight."""
+
+    def __init__(self, app):
+        self._app    = app
+        self._wake   = threading.Event()
+        self._stop   = threading.Event()
+        self._pool   = ThreadPoolExecutor(max_workers=max(1, Config.WEBHOOK_MAX_INFLIGHT),
+                                          thread_name_prefix='naarad-webhook')
+        self._thread = threading.Thread(target=self._run, name='naarad-outbox', daemon=True)
+        self.stats = {'delivered': 0, 'failed_attempts': 0, 'dead': 0}
+
+    def start(self):
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def notify(self):
+        self._wake.set()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        self._pool.shutdown(wait=False)
+
+    def _run(self):
+        log.info("[WEBHOOK] Outbox worker started (batch=%d, in-flight=%d)",
+                 Config.WEBHOOK_BATCH_SIZE, Config.WEBHOOK_MAX_INFLIGHT)
+        while not self._stop.is_set():
+            try:
+                # One context per cycle: the connection is released before the
+                # worker sleeps (close_db rolls back whatever a failure left open)
+                with self._app.app_context():
+                    busy = self.drain_once()
+            except Exception as e:
+                busy = False
+                log.warning("[WEBHOOK] Outbox cycle failed: %s", e)
+            if not busy:
+                self._wake.wait(Config.WEBHOOK_POLL_INTERVAL)
+                self._wake.clear()
+
+    def _claim(self, conn, cursor, P, limit: int) -> list:
+        """Lease up to ``limit`` due rows to this worker; returns (id, attempts, payload)."""
+        token, now_ms = uuid.uuid4().hex, _now_ms()
+        cursor.execute(
+            f'''UPDATE webhook_outbox SET claim_token = {P}, claimed_until = {P}
+                WHERE id IN (
+                    SELECT id FROM webhook_outbox
+                    WHERE next_attempt_at <= {P}
+                      AND (claimed_until IS NULL OR claimed_until < {P})
+                    ORDER BY id LIMIT {P}
+                )
+                AND (claimed_until IS NULL OR claimed_until < {P})''',
+            (token, now_ms + _LEASE_SECONDS * 1000, now_ms, now_ms, limit, now_ms)
+        )
+        conn.commit()
+        cursor.execute(
+            f'''SELECT id, attempts, payload FROM webhook_outbox
+                WHERE claim_token = {P} ORDER BY id''',
+            (token,)
+        )
+        return [
+            (r['id'], r['attempts'], r['payload']) if hasattr(r, 'keys') else tuple(r)
+            for r in cursor.fetchall()
+        ]
+
+    def drain_once(self) -> bool:
+        """Claim, deliver and settle one round. True if the outbox may have more."""
+        conn   = get_db()
+        cursor = get_cursor(conn)
+        P      = placeholder()
+        batch  = max(1, Config.WEBHOOK_BATCH_SIZE)
+        limit  = batch * max(1, Config.WEBHOOK_MAX_INFLIGHT)
+
+        rows = self._claim(conn, cursor, P, limit)
+        if not rows:
+            return False
+
+        chunks  = [rows[i:i + batch] for i in range(0, len(rows), batch)]
+        futures = [
+            self._pool.submit(_post, [json.loads(payload) for _, _, payload in chunk])
+            for chunk in chunks
+        ]
+
+        delivered = []
+        for chunk, fut in zip(chunks, futures):
+            error = fut.result()
+            if error is None:
+                delivered.extend(row_id for row_id, _, _ in chunk)
+                continue
+            self.stats['failed_attempts'] += 1
+            log.warning("[WEBHOOK] Delivery of %d event(s) failed: %s", len(chunk), error)
+            for row_id, attempts, _ in chunk:
+                attempts += 1
+                if attempts >= Config.WEBHOOK_MAX_ATTEMPTS:
+                    next_at = None   # dead-lettered: kept for inspection, never retried
+                    self.stats['dead'] += 1
+                else:
+                    next_at = _now_ms() + int(backoff_seconds(attempts) * 1000)
+                cursor.execute(
+                    f'''UPDATE webhook_outbox
+                        SET attempts = {P}, next_attempt_at = {P}, last_error = {P},
+                            claim_token = NULL, claimed_until = NULL
+                        WHERE id = {P}''',
+                    (attempts, next_at, error, row_id)
+                )
+
+        if delivered:
+            cursor.execute(
+                f"DELETE FROM webhook_outbox WHERE id IN ({', '.join([P] * len(delivered))})",
+                tuple(delivered)
+            )
+            self.stats['delivered'] += len(delivered)
+        conn.commit()
+        return len(rows) == limit
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_webhook_worker(app):
+    """Start the outbox delivery worker when WEBHOOK_URL is configured."""
+    global _worker
+    if not Config.WEBHOOK_URL:
+        return
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _worker = _OutboxWorker(app)
+        _worker.start()
+
+
+def stop_webhook_worker(timeout: float = 5.0):
+    global _worker
+    with _worker_lock:
+        w, _worker = _worker, None
+    if w is not None:
+        w.stop(timeout)
+
+
+atexit.register(stop_webhook_worker)
+
+
+def notify_outbox():
+    """Wake the delivery worker after new outbox rows were committed."""
+    w = _worker
+    if w is not None:
+        w.notify()
+
+
+def outbox_stats() -> dict:
+    """Delivery counters of this process plus the outbox backlog (request context)."""
+    w = _worker
+    stats = dict(w.stats) if w is not None else {}
+    cursor = get_cursor(get_db())
+    cursor.execute(
+        '''SELECT COUNT(*) AS total,
+                  SUM(CASE WHEN next_attempt_at IS NULL THEN 1 ELSE 0 END) AS parked
+           FROM webhook_outbox'''
+    )
+    row = cursor.fetchone()
+    total  = (row['total']  if hasattr(row, 'keys') else row[0]) or 0
+    parked = (row['parked'] if hasattr(row, 'keys') else row[1]) or 0
+    stats.update(pending=total - parked, parked=parked)
+    return stats
@@ -4,12 +4,9 @@ naarad - Utility Functions
 import re
 import hmac
 import hashlib
-import json
 import logging
-import threading
 from datetime import datetime, timezone
 from urllib.parse import urlparse
-from .config import Config
 
 log = logging.getLogger(__name__)
 
@@ -24,6 +21,38 @@ def now_iso():
     return now().isoformat()
 
 
+def to_ms(dt):
+    """Integer epoch milliseconds of an aware datetime."""
+    return int(dt.timestamp() * 1000)
+
+
+def iso_to_ms(value):
+    """
+    Epoch milliseconds for an ISO-8601 string (``Z`` suffix allowed; naive
+    values are UTC) or an integer / digit string already in milliseconds.
+    Returns None if the value cannot be parsed.
+    """
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return to_ms(dt)
+
+
+def ms_to_iso(ms):
+    """ISO-8601 UTC string (millisecond precision) for epoch milliseconds."""
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat(timespec='milliseconds')
+
+
 def sanitize_id(track_id):
     """
     Sanitize and validate track ID.
@@ -85,36 +114,3 @@ def safe_str_compare(a, b):
         return False
     return hmac.compare_digest(a.encode('utf-8'), b.encode('utf-8'))
 
-
-def send_webhook(event_type, data):
-    """Send webhook notification asynchronously so it never blocks the request."""
-    if not Config.WEBHOOK_URL:
-        return
-
-    def _send():
-        try:
-            import urllib.request
-            payload = json.dumps({
-                'event': event_type,
-                'timestamp': now_iso(),
-                'data': data
-            }).encode()
-            headers = {'Content-Type': 'application/json'}
-            if Config.WEBHOOK_SECRET:
-                # Send HMAC signature, not the raw secret
-                signature = hmac.new(
-                    Config.WEBHOOK_SECRET.encode('utf-8'),
-                    payload,
-                    hashlib.sha256
-                ).hexdigest()
-                headers['X-Webhook-Signature'] = f'sha256={signature}'
-            req = urllib.request.Request(
-                Config.WEBHOOK_URL, data=payload, headers=headers
-            )
-            urllib.request.urlopen(req, timeout=5)
-        except Exception as e:
-            log.warning("[WEBHOOK] Failed to deliver %s event: %s", event_type, e)
-
-    # Fire-and-forget in a daemon thread — does not block the HTTP response
-    t = threading.Thread(target=_send, daemon=True)
-    t.start()
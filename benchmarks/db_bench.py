@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+SQLite connection benchmark: connect-per-request vs persistent tuned connections.
+
+Drives the WSGI app in-process (no sockets) with a mix of pixel opens and
+dashboard reads, once with SQLITE_POOL=false (a fresh connection plus its
+PRAGMAs on every request, as before) and once with the per-thread pool.
+Each run uses a fresh temporary SQLite DB.
+
+    python benchmarks/db_bench.py                 # 3000 requests per run
+    python benchmarks/db_bench.py -n 10000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.test import EnvironBuilder  # noqa: E402
+
+from app.config import Config  # noqa: E402
+import app.database as app_db  # noqa: E402
+
+_UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0 Safari/537.36'
+
+
+def _environ(path, query=''):
+    return EnvironBuilder(
+        path=path, query_string=query,
+        headers={'User-Agent': _UA, 'X-Forwarded-For': '10.1.2.3', 'X-API-Key': 'bench'},
+    ).get_environ()
+
+
+def _run(pool: bool, requests: int) -> float:
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    Config.DB_FILE          = path
+    Config.DATABASE_URL     = None
+    app_db.USE_POSTGRES     = False
+    Config.SQLITE_POOL      = pool
+    Config.INGEST_MODE      = 'sync'
+    Config.API_KEY          = 'bench'
+    Config.RATE_LIMIT_PER_MINUTE = 0
+    Config.API_RATE_LIMIT_PER_MINUTE = 0
+
+    from app import create_app
+    from app.database import init_db, migrate_db
+
+    app = create_app()
+    init_db()
+    migrate_db()
+
+    mix = [_environ('/track', f'id=bench-{n % 50}') for n in range(3)] + [_environ('/api/tracks')]
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    wsgi = app.wsgi_app
+    for i in range(50):                       # warm-up (also starts workers)
+        b''.join(wsgi(dict(mix[i % len(mix)]), start_response))
+
+    start = time.perf_counter()
+    for i in range(requests):
+        b''.join(wsgi(dict(mix[i % len(mix)]), start_response))
+    elapsed = time.perf_counter() - start
+
+    os.unlink(path)
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='naarad SQLite connection benchmark')
+    parser.add_argument('-n', '--requests', type=int, default=3000)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)           # per-hit INFO logs would dominate
+
+    before = _run(False, args.requests)
+    after  = _run(True,  args.requests)
+    print(f"[BENCH] requests={args.requests} (3 opens : 1 dashboard read)")
+    print(f"  connect per request : {before:9.0f} req/s")
+    print(f"  persistent + tuned  : {after:9.0f} req/s  ({after / before:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Pixel throughput benchmark: Flask routing vs the WSGI fast path.
+
+Calls the WSGI callable in-process (no sockets), so the numbers isolate the
+framework overhead per open. Each run uses a fresh temporary SQLite DB.
+
+    python benchmarks/pixel_bench.py                 # 5000 requests, both paths
+    python benchmarks/pixel_bench.py -n 20000 --ingest buffered
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.test import EnvironBuilder  # noqa: E402
+
+from app.config import Config  # noqa: E402
+import app.database as app_db  # noqa: E402
+
+
+def _run(fast: bool, requests: int, ingest_mode: str) -> float:
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    Config.DB_FILE          = path
+    Config.DATABASE_URL     = None
+    app_db.USE_POSTGRES     = False
+    Config.PIXEL_FAST_PATH  = fast
+    Config.INGEST_MODE      = ingest_mode
+    Config.RATE_LIMIT_PER_MINUTE = 0
+
+    from app import create_app
+    from app.database import init_db, migrate_db
+    from app.services.ingest import stop_ingest_worker
+
+    app = create_app()
+    init_db()
+    migrate_db()
+
+    environ = EnvironBuilder(
+        path='/track', query_string='id=bench&sender=a%40example.com&subject=Hello+World',
+        headers={
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0 Safari/537.36',
+            'X-Forwarded-For': '10.1.2.3',
+        },
+    ).get_environ()
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    wsgi = app.wsgi_app
+    for _ in range(50):                       # warm-up (also starts workers)
+        b''.join(wsgi(dict(environ), start_response))
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        b''.join(wsgi(dict(environ), start_response))
+    elapsed = time.perf_counter() - start
+
+    stop_ingest_worker()
+    os.unlink(path)
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='naarad pixel benchmark')
+    parser.add_argument('-n', '--requests', type=int, default=5000)
+    parser.add_argument('--ingest', choices=['sync', 'buffered'], default='sync')
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)           # per-hit INFO logs would dominate
+
+    flask_rps = _run(False, args.requests, args.ingest)
+    fast_rps  = _run(True,  args.requests, args.ingest)
+    print(f"[BENCH] ingest={args.ingest} requests={args.requests}")
+    print(f"  Flask routing : {flask_rps:9.0f} req/s")
+    print(f"  WSGI fast path: {fast_rps:9.0f} req/s  ({fast_rps / flask_rps:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -32,10 +32,123 @@ def migrate():
         print(f"[MANAGE] Error running migrations: {e}")
         sys.exit(1)
 
+def _repoint_ua(cursor, P, moved):
+    """Move event and rollup_visits references from retired ua_dim ids to their twins."""
+    from app.services.partitions import event_tables
+
+    case = ' '.join(f'WHEN {P} THEN {P}' for _ in moved)
+    args = [v for pair in moved.items() for v in pair]
+    marks = ', '.join([P] * len(moved))
+    for table in ('open_events', 'clicks'):
+        for target in event_tables(cursor, table):
+            cursor.execute(
+                f"UPDATE {target} SET ua_id = CASE ua_id {case} END WHERE ua_id IN ({marks})",
+                (*args, *moved)
+            )
+    for old_id, new_id in moved.items():
+        cursor.execute(
+            f"""INSERT INTO rollup_visits (track_id, kind, day, ua_id, geo_id, events)
+                SELECT track_id, kind, day, {P}, geo_id, events FROM rollup_visits WHERE ua_id = {P}
+                ON CONFLICT (track_id, kind, day, ua_id, geo_id)
+                DO UPDATE SET events = rollup_visits.events + excluded.events""",
+            (new_id, old_id)
+        )
+        cursor.execute(f"DELETE FROM rollup_visits WHERE ua_id = {P}", (old_id,))
+
+
+def _reparse_ua_dim(cursor, P, rows):
+    """
+    Re-key one page of ua_dim rows (``(id, dim_key, *UA_FIELDS)``) after re-parsing.
+
+    A row whose new key is free is updated in place, so its id stays valid.
+    If an identical row exists already, events and rollups are re-pointed to
+    it and this row keeps the new values under a retired key (another process
+    may still hold its id in the dim cache).
+    """
+    from app.services.dims import UA_FIELDS, dim_key, ua_values
+    from app.services.ua import parse_many
+
+    set_clause = ', '.join(f'{c} = {P}' for c in ('dim_key',) + UA_FIELDS)
+    moved = {}
+    for row, info in zip(rows, parse_many(r[2] for r in rows)):
+        row_id, old_key, is_proxy = row[0], row[1], row[-1]
+        values = ua_values(row[2], dict(info, is_proxy=is_proxy))
+        key = dim_key(values)
+        if key == old_key:
+            continue
+        cursor.execute(f"SELECT id FROM ua_dim WHERE dim_key = {P}", (key,))
+        twin = cursor.fetchone()
+        if twin:
+            moved[row_id] = twin['id'] if hasattr(twin, 'keys') else twin[0]
+            key = f'reparsed-{row_id}'
+        cursor.execute(f"UPDATE ua_dim SET {set_clause} WHERE id = {P}", (key, *values, row_id))
+    if moved:
+        _repoint_ua(cursor, P, moved)
+
+
+def reparse_ua(batch_size=1000):
+    """Re-derive browser / OS / device columns from stored User-Agent strings."""
+    from app import create_app
+    from app.database import get_db, get_cursor, placeholder
+    from app.services.dims import UA_FIELDS
+    from app.services.ua import parse_many, ua_cache_stats
+    from app.services.stats import bump_data_version
+
+    cols = ['browser', 'browser_version', 'os', 'os_version',
+            'device_type', 'device_brand', 'is_mobile', 'is_bot']
+    app = create_app()
+    with app.app_context():
+        conn, P = get_db(), placeholder()
+        cursor = get_cursor(conn)
+        # Event rows read their UA fields from ua_dim, which is content-addressed:
+        # its rows are re-keyed (not just updated) so new events find them
+        for table in ('tracks', 'ua_dim'):
+            select = 'id, user_agent' if table == 'tracks' else f"id, dim_key, {', '.join(UA_FIELDS)}"
+            last_id, updated = 0, 0
+            while True:
+                cursor.execute(
+                    f"SELECT {select} FROM {table} WHERE id > {P} "
+                    f"AND user_agent IS NOT NULL ORDER BY id LIMIT {P}",
+                    (last_id, batch_size)
+                )
+                rows = [tuple(r) if not hasattr(r, 'keys') else tuple(r[c] for c in r.keys())
+                        for r in cursor.fetchall()]
+                if not rows:
+                    break
+                if table == 'tracks':
+                    parsed = parse_many(ua for _, ua in rows)
+                    cursor.executemany(
+                        f"UPDATE tracks SET {', '.join(f'{c} = {P}' for c in cols)} WHERE id = {P}",
+                        [(*(int(info[c]) if c.startswith('is_') else info[c] for c in cols), row_id)
+                         for (row_id, _), info in zip(rows, parsed)]
+                    )
+                else:
+                    _reparse_ua_dim(cursor, P, rows)
+                conn.commit()
+                bump_data_version(conn, cursor)
+                last_id  = rows[-1][0]
+                updated += len(rows)
+            print(f"[MANAGE] {table}: re-parsed {updated} rows")
+        print(f"[MANAGE] UA cache: {ua_cache_stats()}")
+
+def compile_geo(csv_path, out_path):
+    """Compile an IP-range CSV into the mmap-able file used by GEO_PROVIDER=offline."""
+    from app.services.geodb import compile_csv
+    print(f"[MANAGE] Compiling {csv_path} -> {out_path}...")
+    try:
+        counts = compile_csv(csv_path, out_path)
+        print(f"[MANAGE] Geo DB written: {counts}")
+    except Exception as e:
+        print(f"[MANAGE] Error compiling geo DB: {e}")
+        sys.exit(1)
+
 def main():
     parser = argparse.ArgumentParser(description='naarad Management Script')
-    parser.add_argument('command', choices=['init', 'migrate', 'init_all'], 
-                        help='Command to run (init_all runs init then migrate)')
+    parser.add_argument('command', choices=['init', 'migrate', 'init_all', 'reparse_ua', 'compile_geo'],
+                        help='Command to run (init_all runs init then migrate; '
+                             'reparse_ua re-derives device columns from stored UAs; '
+                             'compile_geo CSV OUT builds the offline geo DB)')
+    parser.add_argument('paths', nargs='*', help='compile_geo: input CSV and output file')
     
     args = parser.parse_args()
     
@@ -46,6 +159,12 @@ def main():
     elif args.command == 'init_all':
         init()
         migrate()
+    elif args.command == 'reparse_ua':
+        reparse_ua()
+    elif args.command == 'compile_geo':
+        if len(args.paths) != 2:
+            parser.error('compile_geo needs CSV and OUT paths')
+        compile_geo(*args.paths)
 
 if __name__ == '__main__':
     main()
@@ -4,6 +4,10 @@ import sqlite3
 import tempfile
 from app import create_app
 from app.database import init_db, migrate_db
+from app.services.ingest import forget_track
+from app.services.dims import forget_dims
+from app.services.partitions import forget_partitions
+from app.services.stats import forget_stats
 from app.config import Config
 import app.database as app_db
 
@@ -18,6 +22,10 @@ def app():
     app_db.USE_POSTGRES = False
     
     flask_app = create_app()
+    forget_track()   # per-process track cache must not outlive the temp DB
+    forget_dims()
+    forget_partitions()
+    forget_stats()
     # Configure app for testing
     flask_app.config.update({
         "TESTING": True,
@@ -35,6 +43,12 @@ def app():
     os.close(db_fd)
     os.unlink(db_path)
 
+@pytest.fixture
+def open_api(monkeypatch):
+    """API reachable without a token and without rate limiting."""
+    monkeypatch.setattr(Config, 'REQUIRE_AUTH', False)
+    monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 0)
+
 @pytest.fixture
 def client(app):
     return app.test_client()
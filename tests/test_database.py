@@ -0,0 +1,49 @@
+from app.config import Config
+from app.database import get_db, migrate_db
+
+
+def test_sqlite_connection_is_reused_and_tuned(app, monkeypatch):
+    with app.app_context():
+        conn = get_db()
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1        # NORMAL
+        assert conn.execute('PRAGMA temp_store').fetchone()[0] == 2         # MEMORY
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == Config.SQLITE_BUSY_TIMEOUT
+        conn.execute("INSERT INTO geo_cache (ip_address, data, cached_at) VALUES ('x', '{}', 'y')")
+    # Teardown rolls back what the context left uncommitted, but keeps the connection
+    with app.app_context():
+        assert get_db() is conn
+        assert conn.execute('SELECT COUNT(*) FROM geo_cache').fetchone()[0] == 0
+
+    monkeypatch.setattr(Config, 'SQLITE_POOL', False)
+    with app.app_context():
+        assert get_db() is not conn
+
+
+def test_sqlite_connection_follows_db_file(app, tmp_path, monkeypatch):
+    with app.app_context():
+        first = get_db()
+    monkeypatch.setattr(Config, 'DB_FILE', str(tmp_path / 'other.db'))
+    with app.app_context():
+        other = get_db()
+        assert other is not first
+        assert other.execute('PRAGMA database_list').fetchone()[2].endswith('other.db')
+
+
+def test_migration_backfills_epoch_ms(app, db):
+    db.execute(
+        "INSERT INTO tracks (timestamp, track_id, first_seen, last_seen) "
+        "VALUES ('2026-03-15T09:00:00', 'legacy', '2026-03-15T09:00:00', '2026-03-15T10:30:00.250000+00:00')"
+    )
+    db.execute(
+        "INSERT INTO clicks (timestamp, track_id, link_id, target_url) "
+        "VALUES ('2026-03-15T10:00:00Z', 'legacy', 'x', 'https://example.com')"
+    )
+    db.execute('DELETE FROM schema_version')
+    db.commit()
+
+    with app.app_context():
+        migrate_db()
+
+    row = db.execute("SELECT first_seen_ms, last_seen_ms FROM tracks WHERE track_id = 'legacy'").fetchone()
+    assert (row['first_seen_ms'], row['last_seen_ms']) == (1773565200000, 1773570600250)
+    assert db.execute("SELECT unix_ms FROM clicks").fetchone()[0] == 1773568800000
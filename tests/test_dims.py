@@ -0,0 +1,100 @@
+import pytest
+
+from app.database import migrate_db
+from app.services.dims import dim_cache_stats
+
+UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+
+pytestmark = pytest.mark.usefixtures('open_api')
+
+
+def test_repeat_visitor_reuses_dimension_rows(client, db):
+    headers = {'User-Agent': UA, 'X-Forwarded-For': '10.0.0.8', 'Referer': 'https://mail.example.com/'}
+    for _ in range(3):
+        client.get('/track?id=dims-1', headers=headers)
+    client.get('/click/dims-1/https%3A%2F%2Fexample.com', headers=headers)
+
+    assert db.execute('SELECT COUNT(*) FROM ua_dim').fetchone()[0] == 1
+    assert db.execute('SELECT COUNT(*) FROM geo_dim').fetchone()[0] == 1
+    # opens carry (referer, accept_language), clicks only the referer
+    assert db.execute('SELECT COUNT(*) FROM header_dim').fetchone()[0] == 2
+    assert dim_cache_stats()['ua']['hits'] >= 3
+
+    opens = client.get('/api/track/dims-1').get_json()['opens']
+    assert len(opens) == 3
+    assert {(o['ip_address'], o['user_agent'], o['browser'], o['referer']) for o in opens} == {
+        ('10.0.0.8', UA, 'Chrome', 'https://mail.example.com/')
+    }
+
+
+def test_migration_normalizes_wide_event_rows(app, db):
+    partitions = [r[0] for r in db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'open_events_p%'"
+    )]
+    db.executescript('''
+        DROP VIEW open_events_v;
+        DROP VIEW open_events;
+    ''' + ''.join(f'DROP TABLE {name};' for name in partitions) + '''
+        CREATE TABLE open_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL,
+            track_id TEXT, ip_address TEXT, country TEXT, city TEXT,
+            user_agent TEXT, browser TEXT, device_type TEXT, is_bot BOOLEAN,
+            referer TEXT, is_repeat INTEGER DEFAULT 0, fingerprint TEXT
+        );
+        INSERT INTO open_events (id, timestamp, track_id, ip_address, country, city,
+                                 user_agent, browser, device_type, is_bot, referer, fingerprint)
+        VALUES (7, '2026-03-15T09:00:00Z', 'wide', '10.1.1.1', 'DE', 'Berlin',
+                'ua-x', 'Firefox', 'Desktop', 0, 'https://r', 'fp'),
+               (9, '2026-03-15T10:00:00Z', 'wide', '10.1.1.1', 'DE', 'Berlin',
+                'ua-x', 'Firefox', 'Desktop', 0, 'https://r', 'fp');
+        DELETE FROM schema_version;
+    ''')
+    db.commit()
+
+    with app.app_context():
+        migrate_db()
+
+    cols = {r[1] for r in db.execute('PRAGMA table_info(open_events_p202603)')}
+    assert 'user_agent' not in cols and {'geo_id', 'ua_id', 'header_id'} <= cols
+    rows = db.execute(
+        "SELECT id, unix_ms, country, city, user_agent, browser, is_bot, referer "
+        "FROM open_events_v WHERE track_id = 'wide' ORDER BY id"
+    ).fetchall()
+    assert [tuple(r) for r in rows] == [
+        (7, 1773565200000, 'DE', 'Berlin', 'ua-x', 'Firefox', 0, 'https://r'),
+        (9, 1773568800000, 'DE', 'Berlin', 'ua-x', 'Firefox', 0, 'https://r'),
+    ]
+    assert db.execute('SELECT COUNT(DISTINCT ua_id) FROM open_events').fetchone()[0] == 1
+
+
+def test_reparse_ua_rekeys_dimension_rows(client, db):
+    import manage
+
+    client.get('/track?id=dims-reparse', headers={'User-Agent': UA, 'X-Forwarded-For': '10.0.0.9'})
+    (current,) = db.execute('SELECT id FROM ua_dim').fetchone()
+    cols = 'user_agent, browser_version, os, os_version, device_type, device_brand, is_mobile, is_bot, is_proxy'
+    # Rows written by an older parser: the current row plus a stale twin the events point at
+    db.execute(f"INSERT INTO ua_dim (dim_key, browser, {cols}) SELECT 'stale-twin', 'Old', {cols} FROM ua_dim")
+    (twin,) = db.execute("SELECT id FROM ua_dim WHERE dim_key = 'stale-twin'").fetchone()
+    db.execute("UPDATE ua_dim SET dim_key = 'stale', browser = 'Old' WHERE id = ?", (current,))
+    partitions = [r[0] for r in db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'open_events_p%'"
+    )]
+    for name in partitions:
+        db.execute(f'UPDATE {name} SET ua_id = ?', (twin,))
+    db.execute('UPDATE rollup_visits SET ua_id = ?', (twin,))
+    db.commit()
+
+    manage.reparse_ua()
+
+    assert [r[0] for r in db.execute('SELECT ua_id FROM open_events')] == [current]
+    assert [tuple(r) for r in db.execute('SELECT ua_id, events FROM rollup_visits')] == [(current, 1)]
+    rows = {r[0]: (r[1], r[2]) for r in db.execute('SELECT id, dim_key, browser FROM ua_dim')}
+    assert rows[current][1] == rows[twin][1] == 'Chrome'
+    assert rows[current][0] != 'stale' and rows[twin][0] == f'reparsed-{twin}'
+
+    # New events find the re-keyed row instead of inserting another one
+    client.get('/track?id=dims-reparse', headers={'User-Agent': UA, 'X-Forwarded-For': '10.0.0.9'})
+    assert db.execute('SELECT COUNT(*) FROM ua_dim').fetchone()[0] == 2
+    assert {r[0] for r in db.execute('SELECT ua_id FROM open_events')} == {current}
@@ -0,0 +1,30 @@
+import threading
+
+from app.services.executor import BackgroundExecutor
+
+
+def test_bounded_per_type_queues(app):
+    """A full queue drops (and counts) its own tasks without blocking other types."""
+    ex = BackgroundExecutor(app, workers=1, queue_size=2)
+    ex.start()
+    started, gate, done = threading.Event(), threading.Event(), []
+
+    def blocker():
+        started.set()
+        gate.wait(5)
+
+    assert ex.submit('webhook', blocker)
+    assert started.wait(5)
+    assert ex.submit('webhook', done.append, 1)
+    assert ex.submit('webhook', done.append, 2)
+    assert not ex.submit('webhook', done.append, 3)   # queue full
+    assert ex.submit('geo', done.append, 'g')         # separate queue
+
+    gate.set()
+    ex.stop()
+
+    assert sorted(map(str, done)) == ['1', '2', 'g']
+    stats = ex.stats()
+    assert stats['webhook']['dropped'] == 1
+    assert stats['webhook']['completed'] == 3
+    assert stats['geo']['completed'] == 1
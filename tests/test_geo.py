@@ -0,0 +1,223 @@
+import threading
+import time
+
+import pytest
+
+from app.config import Config
+from app.database import get_db, get_cursor
+from app.services import geo, ingest
+from app.services.dims import dim_key, geo_values
+
+PUBLIC_IP = '203.0.114.7'
+
+FAKE_GEO = {
+    'country': 'Testland', 'region': 'North', 'city': 'Testville',
+    'lat': 1.5, 'lon': 2.5, 'timezone': 'UTC', 'isp': 'TestNet',
+    'org': 'Test Org', 'asn': 'AS64500',
+}
+
+
+@pytest.fixture(autouse=True)
+def _no_rate_limit(monkeypatch):
+    monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 0)
+
+
+def test_deferred_geo_backfills_all_tables(app, client, db, monkeypatch):
+    """Deferred mode stores 'Pending' and one back-fill fixes every table."""
+    client.get('/robots.txt')   # start background workers before switching modes
+    monkeypatch.setattr(Config, 'GEO_ENRICH_MODE', 'deferred')
+    monkeypatch.setattr(geo, 'get_geo_info', lambda ip: pytest.fail('geo lookup on request path'))
+    queued = []
+    monkeypatch.setattr(ingest, 'enqueue_enrichment', queued.append)
+
+    headers = {'X-Forwarded-For': PUBLIC_IP}
+    client.get('/track?id=geo-deferred', headers=headers)
+    client.get('/click/geo-deferred/https%3A%2F%2Fexample.com', headers=headers)
+
+    assert queued == [PUBLIC_IP, PUBLIC_IP]
+    for table in ('tracks', 'open_events_v', 'clicks_v'):
+        assert db.execute(f"SELECT country FROM {table}").fetchone()[0] == 'Pending'
+
+    with app.app_context():
+        conn = get_db()
+        geo.backfill_pending_geo(conn, get_cursor(conn), PUBLIC_IP, FAKE_GEO)
+
+    for table in ('tracks', 'open_events_v', 'clicks_v'):
+        row = db.execute(f"SELECT country, city, latitude, asn FROM {table}").fetchone()
+        assert tuple(row) == ('Testland', 'Testville', 1.5, 'AS64500')
+
+    # The enriched row is keyed on its new values; a later event starts Pending again
+    assert db.execute("SELECT COUNT(*) FROM geo_dim WHERE dim_key = ?",
+                      (dim_key(geo_values(PUBLIC_IP, FAKE_GEO)),)).fetchone()[0] == 1
+    client.get('/track?id=geo-deferred-2', headers=headers)
+    assert db.execute(
+        "SELECT country FROM open_events_v WHERE track_id = 'geo-deferred-2'"
+    ).fetchone()[0] == 'Pending'
+
+
+def test_two_tier_cache_and_negative_entries(app, monkeypatch):
+    """Memory tier answers repeats, geo_cache answers new processes, failures are cached."""
+    monkeypatch.setattr(geo, '_mem_cache', geo._GeoMemoryCache())
+    calls = []
+
+    def fake_fetch(ip):
+        calls.append(ip)
+        return dict(FAKE_GEO) if ip == PUBLIC_IP else None
+
+    monkeypatch.setattr(geo, '_fetch_remote', fake_fetch)
+    with app.app_context():
+        assert geo.get_geo_info(PUBLIC_IP)['city'] == 'Testville'
+        assert geo.get_geo_info(PUBLIC_IP)['city'] == 'Testville'
+        assert geo.get_geo_info('203.0.114.8')['country'] == 'Unknown'
+        assert geo.get_geo_info('203.0.114.8')['country'] == 'Unknown'
+        assert calls == [PUBLIC_IP, '203.0.114.8']
+
+        # A fresh process (empty memory tier) is served from geo_cache
+        monkeypatch.setattr(geo, '_mem_cache', geo._GeoMemoryCache())
+        assert geo.get_geo_info(PUBLIC_IP)['city'] == 'Testville'
+        assert calls == [PUBLIC_IP, '203.0.114.8']
+        stats = geo.geo_cache_stats()
+        assert stats['db_hits'] == 1 and stats['db_hit_ratio'] == 1.0
+
+
+def test_unknown_track_is_filled_in_by_background_retry(app, client, db, monkeypatch):
+    """The retry bypasses the negative entry the failed inline lookup just wrote."""
+    monkeypatch.setattr(geo, '_mem_cache', geo._GeoMemoryCache())
+    answers = [None, dict(FAKE_GEO)]
+    monkeypatch.setattr(geo._batcher, 'fetch', lambda ip: answers.pop(0))
+    retries = []
+
+    def retry(track_id, ip):      # scheduled only once the track row is committed
+        assert db.execute('SELECT COUNT(*) FROM tracks WHERE track_id = ?', (track_id,)).fetchone()[0] == 1
+        retries.append((track_id, ip))
+
+    monkeypatch.setattr(ingest, 'enrich_track_async', retry)
+
+    client.get('/track?id=geo-retry', headers={'X-Forwarded-For': PUBLIC_IP})
+    assert retries == [('geo-retry', PUBLIC_IP)]
+    assert db.execute("SELECT country FROM tracks").fetchone()[0] == 'Unknown'
+
+    with app.app_context():
+        geo._enrich_track(*retries[0])
+    assert answers == []
+    assert tuple(db.execute("SELECT country, city FROM tracks").fetchone()) == ('Testland', 'Testville')
+
+
+def test_enricher_backs_off_then_gives_up(app, client, db, monkeypatch):
+    """Unresolvable IPs are retried with backoff, then marked Unknown and no longer swept."""
+    client.get('/robots.txt')
+    monkeypatch.setattr(Config, 'GEO_ENRICH_MODE', 'deferred')
+    monkeypatch.setattr(Config, 'GEO_ENRICH_MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(ingest, 'enqueue_enrichment', lambda ip: None)
+    for n in (1, 2, 3):
+        client.get(f'/track?id=geo-gone-{n}', headers={'X-Forwarded-For': f'203.0.114.5{n}'})
+    monkeypatch.setattr(geo, 'lookup_many',
+                        lambda ips, use_negative=True: {ip: (geo._UNKNOWN_GEO.copy(), False) for ip in ips})
+
+    enricher = geo._GeoEnricher(app)
+    monkeypatch.setattr(geo, '_SWEEP_LIMIT', 2)
+    enricher._sweep()
+    enricher._sweep()                           # pages through all three, then wraps
+    assert sorted(enricher._queued) == ['203.0.114.51', '203.0.114.52', '203.0.114.53']
+
+    enricher._queued.clear()
+    enricher._resolve(['203.0.114.51'])
+    enricher.offer('203.0.114.51')              # backing off: not re-queued yet
+    assert '203.0.114.51' not in enricher._queued
+    assert db.execute("SELECT country FROM tracks WHERE track_id = 'geo-gone-1'").fetchone()[0] == 'Pending'
+
+    enricher._resolve(['203.0.114.51'])
+    assert db.execute("SELECT country FROM tracks WHERE track_id = 'geo-gone-1'").fetchone()[0] == 'Unknown'
+    enricher._sweep_from = ''
+    enricher._sweep()
+    assert sorted(enricher._queued) == ['203.0.114.52', '203.0.114.53']
+
+
+def _lookup_concurrently(app, ips):
+    results = {}
+
+    def worker(ip):
+        with app.app_context():
+            results.setdefault(ip, []).append(geo.lookup_geo(ip))
+
+    threads = [threading.Thread(target=worker, args=(ip,)) for ip in ips]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_misses_share_one_lookup(app, monkeypatch):
+    monkeypatch.setattr(geo, '_mem_cache', geo._GeoMemoryCache())
+    monkeypatch.setattr(Config, 'GEO_BATCH_WINDOW_MS', 0)
+    calls = []
+
+    def slow_fetch(ip):
+        calls.append(ip)
+        time.sleep(0.1)
+        return dict(FAKE_GEO)
+
+    monkeypatch.setattr(geo, '_fetch_remote', slow_fetch)
+    results = _lookup_concurrently(app, ['203.0.114.20'] * 8)
+    assert calls == ['203.0.114.20']
+    assert all(r == (FAKE_GEO, True) for r in results['203.0.114.20'])
+    assert geo.geo_cache_stats()['coalesced'] == 7
+
+
+def test_misses_within_window_are_batched(app, monkeypatch):
+    monkeypatch.setattr(geo, '_mem_cache', geo._GeoMemoryCache())
+    monkeypatch.setattr(Config, 'GEO_BATCH_WINDOW_MS', 100)
+    monkeypatch.setattr(geo, '_fetch_remote', lambda ip: pytest.fail('single lookup'))
+    batches = []
+
+    def fake_batch(ips):
+        batches.append(sorted(ips))
+        return {ip: dict(FAKE_GEO, city=ip) for ip in ips if ip != '203.0.114.33'}
+
+    monkeypatch.setattr(geo, '_fetch_remote_batch', fake_batch)
+    ips = [f'203.0.114.{n}' for n in range(30, 34)]
+    results = _lookup_concurrently(app, ips)
+    assert batches == [ips]
+    assert results['203.0.114.31'][0] == (dict(FAKE_GEO, city='203.0.114.31'), True)
+    assert results['203.0.114.33'][0][1] is False
+
+    # The enricher path batches its own misses; the failure stays negatively cached
+    with app.app_context():
+        out = geo.lookup_many(ips + ['203.0.114.40', '203.0.114.41'])
+    assert batches[1:] == [['203.0.114.40', '203.0.114.41']]
+    assert out['203.0.114.33'][1] is False
+    assert out['203.0.114.30'] == (dict(FAKE_GEO, city='203.0.114.30'), True)
+    assert out['203.0.114.41'][1] is True
+
+
+def test_batches_are_fetched_off_the_request_thread(app, monkeypatch):
+    """Request threads only queue and wait; the resolver thread does the remote calls."""
+    monkeypatch.setattr(geo, '_mem_cache', geo._GeoMemoryCache())
+    monkeypatch.setattr(Config, 'GEO_BATCH_WINDOW_MS', 10)
+    callers = []
+
+    def fake_batch(ips):
+        callers.append(threading.current_thread().name)
+        return {ip: dict(FAKE_GEO) for ip in ips}
+
+    monkeypatch.setattr(geo, '_fetch_remote_batch', fake_batch)
+    monkeypatch.setattr(geo, '_fetch_remote', lambda ip: fake_batch([ip])[ip])
+    results = _lookup_concurrently(app, [f'203.0.114.{n}' for n in range(60, 66)])
+    assert all(r[0] == (FAKE_GEO, True) for r in results.values())
+    assert callers and set(callers) == {'naarad-geo-batch'}
+
+
+def test_purge_expired_geo_cache_in_chunks(app, db, monkeypatch):
+    from datetime import timedelta
+    from app.utils import now
+
+    fresh = now().isoformat()
+    stale = (now() - timedelta(minutes=Config.GEO_CACHE_MINUTES + 5)).isoformat()
+    db.executemany('INSERT INTO geo_cache (ip_address, data, cached_at) VALUES (?, ?, ?)',
+                   [(f'198.19.0.{n}', '{}', stale) for n in range(7)] + [('198.19.1.1', '{}', fresh)])
+    db.commit()
+
+    with app.app_context():
+        assert geo.purge_expired_geo_cache(chunk=3) == 7
+    assert [r[0] for r in db.execute('SELECT ip_address FROM geo_cache')] == ['198.19.1.1']
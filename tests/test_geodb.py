@@ -0,0 +1,39 @@
+from app.config import Config
+from app.services import geo
+from app.services.geodb import OfflineGeoDB, compile_csv
+
+CSV = """start,end,country,region,city,lat,lon,asn,timezone
+1.0.0.0,1.0.0.255,Australia,Queensland,Brisbane,-27.47,153.02,AS13335,Australia/Brisbane
+8.8.8.0,8.8.8.255,United States,California,Mountain View,37.4,-122.08,AS15169,
+2001:db8::,2001:db8::ffff,Testland,North,Sixville,1.0,2.0,AS64500,
+"""
+
+
+def _compile(tmp_path):
+    src = tmp_path / 'ranges.csv'
+    src.write_text(CSV)
+    out = tmp_path / 'geo.bin'
+    counts = compile_csv(str(src), str(out))
+    assert (counts['ipv4_ranges'], counts['ipv6_ranges'], counts['skipped']) == (2, 1, 0)
+    return str(out)
+
+
+def test_offline_lookup_v4_v6(tmp_path):
+    db = OfflineGeoDB(_compile(tmp_path))
+    hit = db.lookup('8.8.8.8')
+    assert (hit['city'], hit['asn'], hit['timezone'], hit['org']) == \
+        ('Mountain View', 'AS15169', 'Unknown', '')
+    assert db.lookup('1.0.0.255')['country'] == 'Australia'
+    assert db.lookup('1.0.1.0') is None
+    assert db.lookup('::ffff:8.8.8.1')['country'] == 'United States'
+    assert db.lookup('2001:db8::10')['city'] == 'Sixville'
+    assert db.lookup('2001:db8::1:0') is None
+
+
+def test_offline_provider_never_calls_remote(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'GEO_PROVIDER', 'offline')
+    monkeypatch.setattr(Config, 'GEO_OFFLINE_DB', _compile(tmp_path))
+    monkeypatch.setattr(geo, '_fetch_remote', lambda ip: (_ for _ in ()).throw(AssertionError))
+    with app.app_context():
+        assert geo.get_geo_info('1.0.0.7')['city'] == 'Brisbane'
+        assert geo.get_geo_info('9.9.9.9')['country'] == 'Unknown'
@@ -0,0 +1,117 @@
+import pytest
+
+from app.config import Config
+from app.services import ingest
+
+
+@pytest.fixture(autouse=True)
+def _no_rate_limit(monkeypatch):
+    monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 0)
+
+
+def test_sync_open_and_click(client, db):
+    """Inline mode: each hit is written before the response returns."""
+    client.get('/track?id=ingest-sync&sender=a@example.com')
+    client.get('/track?id=ingest-sync')
+    resp = client.get('/click/ingest-sync/https%3A%2F%2Fexample.com%2Fx')
+    assert resp.status_code == 302
+
+    row = db.execute(
+        "SELECT open_count, click_count, is_repeat, sender FROM tracks WHERE track_id = 'ingest-sync'"
+    ).fetchone()
+    assert row['open_count'] == 2
+    assert row['click_count'] == 1
+    assert row['is_repeat'] == 1
+    assert row['sender'] == 'a@example.com'
+
+    flags = [r['is_repeat'] for r in db.execute(
+        "SELECT is_repeat FROM open_events WHERE track_id = 'ingest-sync' ORDER BY id"
+    )]
+    assert flags == [0, 1]
+
+
+def test_buffered_mode_flushes_on_shutdown(app, client, db, monkeypatch):
+    """Buffered mode: events are folded per track and written when drained."""
+    monkeypatch.setattr(Config, 'INGEST_MODE', 'buffered')
+    monkeypatch.setattr(Config, 'INGEST_FLUSH_INTERVAL', 5.0)
+    ingest.start_ingest_worker(app)
+    try:
+        for _ in range(3):
+            client.get('/track?id=ingest-buf')
+        client.get('/click/ingest-buf/https%3A%2F%2Fexample.com')
+        assert db.execute("SELECT COUNT(*) FROM open_events").fetchone()[0] == 0
+    finally:
+        ingest.stop_ingest_worker()
+
+    row = db.execute(
+        "SELECT open_count, click_count, is_repeat FROM tracks WHERE track_id = 'ingest-buf'"
+    ).fetchone()
+    assert (row['open_count'], row['click_count'], row['is_repeat']) == (3, 1, 1)
+    flags = [r['is_repeat'] for r in db.execute(
+        "SELECT is_repeat FROM open_events WHERE track_id = 'ingest-buf' ORDER BY id"
+    )]
+    assert flags == [0, 1, 1]
+
+
+def test_forward_detected_inside_upsert(client, db):
+    """A second opener on a new IP and device class is flagged as a forward."""
+    desktop = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0 Safari/537.36'
+    mobile  = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile/15E148'
+    client.get('/track?id=ingest-fwd', headers={'X-Forwarded-For': '10.0.0.1', 'User-Agent': desktop})
+    client.get('/track?id=ingest-fwd', headers={'X-Forwarded-For': '10.0.0.1', 'User-Agent': desktop})
+    client.get('/track?id=ingest-fwd', headers={'X-Forwarded-For': '10.0.0.2', 'User-Agent': mobile})
+
+    row = db.execute(
+        "SELECT open_count, forward_count, is_forward FROM tracks WHERE track_id = 'ingest-fwd'"
+    ).fetchone()
+    assert (row['open_count'], row['forward_count'], row['is_forward']) == (3, 1, 1)
+    flags = [(r['is_repeat'], r['is_forward']) for r in db.execute(
+        "SELECT is_repeat, is_forward FROM open_events WHERE track_id = 'ingest-fwd' ORDER BY id"
+    )]
+    assert flags == [(0, 0), (1, 0), (1, 1)]
+
+
+def test_cached_track_state_skips_select(client, db, monkeypatch):
+    """Once a track is opened, later opens decide repeat / forward in memory."""
+    desktop = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0 Safari/537.36'
+    mobile  = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile/15E148'
+    client.get('/track?id=ingest-hot', headers={'X-Forwarded-For': '10.0.0.1', 'User-Agent': desktop})
+    assert ingest.track_cache_stats()['size'] == 1
+
+    monkeypatch.setattr(ingest, '_load_track_state', lambda *a: pytest.fail('SELECT on tracks'))
+    client.get('/track?id=ingest-hot', headers={'X-Forwarded-For': '10.0.0.2', 'User-Agent': mobile})
+    flags = [tuple(r) for r in db.execute(
+        "SELECT is_repeat, is_forward FROM open_events WHERE track_id = 'ingest-hot' ORDER BY id")]
+    assert flags == [(0, 0), (1, 1)]
+    row = db.execute("SELECT open_count, forward_count FROM tracks WHERE track_id = 'ingest-hot'").fetchone()
+    assert tuple(row) == (2, 1)
+
+    # A click may rewrite the row's identity, and a deleted track must be forgotten
+    client.get('/click/ingest-hot/https%3A%2F%2Fexample.com')
+    assert ingest.track_cache_stats()['size'] == 0
+    monkeypatch.undo()
+    monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 0)
+    monkeypatch.setattr(Config, 'REQUIRE_AUTH', False)
+    client.get('/track?id=ingest-hot', headers={'X-Forwarded-For': '10.0.0.2', 'User-Agent': mobile})
+    assert ingest.track_cache_stats()['size'] == 1
+    assert client.delete('/api/track/ingest-hot').status_code == 200
+    assert ingest.track_cache_stats()['size'] == 0
+
+
+def test_epoch_ms_drives_sync_window(client, db, monkeypatch):
+    """first/last_seen_ms are written on ingest; /api/sync compares integers, not ISO text."""
+    monkeypatch.setattr(Config, 'REQUIRE_AUTH', False)
+    client.get('/track?id=ingest-ms')
+    client.get('/click/ingest-ms/https%3A%2F%2Fexample.com')
+    row = db.execute(
+        "SELECT first_seen_ms, last_seen_ms, unix_ms FROM tracks WHERE track_id = 'ingest-ms'"
+    ).fetchone()
+    assert row['first_seen_ms'] and row['last_seen_ms'] >= row['first_seen_ms']
+    click_ms = db.execute("SELECT unix_ms FROM clicks WHERE track_id = 'ingest-ms'").fetchone()[0]
+
+    data = client.get(f'/api/sync?since={click_ms - 1}').get_json()
+    assert [t['track_id'] for t in data['tracks']] == ['ingest-ms']
+    assert len(data['clicks']) == 1
+    # The watermark is exclusive
+    assert client.get(f'/api/sync?since={click_ms}').get_json()['clicks'] == []
+    assert client.get('/api/sync?since=yesterday').status_code == 400
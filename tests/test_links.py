@@ -0,0 +1,59 @@
+import pytest
+
+from app.database import get_cursor, get_db, placeholder
+from app.services import links
+
+
+pytestmark = pytest.mark.usefixtures('open_api')
+
+
+def test_register_and_follow_short_link(client, db):
+    resp = client.post('/api/links', json={'urls': ['https://example.com/a', 'javascript:alert(1)']})
+    assert resp.status_code == 201
+    body = resp.get_json()
+    assert body['invalid'] == ['javascript:alert(1)']
+    link_id = body['links'][0]['link_id']
+    assert all(c in links.BASE62 for c in link_id) and len(link_id) == 7
+
+    # Registering the same URL again returns the same ID
+    again = client.post('/api/links', json={'url': 'https://example.com/a'}).get_json()
+    assert again['links'][0]['link_id'] == link_id
+
+    resp = client.get(f'/l/short-1/{link_id}')
+    assert resp.status_code == 302
+    assert resp.headers['Location'] == 'https://example.com/a'
+    assert client.get('/l/short-1/nope').status_code == 404
+
+    row = db.execute("SELECT link_id, target_url FROM clicks WHERE track_id = 'short-1'").fetchone()
+    assert tuple(row) == (link_id, 'https://example.com/a')
+    assert db.execute("SELECT click_count FROM tracks WHERE track_id = 'short-1'").fetchone()[0] == 1
+
+
+def test_legacy_click_creates_link_row(client, db):
+    client.get('/click/legacy-1/https%3A%2F%2Fexample.com%2Fb')
+    row = db.execute(
+        "SELECT l.target_url, l.is_registered FROM clicks c JOIN links l ON l.link_id = c.link_id"
+    ).fetchone()
+    assert tuple(row) == ('https://example.com/b', 0)
+
+
+def test_rolled_back_registration_is_not_followable(app, client):
+    with app.app_context():
+        conn = get_db()
+        link_id = links.register_link(get_cursor(conn), placeholder(), 'https://example.com/gone')
+        conn.rollback()
+    assert client.get(f'/l/short-2/{link_id}').status_code == 404
+
+
+def test_ensure_links_skips_unsafe_targets(app, db):
+    with app.app_context():
+        conn = get_db()
+        accepted = links.ensure_links(get_cursor(conn), placeholder(), {
+            'peer-ok': 'https://example.com/ok',
+            'peer-js': 'javascript:alert(1)',
+            'peer-at': 'https://user@evil.example/',
+        })
+        conn.commit()
+    assert accepted == {'peer-ok'}
+    rows = db.execute("SELECT link_id FROM links WHERE link_id LIKE 'peer-%'").fetchall()
+    assert [r[0] for r in rows] == ['peer-ok']
@@ -0,0 +1,23 @@
+from app.services import maintenance
+
+
+def test_jobs_run_on_interval_without_overlap(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(maintenance, 'submit', lambda kind, fn, job: submitted.append(job) or True)
+    sched = maintenance.MaintenanceScheduler()
+    sched.add('purge', 10, lambda: 3)
+    sched.add('disabled', 0, lambda: 1)
+    job = sched._jobs[0]
+    job.next_run = 100.0
+
+    sched.run_pending(now=99.0)
+    assert submitted == []
+    sched.run_pending(now=100.0)
+    sched.run_pending(now=200.0)          # still running: not submitted twice
+    assert submitted == [job]
+
+    sched._execute(job)
+    assert sched.stats() == {'purge': {'interval': 10, 'runs': 1, 'failures': 0,
+                                       'last_result': 3, 'last_duration_ms': job.last_duration_ms}}
+    sched.run_pending(now=110.0)
+    assert submitted == [job, job]
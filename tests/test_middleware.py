@@ -0,0 +1,42 @@
+import pytest
+
+from app.config import Config
+from app.middleware import PixelFastPath, parse_query
+
+
+@pytest.fixture(autouse=True)
+def _no_rate_limit(monkeypatch):
+    monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 0)
+
+
+@pytest.fixture
+def fast_client(app):
+    app.wsgi_app = PixelFastPath(app, app.wsgi_app)
+    return app.test_client()
+
+
+def test_parse_query_first_value_and_decoding():
+    assert parse_query('id=a&id=b&subject=Hi+there%21&flag') == {
+        'id': 'a', 'subject': 'Hi there!', 'flag': '',
+    }
+
+
+def test_fast_path_records_open(fast_client, db):
+    resp = fast_client.get('/t/fast-1?sender=a%40example.com',
+                           headers={'User-Agent': 'Mozilla/5.0', 'Referer': 'https://mail.example'})
+    assert resp.status_code == 200
+    assert resp.mimetype == 'image/png'
+    assert 'Content-Security-Policy' not in resp.headers
+    assert resp.headers['Cache-Control'] == 'no-cache, no-store, must-revalidate'
+
+    fast_client.get('/track?id=fast-1')
+    row = db.execute(
+        "SELECT open_count, sender, referer FROM tracks WHERE track_id = 'fast-1'"
+    ).fetchone()
+    assert (row['open_count'], row['sender'], row['referer']) == (2, 'a@example.com', 'Direct')
+
+
+def test_fast_path_passes_other_routes_through(fast_client):
+    resp = fast_client.get('/api/health')
+    assert 'Content-Security-Policy' in resp.headers
+    assert fast_client.post('/track').status_code == 405
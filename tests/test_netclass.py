@@ -0,0 +1,50 @@
+import pytest
+
+from app.config import Config
+from app.services import geo
+from app.services.netclass import NetworkClassifier, build_classifier
+
+
+def test_longest_prefix_wins():
+    c = NetworkClassifier([
+        ('10.0.0.0/8', 'private', 'Private'),
+        ('10.16.0.0/12', 'proxy', 'Outer'),
+        ('10.20.0.0/14', 'scanner', 'Inner'),
+        ('10.20.1.7/32', 'proxy', 'Host'),
+        ('2001:db8::/32', 'private', 'Docs'),
+        ('2001:db8:1::/48', 'scanner', 'Lab'),
+    ])
+    assert c.classify('10.1.2.3') == ('private', 'Private')
+    assert c.classify('10.31.255.255') == ('proxy', 'Outer')
+    assert c.classify('10.23.0.1') == ('scanner', 'Inner')
+    assert c.classify('10.20.1.7') == ('proxy', 'Host')
+    assert c.classify('11.0.0.1') is None
+    assert c.classify('2001:db8::1') == ('private', 'Docs')
+    assert c.classify('2001:db8:1::5') == ('scanner', 'Lab')
+    assert c.classify('::ffff:10.20.1.7') == ('proxy', 'Host')
+    assert c.classify('not-an-ip') == ('private', 'Unparseable')
+
+
+def test_builtin_ranges_and_extra_file(tmp_path):
+    extra = tmp_path / 'nets.txt'
+    extra.write_text('# custom\n198.51.99.0/24 scanner Acme Gateway\n1.2.3.0/24 bogus X\n')
+    c = build_classifier(str(extra))
+    assert c.classify('172.31.0.1')[0] == 'private'
+    assert c.classify('172.32.0.1') is None
+    assert c.classify('fe80::1')[0] == 'private'
+    assert c.classify('17.58.1.1') == ('proxy', 'Apple Mail Privacy Protection')
+    assert c.classify('198.51.99.4') == ('scanner', 'Acme Gateway')
+    assert c.classify('1.2.3.4') is None
+
+
+def test_proxy_and_scanner_opens_are_tagged(client, db, monkeypatch):
+    monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 0)
+    monkeypatch.setattr(geo, 'lookup_geo', lambda ip: pytest.fail('remote geo for ' + ip))
+    client.get('/track?id=mpp', headers={'X-Forwarded-For': '17.58.1.1'})
+    client.get('/track?id=scan', headers={'X-Forwarded-For': '148.163.130.9'})
+
+    rows = {r['track_id']: r for r in db.execute(
+        'SELECT track_id, is_proxy, is_bot, device_type, isp FROM open_events_v')}
+    assert tuple(rows['mpp'])[1:] == (1, 0, 'Proxy', 'Apple Mail Privacy Protection')
+    assert tuple(rows['scan'])[1:] == (0, 1, 'Bot', 'Proofpoint')
+    assert db.execute("SELECT is_proxy FROM tracks WHERE track_id = 'mpp'").fetchone()[0] == 1
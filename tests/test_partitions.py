@@ -0,0 +1,60 @@
+import pytest
+
+from app.config import Config
+from app.database import get_db
+from app.services.partitions import (current_month, ensure_partitions, maintain_event_partitions,
+                                     month_bounds, partition_name, shift_month)
+
+
+pytestmark = pytest.mark.usefixtures('open_api')
+
+
+def _insert_open(db, track_id, unix_ms):
+    db.execute(
+        "INSERT INTO open_events (timestamp, unix_ms, track_id) VALUES ('x', ?, ?)", (unix_ms, track_id)
+    )
+    db.commit()
+
+
+def test_open_lands_in_current_month_partition(client, db):
+    client.get('/track?id=part-1')
+
+    month = partition_name('open_events', current_month())
+    assert db.execute(f"SELECT COUNT(*) FROM {month} WHERE track_id = 'part-1'").fetchone()[0] == 1
+    assert db.execute("SELECT COUNT(*) FROM open_events_pdefault").fetchone()[0] == 0
+    assert client.get('/api/track/part-1').get_json()['opens'][0]['track_id'] == 'part-1'
+
+
+def test_retention_drops_whole_months(app, db, monkeypatch):
+    old = shift_month(current_month(), -6)
+    with app.app_context():
+        conn = get_db()
+        ensure_partitions(conn.cursor(), 'open_events', [old])
+        conn.commit()
+    _insert_open(db, 'ancient', month_bounds(old)[0] + 1000)
+    _insert_open(db, 'recent', month_bounds(current_month())[0] + 1000)
+    assert db.execute(f"SELECT COUNT(*) FROM {partition_name('open_events', old)}").fetchone()[0] == 1
+
+    monkeypatch.setattr(Config, 'EVENT_RETENTION_MONTHS', 3)
+    with app.app_context():
+        result = maintain_event_partitions()
+
+    assert partition_name('open_events', old) in result['dropped']
+    assert [r[0] for r in db.execute('SELECT track_id FROM open_events_v')] == ['recent']
+
+
+def test_new_month_adopts_rows_parked_in_default(app, db):
+    future = shift_month(current_month(), 24)
+    _insert_open(db, 'early', month_bounds(future)[0] + 1000)
+    event_id, = db.execute("SELECT id FROM open_events_pdefault WHERE track_id = 'early'").fetchone()
+
+    with app.app_context():
+        conn = get_db()
+        ensure_partitions(conn.cursor(), 'open_events', [future])
+        conn.commit()
+
+    assert db.execute("SELECT COUNT(*) FROM open_events_pdefault").fetchone()[0] == 0
+    assert db.execute(
+        f"SELECT id FROM {partition_name('open_events', future)} WHERE track_id = 'early'"
+    ).fetchone()[0] == event_id
+    assert db.execute("SELECT COUNT(*) FROM open_events WHERE track_id = 'early'").fetchone()[0] == 1
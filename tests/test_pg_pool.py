@@ -0,0 +1,111 @@
+"""_PgPool logic against an in-memory stand-in for psycopg2's ThreadedConnectionPool."""
+import threading
+import time
+
+import pytest
+
+import app.database as database
+from app.config import Config
+
+
+class _FakeConn:
+    def __init__(self):
+        self.closed = 0
+        self.status = 1
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = 1
+
+
+class _FakePool:
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.idle, self.out, self.maxconn = [], set(), maxconn
+
+    def getconn(self):
+        if len(self.out) >= self.maxconn:
+            raise RuntimeError('connection pool exhausted')
+        conn = self.idle.pop() if self.idle else _FakeConn()
+        self.out.add(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        self.out.discard(conn)
+        if close:
+            conn.closed = 1
+        else:
+            self.idle.append(conn)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(database, 'pg_pool', type('m', (), {'ThreadedConnectionPool': _FakePool}),
+                        raising=False)
+    monkeypatch.setattr(database, 'STATUS_READY', 1, raising=False)
+    return database._PgPool('ingest', 1, 2)
+
+
+def test_acquire_blocks_until_release_then_times_out(pool):
+    a, b = pool.acquire(1), pool.acquire(1)
+    threading.Timer(0.05, pool.release, (a,)).start()
+    c = pool.acquire(1)                      # waits for the release instead of raising
+    assert c is a
+    with pytest.raises(database.PoolExhausted):
+        pool.acquire(0.01)
+    stats = pool.snapshot()
+    assert (stats['acquired'], stats['waited'], stats['timeouts'], stats['in_use']) == (3, 1, 1, 2)
+    assert stats['wait_ms_max'] >= 40
+
+
+def test_dirty_and_old_connections_are_recycled(pool, monkeypatch):
+    conn = pool.acquire(1)
+    conn.status = 2                           # left mid-transaction
+    pool.release(conn)
+    assert conn.rollbacks == 1 and pool.acquire(1) is conn
+    pool.release(conn)
+
+    monkeypatch.setattr(Config, 'PG_CONN_MAX_AGE', 0)
+    time.sleep(0.01)
+    fresh = pool.acquire(1)
+    assert fresh is not conn and conn.closed
+    assert pool.snapshot()['recycled'] == 1
+
+
+def test_background_work_returns_its_connections(app, pool, monkeypatch):
+    """Executor tasks and outbox cycles hand their connection back when they end."""
+    from app.services import webhooks
+    from app.services.executor import BackgroundExecutor
+
+    monkeypatch.setattr(database, 'USE_POSTGRES', True)
+    monkeypatch.setattr(database, '_pg_pools', {'ingest': pool})
+
+    def task(fail):
+        database.get_db()
+        if fail:
+            raise RuntimeError('boom')
+
+    ex = BackgroundExecutor(app, workers=2, queue_size=10)
+    ex.start()
+    for fail in (False, True, False):
+        ex.submit('geo', task, fail)
+    deadline = time.monotonic() + 5
+    while ex.stats()['geo']['completed'] + ex.stats()['geo']['failed'] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ex.stats()['geo']['completed'] == 2 and ex.stats()['geo']['failed'] == 1
+    assert database.pool_stats()['ingest']['in_use'] == 0      # idle workers hold nothing
+    ex.stop()
+
+    worker = webhooks._OutboxWorker(app)
+    cycles = []
+
+    def drain_once():
+        database.get_db()
+        cycles.append(database.pool_stats()['ingest']['in_use'])
+        worker._stop.set()
+        return False
+
+    monkeypatch.setattr(worker, 'drain_once', drain_once)
+    worker._run()
+    assert cycles == [1]
+    assert database.pool_stats()['ingest']['in_use'] == 0
@@ -0,0 +1,109 @@
+"""
+Query-plan audit: every read / update / delete issued by the api and tracking
+endpoints must be answered from an index, not a full table scan.
+
+Statements are captured with a trace callback on the pooled SQLite
+connection while the endpoints are exercised, then each one is run through
+``EXPLAIN QUERY PLAN``. Queries that by design read the whole table are
+listed in _WHOLE_TABLE with the reason.
+"""
+import re
+
+import pytest
+
+from app.database import get_db
+
+_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+_SUBQUERY = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\w+)$')
+_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+AS)?\s+(\w+)', re.IGNORECASE)
+
+# (substring of the statement, why a full scan is expected)
+_WHOLE_TABLE = [
+    ('SUM(open_count)',         'dashboard totals aggregate every track'),
+    ('GROUP BY browser ORDER',  'dashboard browser breakdown aggregates every track'),
+    ('LIKE',                    'substring search cannot use a b-tree index'),
+    ('sqlite_master',           'schema catalog lookup (event partition routing)'),
+]
+
+
+pytestmark = pytest.mark.usefixtures('open_api')
+
+
+def _exercise(client):
+    client.get('/track?id=plan-t1&sender=a@example.com&c=camp')
+    client.get('/track?id=plan-t1')
+    client.get('/click/plan-t1/https%3A%2F%2Fexample.com%2Fx')
+    link_id = client.post('/api/links', json={'url': 'https://example.com/y'}).get_json()['links'][0]['link_id']
+    client.get(f'/l/plan-t1/{link_id}')
+    client.post('/api/track', json={'track_id': 'plan-t2', 'label': 'x'})
+    client.put('/api/track/plan-t2', json={'label': 'y'})
+    client.get('/analytics/plan-t1')
+    client.get('/api/campaign/camp')
+    client.get('/api/track/plan-t1')
+    client.get('/api/tracks')
+    client.get('/api/tracks?q=plan')
+    client.get('/api/stats')
+    client.get('/api/export')
+    client.get('/api/sync?since=2020-01-01T00:00:00Z')
+    client.delete('/api/track/plan-t2')
+    client.delete('/api/sync?until=2000-01-01T00:00:00Z')
+
+
+def _full_scans(conn, sql):
+    plan = conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+    # Reading back a view's or subquery's co-routine (e.g. the UNION ALL over
+    # the monthly event partitions, whose arms are searched by index) is not a table scan
+    views = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'view'").fetchall()
+    aliases = {alias: name for name, alias in _ALIAS.findall(' '.join([sql] + [v[1] for v in views]))}
+    view_names = {v[0] for v in views} | {m.group(1) for m in (_SUBQUERY.match(r[3]) for r in plan) if m}
+    scans = []
+    for row in plan:
+        m = _FULL_SCAN.match(row[3])
+        if m and aliases.get(m.group(1), m.group(1)) not in view_names:
+            scans.append(row[3])
+    return scans
+
+
+def test_no_unexpected_full_scans(app, client):
+    statements = []
+    with app.app_context():
+        conn = get_db()
+        conn.set_trace_callback(statements.append)
+        try:
+            _exercise(client)
+        finally:
+            conn.set_trace_callback(None)
+
+        queries = {
+            ' '.join(s.split()) for s in statements
+            if s.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH'))
+        }
+        assert any('FROM rollup_visits' in q for q in queries)
+
+        offenders = []
+        for sql in sorted(queries):
+            scans = _full_scans(conn, sql)
+            if scans and not any(marker in sql for marker, _ in _WHOLE_TABLE):
+                offenders.append(f'{sql}\n    -> {scans}')
+    assert not offenders, 'full table scans:\n' + '\n'.join(offenders)
+
+
+def test_per_track_reads_use_composite_indexes(app):
+    with app.app_context():
+        conn = get_db()
+        plans = {
+            sql: ' '.join(r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql))
+            for sql in (
+                "SELECT * FROM open_events WHERE track_id = 'x' ORDER BY unix_ms DESC",
+                "SELECT COUNT(DISTINCT fingerprint) FROM open_events WHERE track_id = 'x'",
+                "SELECT * FROM clicks WHERE track_id = 'x' ORDER BY unix_ms DESC",
+                "SELECT COUNT(DISTINCT fingerprint) FROM clicks WHERE track_id = 'x'",
+            )
+        }
+    for sql, plan in plans.items():
+        assert 'USING' in plan and 'INDEX' in plan, (sql, plan)
+        # Each month partition is searched by index and merged in order; only
+        # COUNT(DISTINCT) across partitions still needs a dedup b-tree
+        assert 'TEMP B-TREE FOR ORDER BY' not in plan, (sql, plan)
+        if 'DISTINCT' not in sql:
+            assert 'TEMP B-TREE' not in plan, (sql, plan)
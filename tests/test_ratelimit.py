@@ -0,0 +1,59 @@
+import multiprocessing
+
+import pytest
+
+from app.services.ratelimit import SharedMemoryLimiter, SlidingWindowLimiter, fcntl
+
+
+def test_sliding_window_counter():
+    """Per-minute limit holds across the window boundary, then decays."""
+    lim = SlidingWindowLimiter(window=60.0, stripes=4)
+    t0 = 6000.0                                   # start of a window
+    assert [lim.hit('1.2.3.4', 3, now=t0 + i) for i in range(4)] == [False, False, False, True]
+    assert lim.hit('5.6.7.8', 3, now=t0) is False  # other keys unaffected
+
+    # 15 s into the next window the previous 3 hits still weigh 2.25
+    assert lim.hit('1.2.3.4', 3, now=t0 + 75) is False
+    assert lim.hit('1.2.3.4', 3, now=t0 + 76) is True
+    # Two windows later the old hits no longer count
+    assert lim.hit('1.2.3.4', 3, now=t0 + 181) is False
+
+
+def test_expired_keys_are_evicted_incrementally():
+    lim = SlidingWindowLimiter(window=60.0, stripes=1, max_keys=1000)
+    for i in range(10):
+        lim.hit(f'10.0.0.{i}', 5, now=0.0)
+    for i in range(5):
+        lim.hit(f'10.0.1.{i}', 5, now=300.0)     # each hit evicts up to two stale keys
+    assert len(lim) == 5
+
+
+@pytest.mark.skipif(fcntl is None, reason='shared backend needs fcntl')
+def test_shared_limit_is_exact_across_processes(tmp_path):
+    """Several worker processes share one counter table: the limit holds per host."""
+    path = str(tmp_path / 'rl.bin')
+    SharedMemoryLimiter(path, slots=1024, stripes=16).close()   # create the table
+    ctx = multiprocessing.get_context('fork')
+    allowed = ctx.Queue()
+
+    def worker():
+        lim = SharedMemoryLimiter(path, slots=1024, stripes=16)
+        allowed.put(sum(not lim.hit('track:198.51.100.1', 25, now=6000.0) for _ in range(20)))
+
+    procs = [ctx.Process(target=worker) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(10)
+    assert sum(allowed.get(timeout=5) for _ in procs) == 25
+
+
+@pytest.mark.skipif(fcntl is None, reason='shared backend needs fcntl')
+def test_shared_table_reuses_expired_slots(tmp_path):
+    lim = SharedMemoryLimiter(str(tmp_path / 'rl.bin'), slots=4, stripes=1)
+    for i in range(4):
+        assert lim.hit(f'k{i}', 1, now=0.0) is False
+    # Table full; two windows later every slot is reusable for new keys
+    assert [lim.hit(f'n{i}', 1, now=200.0) for i in range(4)] == [False] * 4
+    assert lim.hit('n0', 1, now=201.0) is True
+    lim.close()
@@ -0,0 +1,78 @@
+import pytest
+
+from app.config import Config
+from app.database import get_db, migrate_db
+from app.services.partitions import event_tables
+from app.services.rollups import compact_events
+
+CHROME = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+FIREFOX = 'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0'
+OLD_MS = 1577934000000      # 2020-01-02T03:00:00Z
+
+
+pytestmark = pytest.mark.usefixtures('open_api')
+
+
+def _visit(client):
+    for ua in (CHROME, CHROME, FIREFOX):
+        client.get('/track?id=roll-1&c=spring', headers={'User-Agent': ua})
+    client.get('/click/roll-1/https%3A%2F%2Fexample.com', headers={'User-Agent': CHROME})
+
+
+def test_analytics_read_ingest_counters(client, db):
+    _visit(client)
+    stats = client.get('/analytics/roll-1').get_json()
+
+    assert stats['unique_opens'] == 2 and stats['unique_clicks'] == 1
+    assert stats['browsers'] == {'Chrome': 2, 'Firefox': 1}
+    assert [d['count'] for d in stats['opens_timeline']] == [3]
+    assert [d['count'] for d in stats['clicks_timeline']] == [1]
+
+    campaign = client.get('/api/campaign/spring').get_json()
+    assert campaign['total_opens'] == 3 and campaign['opens_timeline'] == stats['opens_timeline']
+
+
+def test_compaction_keeps_analytics_intact(app, client, db, monkeypatch):
+    _visit(client)
+    before = client.get('/analytics/roll-1').get_json()
+    with app.app_context():
+        conn = get_db()
+        for table in ('open_events', 'clicks'):
+            for target in event_tables(conn.cursor(), table):
+                conn.execute(f'UPDATE {target} SET unix_ms = ?', (OLD_MS,))
+        conn.commit()
+
+    monkeypatch.setattr(Config, 'EVENT_ROLLUP_DAYS', 30)
+    with app.app_context():
+        assert compact_events(chunk=2) == {'open': 3, 'click': 1}
+        assert compact_events() is None
+
+    assert db.execute('SELECT COUNT(*) FROM open_events').fetchone()[0] == 0
+    assert db.execute('SELECT COUNT(*) FROM clicks').fetchone()[0] == 0
+    assert client.get('/analytics/roll-1').get_json() == before
+
+
+def test_migration_counts_existing_events(app, client, db):
+    _visit(client)
+    before = client.get('/analytics/roll-1').get_json()
+    db.executescript('''
+        DELETE FROM rollup_daily; DELETE FROM rollup_visits;
+        DELETE FROM rollup_fingerprints; DELETE FROM rollup_campaign_daily;
+        DELETE FROM schema_version;
+    ''')
+    db.commit()
+
+    with app.app_context():
+        migrate_db()
+
+    assert client.get('/analytics/roll-1').get_json() == before
+
+
+def test_deleting_a_track_removes_it_from_campaign_totals(client, db):
+    _visit(client)
+    client.get('/track?id=roll-3&c=spring', headers={'User-Agent': CHROME})
+    assert client.get('/api/campaign/spring').get_json()['total_opens'] == 4
+
+    assert client.delete('/api/track/roll-1').status_code == 200
+    campaign = client.get('/api/campaign/spring').get_json()
+    assert campaign['total_opens'] == 1 and campaign['total_clicks'] == 0
@@ -0,0 +1,40 @@
+import pytest
+
+from app.config import Config
+from app.services.stats import stats_cache_stats
+
+
+pytestmark = pytest.mark.usefixtures('open_api')
+
+
+def _opens(client):
+    return client.get('/api/stats').get_json()['summary']['total_opens']
+
+
+def _counters_since(before):
+    after = stats_cache_stats()
+    return {k: after[k] - before[k] for k in ('hits', 'version_checks', 'recomputes')}
+
+
+def test_stats_served_from_snapshot_within_budget(client, db, monkeypatch):
+    monkeypatch.setattr(Config, 'STATS_CACHE_SECONDS', 60)
+    before = stats_cache_stats()
+    client.get('/track?id=stats-1')
+    assert _opens(client) == 1
+
+    client.get('/track?id=stats-1')
+    assert _opens(client) == 1                     # within the budget: same snapshot
+    assert _counters_since(before) == {'hits': 1, 'version_checks': 1, 'recomputes': 1}
+
+
+def test_stats_recomputed_only_after_a_write(client, db, monkeypatch):
+    monkeypatch.setattr(Config, 'STATS_CACHE_SECONDS', 0.000001)
+    before = stats_cache_stats()
+    client.get('/track?id=stats-2')
+    assert _opens(client) == 1
+    assert _opens(client) == 1                     # budget expired, version unchanged
+    assert _counters_since(before)['recomputes'] == 1
+
+    client.get('/track?id=stats-2')
+    assert _opens(client) == 2
+    assert _counters_since(before) == {'hits': 0, 'version_checks': 3, 'recomputes': 2}
@@ -1,6 +1,8 @@
 import sqlite3
 import datetime
 
+from app.services.dims import DimBatch, GEO_FIELDS, UA_FIELDS, row_values
+
 def test_enhanced(db):
     """
     Test that the enhanced tracking record is created and correctly retrieved
@@ -61,28 +63,32 @@ def test_click(db):
     """
     cursor = db.cursor()
     now = datetime.datetime.now().isoformat()
+    ids = DimBatch(cursor, '?').resolve([{
+        'geo': row_values({'ip_address': "192.168.1.1", 'country': "US", 'city': "New York"}, GEO_FIELDS),
+        'ua':  row_values({'browser': "Chrome", 'device_type': "Desktop"}, UA_FIELDS),
+    }])[0]
     cursor.execute('''
         INSERT INTO clicks (
             timestamp, click_date, click_time, day_of_week, unix_ms,
-            track_id, link_id, target_url, ip_address, country, city, 
-            browser, device_type, sender, recipient, subject, sent_at
+            track_id, link_id, target_url, geo_id, ua_id,
+            sender, recipient, subject, sent_at
         ) VALUES (
-            ?, ?, ?, ?, ?, 
-            ?, ?, ?, ?, ?, ?, 
-            ?, ?, ?, ?, ?, ?
+            ?, ?, ?, ?, ?,
+            ?, ?, ?, ?, ?,
+            ?, ?, ?, ?
         )
     ''', (
         now, "2026-03-15", "11:00:00", "Sunday", 123456789000,
-        "test-enhanced", "link123", "https://example.com/target", "192.168.1.1", "US", "New York",
-        "Chrome", "Desktop", "sender@example.com", "recipient@example.com", "Welcome", "2026-03-15T09:00:00"
+        "test-enhanced", "link123", "https://example.com/target", ids['geo'], ids['ua'],
+        "sender@example.com", "recipient@example.com", "Welcome", "2026-03-15T09:00:00"
     ))
     db.commit()
 
-    # Original script query
+    # Original script query, against the wide view
     cursor.execute('''
         SELECT track_id, sender, recipient, subject, sent_at, 
                ip_address, country, city, target_url, browser, device_type 
-        FROM clicks 
+        FROM clicks_v 
         WHERE track_id = "test-enhanced" 
         ORDER BY timestamp DESC LIMIT 1
     ''')
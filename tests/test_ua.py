@@ -0,0 +1,33 @@
+from app.services.ua import parse_user_agent, parse_many, ua_cache_stats
+
+OUTLOOK = ('Mozilla/4.0 (compatible; ms-office; MSOffice 16) '
+           'Microsoft Outlook 16.0.17126; Pro)')
+APPLE_MAIL = ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) '
+              'AppleWebKit/605.1.15 (KHTML, like Gecko)')
+SAFARI = ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 '
+          '(KHTML, like Gecko) Version/17.1 Safari/605.1.15')
+GMAIL = ('Mozilla/5.0 (Windows NT 5.1; rv:11.0) Gecko Firefox/11.0 '
+         '(via ggpht.com GoogleImageProxy)')
+THUNDERBIRD = 'Mozilla/5.0 (X11; Linux x86_64; rv:115.0) Gecko/20100101 Thunderbird/115.6.0'
+
+
+def test_email_clients_recognised():
+    assert parse_user_agent(OUTLOOK)['browser'] == 'Outlook'
+    assert parse_user_agent(OUTLOOK)['browser_version'] == '16.0.17126'
+    mail = parse_user_agent(APPLE_MAIL)
+    assert (mail['browser'], mail['os'], mail['device_brand']) == ('Apple Mail', 'macOS', 'Apple')
+    assert parse_user_agent(SAFARI)['browser'] == 'Safari'
+    gmail = parse_user_agent(GMAIL)
+    assert (gmail['browser'], gmail['device_type'], gmail['is_bot']) == ('Gmail', 'Proxy', False)
+    assert parse_user_agent(THUNDERBIRD)['browser'] == 'Thunderbird'
+
+
+def test_memo_returns_independent_copies():
+    before = ua_cache_stats()
+    first = parse_user_agent(THUNDERBIRD + ' memo')
+    first['browser'] = 'mutated'
+    assert parse_user_agent(THUNDERBIRD + ' memo')['browser'] == 'Thunderbird'
+    after = ua_cache_stats()
+    assert after['hits'] - before['hits'] >= 1
+    assert [r['browser'] for r in parse_many([OUTLOOK, SAFARI, OUTLOOK, ''])] == \
+        ['Outlook', 'Safari', 'Outlook', 'Unknown']
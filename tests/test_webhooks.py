@@ -0,0 +1,61 @@
+import hashlib
+import hmac
+import json
+
+import pytest
+
+from app.config import Config
+from app.services import webhooks
+
+
+@pytest.fixture(autouse=True)
+def _webhook_config(monkeypatch):
+    monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 0)
+    monkeypatch.setattr(Config, 'WEBHOOK_SECRET', 's3cret')
+    monkeypatch.setattr(Config, 'WEBHOOK_BATCH_SIZE', 2)
+    monkeypatch.setattr(Config, 'WEBHOOK_MAX_INFLIGHT', 2)
+
+
+def test_outbox_retries_then_delivers_batches(app, client, db, monkeypatch):
+    """Events land in the outbox with the hit; failures back off, success deletes."""
+    client.get('/robots.txt')   # start background workers before enabling webhooks
+    monkeypatch.setattr(Config, 'WEBHOOK_URL', 'http://receiver.invalid/hook')
+    client.get('/track?id=hook-1')
+    client.get('/track?id=hook-1')
+    client.get('/click/hook-1/https%3A%2F%2Fexample.com')
+    assert db.execute("SELECT COUNT(*) FROM webhook_outbox").fetchone()[0] == 3
+
+    posted, fail = [], [True]
+
+    def fake_post(envelopes):
+        if fail[0]:
+            return 'connection refused'
+        posted.append(webhooks._build_body(envelopes))
+        return None
+
+    monkeypatch.setattr(webhooks, '_post', fake_post)
+    worker = webhooks._OutboxWorker(app)
+    with app.app_context():
+        worker.drain_once()
+        rows = db.execute("SELECT attempts, next_attempt_at, claim_token FROM webhook_outbox").fetchall()
+        assert [r['attempts'] for r in rows] == [1, 1, 1]
+        assert all(r['claim_token'] is None for r in rows)
+        assert worker.drain_once() is False      # nothing due until the backoff expires
+
+        fail[0] = False
+        db.execute("UPDATE webhook_outbox SET next_attempt_at = 0")
+        db.commit()
+        worker.drain_once()
+    worker.stop()
+
+    assert db.execute("SELECT COUNT(*) FROM webhook_outbox").fetchone()[0] == 0
+    bodies = [json.loads(b) for b in posted]
+    assert sorted(len(b['events']) for b in bodies) == [1, 2]
+    events = [e['event'] for b in bodies for e in b['events']]
+    assert sorted(events) == ['click', 'open', 'open']
+
+
+def test_signature_covers_body():
+    body = webhooks._build_body([{'event': 'open', 'data': {}}])
+    expected = hmac.new(b's3cret', body, hashlib.sha256).hexdigest()
+    assert webhooks.sign(body)['X-Webhook-Signature'] == f'sha256={expected}'